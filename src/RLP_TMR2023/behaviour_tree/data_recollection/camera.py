@@ -14,6 +14,7 @@ class CameraToBB(py_trees.behaviour.Behaviour):
         self._camera = camera_controller_factory(platform.machine())
 
     def update(self):
-        self._blackboard.current_frame = self._camera.get_current_frame()
+        # the frame is shared by reference, the colour planes computed by any behaviour are reused by the others
+        self._blackboard.current_frame = self._camera.get_latest_frame()
 
         return py_trees.common.Status.SUCCESS
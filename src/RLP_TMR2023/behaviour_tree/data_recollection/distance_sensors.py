@@ -11,10 +11,13 @@ class DistanceSensorsToBB(py_trees.behaviour.Behaviour):
         super().__init__(name="Distance Sensors To BB")
         self._blackboard = self.attach_blackboard_client(name=self.name)
         self._blackboard.register_key("is_robot_about_to_collide", access=py_trees.common.Access.WRITE)
+        self._blackboard.register_key("distance_reading", access=py_trees.common.Access.WRITE)
 
         self._distance_sensor = distance_sensors_controller_factory(platform.machine())
 
     def update(self):
+        # the sensors are polled on their own thread, here only the latest reading is used
         self._blackboard.is_robot_about_to_collide = self._distance_sensor.is_about_to_collide(all_sensors_strategy)
+        self._blackboard.distance_reading = self._distance_sensor.latest_reading()
 
         return py_trees.common.Status.SUCCESS
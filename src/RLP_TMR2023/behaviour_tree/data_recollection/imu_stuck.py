@@ -2,7 +2,7 @@ import platform
 
 import py_trees.common
 
-from RLP_TMR2023.hardware_controllers.imu_controller import imu_controller_factory, accelerometer_all_iqr_strategy
+from RLP_TMR2023.hardware_controllers.imu_controller import imu_controller_factory
 
 
 class IMUToBB(py_trees.behaviour.Behaviour):
@@ -10,10 +10,14 @@ class IMUToBB(py_trees.behaviour.Behaviour):
         super().__init__(name="IMU To BB")
         self._blackboard = self.attach_blackboard_client(name=self.name)
         self._blackboard.register_key("is_robot_stuck", access=py_trees.common.Access.WRITE)
+        self._blackboard.register_key("imu_stuck_verdict", access=py_trees.common.Access.WRITE)
 
         self._imu = imu_controller_factory(platform.machine())
 
     def update(self):
-        self._blackboard.is_robot_stuck = self._imu.is_robot_stuck(accelerometer_all_iqr_strategy)
+        # every strategy is evaluated once, the composed decision follows imu_values.STUCK_VOTING_POLICY
+        verdict = self._imu.evaluate_stuck()
+        self._blackboard.imu_stuck_verdict = verdict
+        self._blackboard.is_robot_stuck = verdict.is_stuck
 
         return py_trees.common.Status.SUCCESS
@@ -0,0 +1,201 @@
+"""
+This class owns the drivetrain while the robot executes a list of timed motor instructions. A single long-lived thread
+executes the commands one after another, so the behaviours only submit and cancel them and never wait for the motors.
+"""
+import enum
+import logging
+import platform
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Iterable
+
+from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory, MotorDirection
+from RLP_TMR2023.hardware_controllers.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class MotorMovement(enum.Enum):
+    FORWARD = enum.auto()
+    BACKWARD = enum.auto()
+    LEFT = enum.auto()
+    RIGHT = enum.auto()
+    STOP = enum.auto()
+
+
+@dataclass
+class MotorInstruction:
+    motor_movement: MotorMovement
+    speed: int
+    time: float
+
+
+MOTORS_DIRECTIONS = {
+    MotorMovement.FORWARD: (MotorDirection.FORWARD, MotorDirection.FORWARD),
+    MotorMovement.BACKWARD: (MotorDirection.BACKWARD, MotorDirection.BACKWARD),
+    MotorMovement.LEFT: (MotorDirection.BACKWARD, MotorDirection.FORWARD),
+    MotorMovement.RIGHT: (MotorDirection.FORWARD, MotorDirection.BACKWARD),
+}
+
+
+class MotionState(enum.Enum):
+    PENDING = enum.auto()
+    RUNNING = enum.auto()
+    SUCCEEDED = enum.auto()
+    CANCELLED = enum.auto()
+
+
+class MotionCommand:
+    """
+    A list of motor instructions submitted to the executor, the executor updates its state and progress
+    """
+
+    def __init__(self, instructions: Iterable[MotorInstruction]) -> None:
+        self.instructions = list(instructions)
+        self.total_time = sum(instruction.time for instruction in self.instructions)
+        self.state = MotionState.PENDING
+        self.instruction_index = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in (MotionState.SUCCEEDED, MotionState.CANCELLED)
+
+    @property
+    def progress(self) -> float:
+        """
+        Fraction of the total time of the command that has already been executed, between 0 and 1
+        """
+        if self.state == MotionState.SUCCEEDED:
+            return 1.0
+        if self.started_at is None or self.total_time <= 0:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return min((end - self.started_at) / self.total_time, 1.0)
+
+
+class MotionExecutor(metaclass=Singleton):
+    """
+    Executes the submitted commands in order on its own thread. Every instruction ends at a deadline measured from
+    the start of the command, so the time spent talking to the motors does not accumulate. A new command preempts the
+    running one unless it is explicitly queued, and cancelling a command stops the motors immediately.
+    """
+
+    def __init__(self) -> None:
+        self._motors = motors_controller_factory(platform.machine())
+        self._commands: deque[MotionCommand] = deque()
+        self._current: Optional[MotionCommand] = None
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+
+    @property
+    def current(self) -> Optional[MotionCommand]:
+        return self._current
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="motion-executor", daemon=True)
+        self._thread.start()
+        logger.info("Motion executor started")
+
+    def stop(self) -> None:
+        """
+        Cancels every command and waits for the thread to finish, the motors are left stopped
+        """
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stop = True
+            self._cancel_all()
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+        logger.info("Motion executor stopped")
+
+    def submit(self, instructions: Iterable[MotorInstruction], preempt: bool = True) -> MotionCommand:
+        """
+        Adds a command to the queue, the thread is started if it is not running
+        :param instructions: the instructions that will be executed in order
+        :param preempt: cancel the running and queued commands so this one starts right away
+        :return: the command, used to follow its progress or to cancel it
+        """
+        command = MotionCommand(instructions)
+        with self._condition:
+            if preempt:
+                self._cancel_all()
+            self._commands.append(command)
+            self._condition.notify_all()
+        self.start()
+        return command
+
+    def cancel(self, command: MotionCommand) -> None:
+        with self._condition:
+            if command.is_finished:
+                return
+            if command in self._commands:
+                self._commands.remove(command)
+            self._mark_cancelled(command)
+            self._condition.notify_all()
+
+    def _cancel_all(self) -> None:
+        for command in self._commands:
+            self._mark_cancelled(command)
+        self._commands.clear()
+        if self._current is not None:
+            self._mark_cancelled(self._current)
+
+    @staticmethod
+    def _mark_cancelled(command: MotionCommand) -> None:
+        if not command.is_finished:
+            command.state = MotionState.CANCELLED
+            command.finished_at = time.monotonic()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stop or len(self._commands) > 0)
+                if self._stop:
+                    break
+                command = self._commands.popleft()
+                self._current = command
+            self._execute(command)
+            with self._condition:
+                self._current = None
+        self._motors.stop()
+
+    def _execute(self, command: MotionCommand) -> None:
+        with self._condition:
+            if command.state != MotionState.PENDING:
+                return
+            command.state = MotionState.RUNNING
+            command.started_at = deadline = time.monotonic()
+        for index, instruction in enumerate(command.instructions):
+            command.instruction_index = index
+            if instruction.motor_movement == MotorMovement.STOP:
+                self._motors.stop()
+            else:
+                left_direction, right_direction = MOTORS_DIRECTIONS[instruction.motor_movement]
+                self._motors.move_both(instruction.speed, left_direction, instruction.speed, right_direction)
+
+            deadline += instruction.time
+            with self._condition:
+                self._condition.wait_for(lambda: command.state != MotionState.RUNNING,
+                                         timeout=max(deadline - time.monotonic(), 0))
+                if command.state != MotionState.RUNNING:
+                    break
+        self._motors.stop()
+        with self._condition:
+            if command.state == MotionState.RUNNING:
+                command.state = MotionState.SUCCEEDED
+                command.finished_at = time.monotonic()
+        logger.debug(f"Motion command finished as {command.state.name} after {command.progress:.0%}")
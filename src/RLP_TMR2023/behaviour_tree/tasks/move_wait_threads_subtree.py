@@ -1,91 +1,43 @@
-import enum
 import logging
-import platform
-import threading
 import time
-from dataclasses import dataclass
 from typing import Optional
 
 import py_trees.behaviour
 from py_trees import common
 
-from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory, MotorSide, MotorDirection, \
-    MotorsControllers
+from RLP_TMR2023.behaviour_tree.tasks.motion_executor import MotionExecutor, MotionCommand, MotionState, \
+    MotorInstruction, MotorMovement
 
 logger = logging.getLogger(__name__)
 
 
-class MotorMovement(enum.Enum):
-    FORWARD = enum.auto()
-    BACKWARD = enum.auto()
-    LEFT = enum.auto()
-    RIGHT = enum.auto()
-    STOP = enum.auto()
-
-
-@dataclass
-class MotorInstruction:
-    motor_movement: MotorMovement
-    speed: int
-    time: float
-
-
-def execute_motor_instructions(motors: MotorsControllers, motor_instructions: list[MotorInstruction]) -> None:
-    motors_directions = {
-        MotorMovement.FORWARD: [MotorDirection.FORWARD, MotorDirection.FORWARD],
-        MotorMovement.BACKWARD: [MotorDirection.BACKWARD, MotorDirection.BACKWARD],
-        MotorMovement.LEFT: [MotorDirection.BACKWARD, MotorDirection.FORWARD],
-        MotorMovement.RIGHT: [MotorDirection.FORWARD, MotorDirection.BACKWARD],
-        MotorMovement.STOP: [MotorDirection.FORWARD, MotorDirection.FORWARD],
-    }
-    for instruction in motor_instructions:
-        if instruction.motor_movement == MotorMovement.STOP:
-            motors.stop()
-            time.sleep(instruction.time)
-            continue
-        left_direction, right_direction = motors_directions[instruction.motor_movement]
-        motors.move(MotorSide.LEFT, instruction.speed, left_direction)
-        motors.move(MotorSide.RIGHT, instruction.speed, right_direction)
-        time.sleep(instruction.time)
-    motors.stop()
-
-
-class ExecuteMotorInstructionsClass:
-    def __init__(self, motor_instructions: list[MotorInstruction]) -> None:
-        self._motor_instructions = motor_instructions
-        self._motor_instructions_thread: Optional[threading.Thread] = None
-        self._motors = motors_controller_factory(platform.machine())
-
-    def update(self) -> None:
-        if self._motor_instructions_thread is not None:
-            if not self._motor_instructions_thread.is_alive():
-                self._motor_instructions_thread = None
-        else:
-            self._motor_instructions_thread = threading.Thread(target=execute_motor_instructions,
-                                                               args=(self._motors, self._motor_instructions),
-                                                               daemon=True)
-            self._motor_instructions_thread.start()
-
-
 class ExecuteMotorInstructions(py_trees.behaviour.Behaviour):
     def __init__(self, motor_instructions: list[MotorInstruction], name: str) -> None:
         super().__init__(name)
         self._motor_instructions = motor_instructions
-        self._motor_instructions_thread = None
-        self._motors = motors_controller_factory(platform.machine())
+        self._executor = MotionExecutor()
+        self._command: Optional[MotionCommand] = None
+
+    def initialise(self) -> None:
+        self._command = self._executor.submit(self._motor_instructions)
 
     def update(self) -> common.Status:
-        if self._motor_instructions_thread:
-            if not self._motor_instructions_thread.is_alive():  # type: ignore
-                self._motor_instructions_thread = None
-                return common.Status.SUCCESS
-        else:
-            self._motor_instructions_thread = threading.Thread(target=execute_motor_instructions,
-                                                               args=(self._motors, self._motor_instructions),
-                                                               daemon=True)  # type: ignore
-            self._motor_instructions_thread.start()  # type: ignore
+        if self._command is None:
+            return common.Status.FAILURE
+        if self._command.state == MotionState.SUCCEEDED:
+            return common.Status.SUCCESS
+        if self._command.state == MotionState.CANCELLED:
+            # another behaviour took over the drivetrain
+            return common.Status.FAILURE
+        self.feedback_message = f"{self._command.progress:.0%}"
         return common.Status.RUNNING
 
+    def terminate(self, new_status: common.Status) -> None:
+        # the guard of this behaviour flipped or a higher priority branch took over
+        if self._command is not None and not self._command.is_finished:
+            self._executor.cancel(self._command)
+        self._command = None
+
 
 def main():
     logging.basicConfig(level=logging.DEBUG)
@@ -95,12 +47,15 @@ def main():
         MotorInstruction(MotorMovement.STOP, 0, 1),
         MotorInstruction(MotorMovement.BACKWARD, 100, 1),
     ]
-    executor = ExecuteMotorInstructionsClass(motor_instructions)
+    executor = MotionExecutor()
+    command = executor.submit(motor_instructions)
     try:
-        while True:
-            executor.update()
+        while not command.is_finished:
+            print(f"Progress: {command.progress:.0%}")
+            time.sleep(0.25)
     except KeyboardInterrupt:
         pass
+    executor.stop()
 
 
 if __name__ == '__main__':
@@ -1,18 +1,22 @@
+import dataclasses
 import logging
 import platform
 import time
+from typing import Optional
 
 import py_trees.behaviour
 from py_trees import common
 
-from RLP_TMR2023.common_types.common_types import Centroid
+from RLP_TMR2023.common_types.common_types import Centroid, DetectionResult, Detection
+from RLP_TMR2023.behaviour_tree.tasks.timed_action_sequence import TimedActionSequence, TimedAction
+from RLP_TMR2023.constants import object_detection_values, bt_values
 from RLP_TMR2023.hardware_controllers.buzzer_controller import buzzer_controller_factory
 from RLP_TMR2023.hardware_controllers.camera_controller import camera_controller_factory
-from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory, MotorDirection, MotorSide
+from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory, MotorDirection
 from RLP_TMR2023.hardware_controllers.servos_controller import servos_controller_factory, ServoStatus, ServoPair
+from RLP_TMR2023.image_processing.can_tracker import TemplateTracker
 from RLP_TMR2023.image_processing.calculate_centroid import can_candidates, biggest_rect_strategy
-from RLP_TMR2023.image_processing.image_filtering import otsu_filtering
-from RLP_TMR2023.image_processing.tf_object_detection import get_detections
+from RLP_TMR2023.image_processing.image_filtering import otsu_threshold
 
 logger = logging.getLogger(__name__)
 
@@ -28,28 +32,101 @@ class TFDetection(py_trees.behaviour.Behaviour):
         self.camera = camera_controller_factory(platform.machine())
         self.buzzer = buzzer_controller_factory(platform.machine())
 
+        self._last_sequence = -1
+        self._last_status = py_trees.common.Status.FAILURE
+
+        # between detections the can is followed with a tracker, which is much cheaper than the detector
+        self._tracking_enabled = object_detection_values.TRACKER_ENABLED
+        self._tracker = TemplateTracker(object_detection_values.TRACKER_SEARCH_MARGIN,
+                                        object_detection_values.TRACKER_MIN_SCORE)
+        self._frames_tracked = 0
+        self._tracked_sequence = -1
+        self._detection: Optional[Detection] = None
+        self._centroid: Optional[Centroid] = None
+
     def update(self) -> common.Status:
         # make a sound
         # self.buzzer.play(Melody.CAN_FOUND)
 
-        detections = get_detections(self.blackboard.current_frame, self.camera.detector)
-        if not detections:
+        if self._tracker.is_tracking and self._frames_tracked < object_detection_values.TRACKER_DETECTION_INTERVAL:
+            return self._track()
+
+        # the detector runs on its own worker, here we only read the newest result it published
+        result = self.camera.get_latest_detections()
+        is_fresh = result is not None and \
+            time.monotonic() - result.timestamp <= object_detection_values.DETECTION_MAX_AGE_SECONDS
+        if result is not None and is_fresh and result.sequence != self._last_sequence:
+            self._last_sequence = result.sequence
+            self._last_status = self._process_detections(result)
+            return self._last_status
+        if self._tracker.is_tracking:
+            # keep following the can until the worker publishes the next detection
+            return self._track()
+        if not is_fresh:
+            return py_trees.common.Status.FAILURE
+        return self._last_status
+
+    def _track(self) -> common.Status:
+        # the frame CameraToBB pulled this tick, asking the camera again would read a second frame when there is no
+        # capture thread and CameraToBB would never see it
+        frame = self.blackboard.current_frame if self.blackboard.exists("current_frame") else None
+        if frame is None or self._detection is None or self._centroid is None:
+            return py_trees.common.Status.FAILURE
+        if frame.sequence == self._tracked_sequence:
+            # no new frame yet, the blackboard already has the latest position
+            return py_trees.common.Status.SUCCESS
+
+        previous_box = self._detection.bounding_box
+        bounding_box = self._tracker.update(frame.rgb)
+        if bounding_box is None:
+            logger.info("Lost track of the can")
+            self._stop_tracking()
+            self.camera.request_detection()
             return py_trees.common.Status.FAILURE
+
+        self._tracked_sequence = frame.sequence
+        self._frames_tracked += 1
+        self._detection = dataclasses.replace(self._detection, bounding_box=bounding_box)
+        self._centroid = Centroid(self._centroid.x + bounding_box.x - previous_box.x,
+                                  self._centroid.y + bounding_box.y - previous_box.y)
+        self.blackboard.detection = self._detection
+        self.blackboard.centroid = self._centroid
+        return py_trees.common.Status.SUCCESS
+
+    def _start_tracking(self, result: DetectionResult) -> None:
+        if not self._tracking_enabled or self._detection is None:
+            return
+        if self._tracker.start(result.frame.rgb, self._detection.bounding_box):
+            self._frames_tracked = 0
+            self._tracked_sequence = result.sequence
+            # the detector only has to anchor the tracker from now on
+            self.camera.set_detection_stride(object_detection_values.TRACKER_DETECTION_INTERVAL)
+
+    def _stop_tracking(self) -> None:
+        self._tracker.reset()
+        self._frames_tracked = 0
+        self.camera.set_detection_stride(1)
+
+    def _process_detections(self, result: DetectionResult) -> common.Status:
+        detections = result.detections
         cans_detections = [d for d in detections if d.category.find("can") != -1]
         if not cans_detections:
+            self._stop_tracking()
             return py_trees.common.Status.FAILURE
         biggest_can = max(cans_detections, key=lambda c: c.approx_size)
         logger.info(f"{biggest_can=}")
         self.blackboard.detection = biggest_can
-        x, y, w, h = biggest_can.bounding_box.x, biggest_can.bounding_box.y, \
-            biggest_can.bounding_box.width, biggest_can.bounding_box.height
-        image_cropped = self.blackboard.current_frame[x:x + w, y:y + h]
-        filtered = otsu_filtering(image_cropped)
+        # the crop is a view of the blurred plane of the frame the detection belongs to, not of the newest one
+        blurred_crop = result.frame.crop(biggest_can.bounding_box, result.frame.blurred)
+        filtered = otsu_threshold(blurred_crop)
         bbs_and_centroids = can_candidates(filtered, biggest_rect_strategy)
         centroid = Centroid(biggest_can.bounding_box.x + bbs_and_centroids[0][1][0],
                             biggest_can.bounding_box.y + bbs_and_centroids[0][1][1])
         self.blackboard.centroid = centroid
         logger.info(f"{centroid=}")
+        self._detection = biggest_can
+        self._centroid = centroid
+        self._start_tracking(result)
         return py_trees.common.Status.SUCCESS
 
 
@@ -74,11 +151,9 @@ class CenterCan(py_trees.behaviour.Behaviour):
             return py_trees.common.Status.SUCCESS
 
         if x_offset > 0:
-            self.motors.move(MotorSide.RIGHT, 30, MotorDirection.FORWARD)
-            self.motors.move(MotorSide.LEFT, 30, MotorDirection.BACKWARD)
+            self.motors.move_both(30, MotorDirection.BACKWARD, 30, MotorDirection.FORWARD)
         else:
-            self.motors.move(MotorSide.RIGHT, 30, MotorDirection.BACKWARD)
-            self.motors.move(MotorSide.LEFT, 30, MotorDirection.FORWARD)
+            self.motors.move_both(30, MotorDirection.FORWARD, 30, MotorDirection.BACKWARD)
         return py_trees.common.Status.FAILURE
 
 
@@ -104,46 +179,56 @@ class GetCloseToCan(py_trees.behaviour.Behaviour):
             return py_trees.common.Status.SUCCESS
 
         if y_offset > 0:
-            self.motors.move(MotorSide.RIGHT, 30, MotorDirection.FORWARD)
-            self.motors.move(MotorSide.LEFT, 30, MotorDirection.FORWARD)
+            self.motors.move_both(30, MotorDirection.FORWARD, 30, MotorDirection.FORWARD)
         else:
-            self.motors.move(MotorSide.RIGHT, 30, MotorDirection.BACKWARD)
-            self.motors.move(MotorSide.LEFT, 30, MotorDirection.BACKWARD)
+            self.motors.move_both(30, MotorDirection.BACKWARD, 30, MotorDirection.BACKWARD)
         return py_trees.common.Status.FAILURE
 
 
-class PickCan(py_trees.behaviour.Behaviour):
+class PickCan(TimedActionSequence):
     def __init__(self) -> None:
-        super().__init__("Picking can")
         self.servos = servos_controller_factory(platform.machine())
         self.motors = motors_controller_factory(platform.machine())
-
-    def update(self) -> common.Status:
-        self.servos.move(ServoPair.ARM, ServoStatus.EXPANDED)
-        self.servos.move(ServoPair.CLAW, ServoStatus.EXPANDED)
-
-        self.motors.move(MotorSide.LEFT, 70, MotorDirection.FORWARD)
-        self.motors.move(MotorSide.RIGHT, 70, MotorDirection.FORWARD)
-        time.sleep(1)
+        super().__init__("Picking can", [
+            TimedAction("Open and approach", self._open_and_approach, bt_values.PICK_APPROACH_TIME_SECONDS),
+            TimedAction("Grab", self._grab, bt_values.PICK_GRAB_TIME_SECONDS),
+            TimedAction("Lift", self._lift, bt_values.PICK_LIFT_TIME_SECONDS),
+        ], on_interrupt=self.motors.stop)
+
+    def _open_and_approach(self) -> None:
+        self.servos.queue_move(ServoPair.ARM, ServoStatus.EXPANDED)
+        self.servos.queue_move(ServoPair.CLAW, ServoStatus.EXPANDED)
+        self.motors.move_both(bt_values.PICK_APPROACH_SPEED, MotorDirection.FORWARD,
+                              bt_values.PICK_APPROACH_SPEED, MotorDirection.FORWARD)
+
+    def _grab(self) -> None:
         self.motors.stop()
+        self.servos.queue_move(ServoPair.CLAW, ServoStatus.RETRACTED)
 
-        self.servos.move(ServoPair.CLAW, ServoStatus.RETRACTED)
-        self.servos.move(ServoPair.ARM, ServoStatus.RETRACTED)
+    def _lift(self) -> None:
+        self.servos.queue_move(ServoPair.ARM, ServoStatus.RETRACTED)
 
-        return py_trees.common.Status.SUCCESS
-
-
-def create_look_for_can_subtree() -> py_trees.behaviour.Behaviour:
-    root = py_trees.composites.Sequence("Look for can", memory=False)
 
-    find_can = py_trees.composites.Selector("Find Can", memory=False)
-    # add calc offset
-    recollect_can = py_trees.composites.Sequence("Recollect can", memory=False)
+def create_recollect_can_subtree() -> py_trees.behaviour.Behaviour:
+    # with memory a RUNNING PickCan is resumed directly, CenterCan and GetCloseToCan would otherwise stop the motors
+    # (or fail and interrupt it) on every tick while it approaches the can
+    recollect_can = py_trees.composites.Sequence("Recollect can", memory=True)
     recollect_can.add_children([
         CenterCan(),
         GetCloseToCan(),
         PickCan()
     ])
+    return recollect_can
+
+
+def create_look_for_can_subtree() -> py_trees.behaviour.Behaviour:
+    # with memory the detection is not required while the can is picked, it usually leaves the frame when the robot
+    # gets close. The higher priority subtrees above this one still preempt it.
+    root = py_trees.composites.Sequence("Look for can", memory=True)
+
+    find_can = py_trees.composites.Selector("Find Can", memory=False)
+    # add calc offset
+    recollect_can = create_recollect_can_subtree()
 
     root.add_children([find_can, recollect_can])
 
@@ -3,10 +3,10 @@ import time
 
 import py_trees.common
 
-from RLP_TMR2023.behaviour_tree.tasks.move_wait_threads_subtree import MotorMovement, \
-    MotorInstruction, ExecuteMotorInstructions
+from RLP_TMR2023.behaviour_tree.tasks.motion_executor import MotorMovement, MotorInstruction
+from RLP_TMR2023.behaviour_tree.tasks.move_wait_threads_subtree import ExecuteMotorInstructions
 from RLP_TMR2023.constants import bt_values
-from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory, MotorSide, MotorDirection
+from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory, MotorDirection
 
 
 class StuckRecovery(py_trees.behaviour.Behaviour):
@@ -20,8 +20,8 @@ class StuckRecovery(py_trees.behaviour.Behaviour):
             self._initial_time = time.perf_counter()
 
         if time.perf_counter() - self._initial_time < bt_values.STUCK_BACK_OFF_TIME_SECONDS:
-            self._motors.move(MotorSide.LEFT, bt_values.STUCK_BACK_OFF_SPEED, MotorDirection.BACKWARD)
-            self._motors.move(MotorSide.RIGHT, bt_values.STUCK_BACK_OFF_TIME_SECONDS, MotorDirection.BACKWARD)
+            self._motors.move_both(bt_values.STUCK_BACK_OFF_SPEED, MotorDirection.BACKWARD,
+                                   bt_values.STUCK_BACK_OFF_SPEED, MotorDirection.BACKWARD)
             return py_trees.common.Status.RUNNING
         else:
             return py_trees.common.Status.SUCCESS
@@ -0,0 +1,57 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+import py_trees.behaviour
+from py_trees import common
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TimedAction:
+    name: str
+    action: Callable[[], None]
+    duration: float  # time to wait after the action before the next stage starts
+
+
+class TimedActionSequence(py_trees.behaviour.Behaviour):
+    """
+    Runs a list of actions one stage at a time. The action of a stage is called once when the stage starts and the
+    behaviour returns RUNNING until its deadline, so the rest of the tree keeps ticking and can preempt the sequence.
+    Stages whose deadline already passed are completed in the same tick.
+    """
+
+    def __init__(self, name: str, actions: Sequence[TimedAction],
+                 on_interrupt: Optional[Callable[[], None]] = None) -> None:
+        super().__init__(name)
+        self._actions = list(actions)
+        self._on_interrupt = on_interrupt
+        self._stage = 0
+        self._deadline: Optional[float] = None
+
+    def initialise(self) -> None:
+        self._stage = 0
+        self._deadline = None
+
+    def update(self) -> common.Status:
+        while self._stage < len(self._actions):
+            timed_action = self._actions[self._stage]
+            now = time.monotonic()
+            if self._deadline is None:
+                logger.debug(f"{self.name}: starting stage {timed_action.name}")
+                timed_action.action()
+                self._deadline = now + timed_action.duration
+            if now < self._deadline:
+                self.feedback_message = timed_action.name
+                return common.Status.RUNNING
+            self._stage += 1
+            self._deadline = None
+        return common.Status.SUCCESS
+
+    def terminate(self, new_status: common.Status) -> None:
+        # a higher priority branch took over in the middle of the sequence
+        if new_status == common.Status.INVALID and self._deadline is not None and self._on_interrupt is not None:
+            self._on_interrupt()
+        self._deadline = None
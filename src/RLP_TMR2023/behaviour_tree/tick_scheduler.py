@@ -0,0 +1,105 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import py_trees
+
+from RLP_TMR2023.constants import bt_values
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TickStatistics:
+    ticks: int
+    overruns: int
+    skipped_periods: int
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+
+class TickScheduler:
+    """
+    Ticks a behaviour tree at a fixed frequency. Deadlines are absolute (start + n * period) so the sleep error does
+    not accumulate, and a tick that misses its deadline is counted as an overrun instead of being made up with a
+    burst of ticks.
+    """
+
+    def __init__(self, behaviour_tree: py_trees.trees.BehaviourTree,
+                 frequency: float = bt_values.TICK_FREQUENCY_HZ,
+                 latency_samples: int = bt_values.TICK_LATENCY_SAMPLES) -> None:
+        self._behaviour_tree = behaviour_tree
+        self._period = 1 / frequency if frequency > 0 else 0.0
+        self._latencies = np.zeros(latency_samples, dtype=np.float64)
+
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped_periods = 0
+
+    @property
+    def period(self) -> float:
+        return self._period
+
+    @property
+    def last_latency(self) -> float:
+        if self.ticks == 0:
+            return 0.0
+        return float(self._latencies[(self.ticks - 1) % len(self._latencies)])
+
+    def tick(self) -> float:
+        """
+        Ticks the tree once and records how long it took
+        :return: the tick latency in seconds
+        """
+        start = time.perf_counter()
+        self._behaviour_tree.tick()
+        latency = time.perf_counter() - start
+        self._latencies[self.ticks % len(self._latencies)] = latency
+        self.ticks += 1
+        return latency
+
+    def run(self, max_ticks: Optional[int] = None, should_stop: Callable[[], bool] = lambda: False,
+            post_tick: Optional[Callable[[], object]] = None) -> None:
+        """
+        Ticks the tree until should_stop returns True or max_ticks ticks have been done
+        :param max_ticks: maximum number of ticks, None ticks forever
+        :param should_stop: checked before every tick
+        :param post_tick: called after every tick, its time counts as part of the tick period
+        """
+        next_deadline = time.monotonic()
+        while not should_stop() and (max_ticks is None or self.ticks < max_ticks):
+            self.tick()
+            if post_tick is not None:
+                post_tick()
+            if self._period == 0:
+                continue
+
+            next_deadline += self._period
+            now = time.monotonic()
+            if now < next_deadline:
+                time.sleep(next_deadline - now)
+                continue
+            self.overruns += 1
+            # keep the original phase and drop the periods that were missed
+            missed = int((now - next_deadline) // self._period)
+            self.skipped_periods += missed
+            next_deadline += missed * self._period
+
+    def statistics(self) -> TickStatistics:
+        latencies = self._latencies[:min(self.ticks, len(self._latencies))]
+        if len(latencies) == 0:
+            return TickStatistics(ticks=0, overruns=0, skipped_periods=0, p50=0.0, p95=0.0, p99=0.0, max=0.0)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return TickStatistics(ticks=self.ticks, overruns=self.overruns, skipped_periods=self.skipped_periods,
+                              p50=float(p50), p95=float(p95), p99=float(p99), max=float(np.max(latencies)))
+
+    def report(self) -> str:
+        stats = self.statistics()
+        target = f"{1 / self._period:.1f} Hz" if self._period else "unbounded"
+        return (f"{stats.ticks} ticks (target {target}), {stats.overruns} overruns, "
+                f"{stats.skipped_periods} skipped periods, latency p50 {stats.p50 * 1000:.2f} ms, "
+                f"p95 {stats.p95 * 1000:.2f} ms, p99 {stats.p99 * 1000:.2f} ms, max {stats.max * 1000:.2f} ms")
@@ -0,0 +1,114 @@
+import bisect
+import json
+import logging
+import time
+from typing import Any, Callable
+
+import numpy as np
+import py_trees
+
+logger = logging.getLogger(__name__)
+
+# 8 buckets per decade from 1 us to 10 s, the first and last buckets catch everything outside that range
+_BUCKET_EDGES: list[float] = np.logspace(-6, 1, 57).tolist()
+
+
+class LatencyHistogram:
+    """
+    Fixed bucket histogram of latencies, it keeps the exact count, sum and max and approximates the percentiles with
+    the upper edge of the bucket they fall in
+    """
+
+    def __init__(self) -> None:
+        self.counts = np.zeros(len(_BUCKET_EDGES) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(_BUCKET_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.count))
+        if bucket >= len(_BUCKET_EDGES):
+            return self.max
+        return min(_BUCKET_EDGES[bucket], self.max)
+
+
+class TimingVisitor(py_trees.visitors.VisitorBase):
+    """
+    Records the wall clock time of the update() of every behaviour of a tree. The update methods are wrapped when
+    the visitor is created, so it must be created after the tree is complete. Composites are skipped because
+    py_trees never calls their update().
+    """
+
+    def __init__(self, root: py_trees.behaviour.Behaviour) -> None:
+        super().__init__(full=False)
+        self.ticks = 0
+        self._names: dict[str, str] = {}
+        self._histograms: dict[str, LatencyHistogram] = {}
+        for behaviour in root.iterate():
+            if isinstance(behaviour, py_trees.composites.Composite):
+                continue
+            key = str(behaviour.id)
+            self._names[key] = behaviour.name
+            self._histograms[key] = LatencyHistogram()
+            behaviour.update = self._timed(behaviour.update, self._histograms[key])  # type: ignore
+
+    @staticmethod
+    def _timed(update: Callable[[], py_trees.common.Status],
+               histogram: LatencyHistogram) -> Callable[[], py_trees.common.Status]:
+        def timed_update() -> py_trees.common.Status:
+            start = time.perf_counter()
+            try:
+                return update()
+            finally:
+                histogram.add(time.perf_counter() - start)
+
+        return timed_update
+
+    def finalise(self) -> None:
+        self.ticks += 1
+
+    def summary(self) -> list[dict[str, Any]]:
+        """
+        Per behaviour statistics sorted by total time, times are in seconds
+        """
+        rows = [
+            {
+                "name": self._names[key],
+                "id": key,
+                "count": histogram.count,
+                "total": histogram.total,
+                "mean": histogram.mean,
+                "p95": histogram.percentile(95),
+                "max": histogram.max,
+                "buckets": histogram.counts.tolist(),
+            }
+            for key, histogram in self._histograms.items()
+        ]
+        return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+    def table(self) -> str:
+        lines = [f"Behaviour timings over {self.ticks} ticks",
+                 f"{'behaviour':<40} {'count':>8} {'mean ms':>10} {'p95 ms':>10} {'max ms':>10}"]
+        for row in self.summary():
+            lines.append(f"{row['name'][:40]:<40} {row['count']:>8} {row['mean'] * 1000:>10.3f} "
+                         f"{row['p95'] * 1000:>10.3f} {row['max'] * 1000:>10.3f}")
+        return "\n".join(lines)
+
+    def dump(self, file_name: str) -> None:
+        with open(file_name, "w") as file:
+            json.dump({"ticks": self.ticks, "bucket_edges": _BUCKET_EDGES, "behaviours": self.summary()}, file,
+                      indent=2)
+        logger.info(f"Behaviour timings saved to {file_name}")
@@ -1,4 +1,8 @@
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from RLP_TMR2023.image_processing.frame import Frame
 
 
 @dataclass
@@ -26,3 +30,30 @@ class Detection:
 class Centroid:
     x: int
     y: int
+
+
+@dataclass
+class DetectionResult:
+    """
+    Detections found by the model in a captured frame, the frame is kept so the result can be post processed
+    """
+    detections: list[Detection]
+    frame: "Frame"
+    inference_time: float
+
+    @property
+    def timestamp(self) -> float:
+        return self.frame.timestamp
+
+    @property
+    def sequence(self) -> int:
+        return self.frame.sequence
+
+
+@dataclass
+class DistanceReading:
+    """
+    Distances measured by the ultrasonic sensors and the moment they were read
+    """
+    distances: tuple[int, int, int]
+    timestamp: float
@@ -18,3 +18,13 @@ STUCK_ADVANCE_TIME_SECONDS = 1
 STUCK_ADVANCE_SPEED = 50
 STUCK_SPIN_TIME_SECONDS = 3  # unused
 STUCK_SPIN_SPEED = 50  # unused
+
+# Pick can sequence, every stage waits its time before the next one starts
+PICK_APPROACH_TIME_SECONDS = 1
+PICK_APPROACH_SPEED = 70
+PICK_GRAB_TIME_SECONDS = 1  # the claw closes after the arm and claw moves queued by the approach stage
+PICK_LIFT_TIME_SECONDS = 1
+
+# Tick scheduler
+TICK_FREQUENCY_HZ = 30  # 0 ticks as fast as possible
+TICK_LATENCY_SAMPLES = 10000  # number of recent ticks used for the latency percentiles
@@ -0,0 +1,5 @@
+# In this file are the constants for the buzzer
+
+BUZZER_PIN = 20
+INITIAL_FREQUENCY = 2000  # Hz, used by the notes that do not set their own frequency
+PLAYBACK_QUEUE_SIZE = 4  # melodies waiting to be played, the lowest priority one is dropped when it is full
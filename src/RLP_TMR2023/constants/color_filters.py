@@ -3,3 +3,10 @@ RED_UPPER_HSV = [179, 255, 255]
 
 BLUE_LOWER_HSV = [69, 37, 0]
 BLUE_UPPER_HSV = [134, 255, 255]
+
+# every colour in this dict is segmented in the same pass by ColorSegmenter
+COLOR_RANGES = {
+    "red": (RED_LOWER_HSV, RED_UPPER_HSV),
+    "blue": (BLUE_LOWER_HSV, BLUE_UPPER_HSV),
+}
+FILTER_KERNEL_SIZE = 5
@@ -0,0 +1,8 @@
+# Number of samples of the window used to decide if the robot is stuck
+NUM_SAMPLES = 25
+# Rate at which the background thread polls the MPU9250
+SAMPLE_RATE_HZ = 100
+# Strategies whose verdict counts for the composed "stuck" decision and how their votes are combined
+# (ANY, ALL or MAJORITY), every other strategy is still evaluated and reported
+STUCK_VOTERS = ("accelerometer_all_iqr",)
+STUCK_VOTING_POLICY = "ALL"
@@ -8,3 +8,26 @@ NUMBER_THREADS = 4
 ENABLE_EDGETPU = False
 SCORE_THRESHOLD = 0.5
 MAX_RESULTS = 3
+THREADED_CAPTURE = True
+CAPTURE_BUFFER_SIZE = 3
+ASYNC_DETECTION = True
+DETECTION_MAX_AGE_SECONDS = 1.0
+PREVIEW_MAX_FPS = 10
+REPLAY_DEFAULT_FPS = 30
+REPLAY_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+DEFERRED_MODEL_LOADING = True  # build the detector on a background thread so the tree starts ticking right away
+WARMUP_INFERENCES = 2  # inferences run on a blank frame after building the detector
+DETECTION_CACHE_SIZE = 4  # detection results of the most recent frames kept for every behaviour to share
+DETECTION_WAIT_SECONDS = 0.5  # longest a behaviour waits for the detection worker to detect the frame it asked for
+DETECTION_PROCESSES = 0  # processes with their own detector, 0 runs the detection on a thread of the main process
+ADAPTIVE_DETECTION = True  # lower the detection resolution and rate when the ticks or the inferences are too slow
+DETECTION_SCALES = (1.0, 0.75, 0.5)  # fractions of the camera resolution tried when the inferences are too slow
+DETECTION_MAX_STRIDE = 4  # at most one frame every this many frames is detected when the ticks are too slow
+DETECTION_BUDGET_TICKS = 3  # tick periods an inference may take before the detector is considered congested
+ADAPT_TICK_WINDOW = 60  # tick latencies measured before every decision
+ADAPT_INFERENCE_WINDOW = 10  # inference latencies measured before every decision
+ADAPT_RELAX_FRACTION = 0.5  # fraction of the budgets under which the settings are raised again
+TRACKER_ENABLED = True  # follow the can with template matching between detections
+TRACKER_DETECTION_INTERVAL = 5  # frames tracked before the detector is run again
+TRACKER_SEARCH_MARGIN = 0.5  # fraction of the box size searched around the last position
+TRACKER_MIN_SCORE = 0.6  # normalized correlation under which the can is considered lost
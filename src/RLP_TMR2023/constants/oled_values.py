@@ -0,0 +1,5 @@
+# In this file are the constants for the OLED display
+
+OLED_WIDTH = 128
+OLED_HEIGHT = 32
+OLED_MAX_FPS = 10  # the display is redrawn at most this many times per second, updates in between are coalesced
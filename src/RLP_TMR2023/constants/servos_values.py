@@ -12,3 +12,4 @@ TRAY_EXPANDED_DEGREES = 45
 TRAY_RETRACTED_DEGREES = 3
 
 PCA9685_FREQUENCY = 50
+MOVE_TIMEOUT_SECONDS = 2  # move() gives up waiting for the worker after this time
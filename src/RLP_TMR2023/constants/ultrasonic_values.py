@@ -2,3 +2,12 @@ MAX_DISTANCE = 35
 MIN_DISTANCE = 1
 I2C_ADDR = 8
 I2C_BUS = 1
+# Background poller
+POLL_RATE_HZ = 50
+# the sensors send frames of a 255 separator followed by the 3 distances, a block of 2 frames minus one byte always
+# contains a whole frame wherever it starts
+FRAME_SEPARATOR = 255
+BLOCK_READ_LENGTH = 7
+READ_RETRIES = 3
+READ_TIMEOUT_SECONDS = 0.05
+STALE_READING_SECONDS = 0.5  # older readings (or none for this long) are treated as about to collide
@@ -0,0 +1,4 @@
+# fraction of the image height where each horizon band starts, the band goes down to the bottom of the image
+WATER_HORIZON_BANDS = (0.8,)
+# only one of every WATER_DECIMATION rows and columns is used to estimate the water coverage
+WATER_DECIMATION = 2
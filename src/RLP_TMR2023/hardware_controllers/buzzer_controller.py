@@ -5,13 +5,14 @@ import threading
 import time
 from abc import abstractmethod
 from dataclasses import dataclass
-from typing import Type, Mapping, Optional
+from typing import Type, Mapping, Optional, Sequence
 
 try:
     import RPi.GPIO as GPIO
 except ImportError:
     logging.getLogger(__name__).warning("RPi.GPIO not found, using mock buzzer controller")
 
+from RLP_TMR2023.constants import buzzer_values
 from RLP_TMR2023.hardware_controllers.singleton import Singleton
 
 logger = logging.getLogger(__name__)
@@ -40,7 +41,43 @@ class Melody(enum.Enum):
     HIGHAF = enum.auto()
 
 
+# A melody with a higher priority interrupts the one that is playing
+MELODY_PRIORITIES: dict[Melody, int] = {
+    Melody.ABOUT_TO_COLLIDE: 3,
+    Melody.STEPROBOT_IS_STUCK: 2,
+    Melody.CAN_FOUND: 1,
+    Melody.MIAUMIAUMIAU: 0,
+    Melody.AXOLOTE_EATING: 0,
+    Melody.KNOCK_THE_DOOR: 0,
+    Melody.HIGHAF: 0,
+}
+
+# (duty cycle, frequency, end of the note in seconds from the start of the melody)
+CompiledMelody = tuple[tuple[int, int, float], ...]
+
+
+def compile_melody(notes: Sequence[Note], initial_frequency: int) -> CompiledMelody:
+    """
+    Flattens the notes of a melody so the playback loop only unpacks tuples
+    :param notes: the notes of the melody
+    :param initial_frequency: the frequency of the notes that do not set their own
+    :return: the compiled melody
+    """
+    compiled = []
+    end = 0.0
+    for note in notes:
+        end += note.duration
+        frequency = note.set_frequency if note.set_frequency is not None else initial_frequency
+        compiled.append((note.frequency, frequency, end))
+    return tuple(compiled)
+
+
 class BuzzerController(metaclass=Singleton):
+    """
+    Plays the melodies on a single worker thread. The queue is ordered by priority, a melody that is already playing
+    or queued is dropped and a melody with a higher priority than the one playing interrupts it.
+    """
+
     def __init__(self) -> None:
         super().__init__()
         self._melodies: dict[Melody, list[Note]] = {
@@ -121,27 +158,95 @@ class BuzzerController(metaclass=Singleton):
                 Note(80, 2)
             ]
         }
+        self._compiled_melodies: dict[Melody, CompiledMelody] = {
+            melody: compile_melody(notes, buzzer_values.INITIAL_FREQUENCY)
+            for melody, notes in self._melodies.items()
+        }
+
+        self._condition = threading.Condition()
+        self._queue: list[Melody] = []
+        self._playing: Optional[Melody] = None
+        self._preempted = False
+        self._stop_worker = False
+        self._worker: Optional[threading.Thread] = None
+        self.dropped_requests = 0
 
     @abstractmethod
     def setup(self) -> None:
         pass
 
-    # TODO: remember to make this method async or multiprocessing (SUPER IMPORTANT) as it will be called from the
-    #  main thread and it does not need to be blocking
     @abstractmethod
-    def _background_play(self, melody: Melody) -> None:
+    def _set_tone(self, duty_cycle: int, frequency: int) -> None:
+        pass
+
+    @abstractmethod
+    def _silence(self) -> None:
         pass
 
+    @property
+    def playing(self) -> Optional[Melody]:
+        return self._playing
+
     def play(self, melody: Melody) -> None:
         """
-        This method plays a tone with the given frequency and duration, calls the _background_play method as it is a
-        blocking method
+        Queues a melody and returns right away, the worker thread is started on the first call
         :param melody: the melody to play
         """
-        threading.Thread(
-            target=self._background_play,
-            args=(melody,),
-            daemon=True).start()
+        priority = MELODY_PRIORITIES[melody]
+        with self._condition:
+            if melody == self._playing or melody in self._queue:
+                self.dropped_requests += 1
+                return
+            if self._playing is not None and priority > MELODY_PRIORITIES[self._playing]:
+                self._preempted = True
+            # keep the queue sorted by priority, melodies with the same priority are played in order
+            index = len(self._queue)
+            while index > 0 and MELODY_PRIORITIES[self._queue[index - 1]] < priority:
+                index -= 1
+            self._queue.insert(index, melody)
+            if len(self._queue) > buzzer_values.PLAYBACK_QUEUE_SIZE:
+                dropped = self._queue.pop()
+                self.dropped_requests += 1
+                logger.debug(f"Buzzer queue full, dropping {dropped.name}")
+            self._condition.notify_all()
+
+            if self._worker is None or not self._worker.is_alive():
+                self._stop_worker = False
+                self._worker = threading.Thread(target=self._run, name="buzzer-worker", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stop_worker or len(self._queue) > 0)
+                if self._stop_worker:
+                    break
+                self._playing = self._queue.pop(0)
+                self._preempted = False
+                compiled_melody = self._compiled_melodies[self._playing]
+            self._play_compiled(compiled_melody)
+            with self._condition:
+                self._playing = None
+
+    def _play_compiled(self, compiled_melody: CompiledMelody) -> None:
+        start = time.monotonic()
+        for duty_cycle, frequency, end in compiled_melody:
+            self._set_tone(duty_cycle, frequency)
+            with self._condition:
+                interrupted = self._condition.wait_for(lambda: self._preempted or self._stop_worker,
+                                                       timeout=max(start + end - time.monotonic(), 0))
+            if interrupted:
+                break
+        self._silence()
+
+    def _join_worker(self) -> None:
+        with self._condition:
+            self._stop_worker = True
+            self._queue.clear()
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
 
     @abstractmethod
     def disable(self) -> None:
@@ -160,43 +265,40 @@ class BuzzerControllerMock(BuzzerController):
     def setup(self) -> None:
         logger.info("BuzzerControllerMock.setup() called")
 
-    def _background_play(self, melody: Melody) -> None:
-        logger.info(f"Playing melody {melody.name}")
-        for note in self._melodies[melody]:
-            logger.info(f"Playing a tone with frequency {note.frequency} and duration {note.duration}")
-            time.sleep(note.duration)
-        logger.info("Done playing the melody")
+    def _set_tone(self, duty_cycle: int, frequency: int) -> None:
+        logger.debug(f"Playing a tone with duty cycle {duty_cycle} and frequency {frequency}")
+
+    def _silence(self) -> None:
+        logger.debug("Done playing the melody")
 
     def disable(self) -> None:
+        self._join_worker()
         logger.info("Disabling buzzer")
 
 
 class BuzzerControllerRaspberry(BuzzerController):
     def setup(self) -> None:
-        self._buzzer_pin = 20
+        self._buzzer_pin = buzzer_values.BUZZER_PIN
         if not GPIO.getmode():
             GPIO.setmode(GPIO.BCM)
         GPIO.setup(self._buzzer_pin, GPIO.OUT)
 
-        self._initial_frequency = 2000
-        self._current_frequency = self._initial_frequency
+        self._current_frequency = buzzer_values.INITIAL_FREQUENCY
 
-        self._buzzer = GPIO.PWM(self._buzzer_pin, self._initial_frequency)
+        self._buzzer = GPIO.PWM(self._buzzer_pin, self._current_frequency)
         self._buzzer.start(0)
 
-    def _background_play(self, melody: Melody) -> None:
-        for note in self._melodies[melody]:
-            if note.set_frequency is not None:
-                self._current_frequency = note.set_frequency
-                self._buzzer.ChangeFrequency(self._current_frequency)
-            elif self._current_frequency != self._initial_frequency:
-                self._current_frequency = self._initial_frequency
-                self._buzzer.ChangeFrequency(self._current_frequency)
-            self._buzzer.ChangeDutyCycle(note.frequency)
-            time.sleep(note.duration)
+    def _set_tone(self, duty_cycle: int, frequency: int) -> None:
+        if frequency != self._current_frequency:
+            self._current_frequency = frequency
+            self._buzzer.ChangeFrequency(frequency)
+        self._buzzer.ChangeDutyCycle(duty_cycle)
+
+    def _silence(self) -> None:
         self._buzzer.ChangeDutyCycle(0)
 
     def disable(self) -> None:
+        self._join_worker()
         self._buzzer.stop()
         GPIO.cleanup()
 
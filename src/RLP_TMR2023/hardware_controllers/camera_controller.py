@@ -1,25 +1,32 @@
 import logging
+import os
 import platform
+import threading
+import time
 from abc import abstractmethod
+from functools import partial
 from importlib.resources import path
-from typing import Optional, Mapping, Type
+from typing import Optional, Mapping, Type, TYPE_CHECKING, Union
 
 import cv2
 import numpy as np
 import numpy.typing as npt
 
-try:
-    from picamera2 import Picamera2
-except ImportError:
-    Picamera2 = None
-from tflite_support.task import core
-from tflite_support.task import processor
-from tflite_support.task import vision
-
 from RLP_TMR2023 import tf_models
-from RLP_TMR2023.constants import object_detection_values
+from RLP_TMR2023.common_types.common_types import Detection, DetectionResult
+from RLP_TMR2023.constants import object_detection_values, bt_values
+from RLP_TMR2023.hardware_controllers.detection_cache import DetectionCache
+from RLP_TMR2023.hardware_controllers.detection_policy import AdaptiveDetectionPolicy
+from RLP_TMR2023.hardware_controllers.detection_pool import DetectionPool
+from RLP_TMR2023.hardware_controllers.detection_worker import DetectionWorker
+from RLP_TMR2023.hardware_controllers.frame_preview import FramePreview
+from RLP_TMR2023.hardware_controllers.frame_ring_buffer import FrameRingBuffer
 from RLP_TMR2023.hardware_controllers.singleton import Singleton
-from RLP_TMR2023.image_processing.tf_object_detection import get_detections
+from RLP_TMR2023.image_processing.frame import Frame
+from RLP_TMR2023.image_processing.tf_object_detection import get_detections, build_warmed_up_detector
+
+if TYPE_CHECKING:
+    from tflite_support.task import vision
 
 logger = logging.getLogger(__name__)
 
@@ -37,26 +44,309 @@ class CameraController(metaclass=Singleton):
         self._number_threads = object_detection_values.NUMBER_THREADS
         self._enable_edgetpu = object_detection_values.ENABLE_EDGETPU
 
-        self.detector: Optional[vision.ObjectDetector] = None
+        self.detector: Optional["vision.ObjectDetector"] = None
+        # set when the detector could not be built, there will be no detections until setup() is called again
+        self._detector_failed = False
+        # set from setup() until the detector is built or fails, frames detected meanwhile have no detections
+        self._detector_loading = False
+        self._deferred_model_loading = object_detection_values.DEFERRED_MODEL_LOADING
+        self._detector_thread: Optional[threading.Thread] = None
+
+        self._threaded_capture = object_detection_values.THREADED_CAPTURE
+        self._frame_buffer = FrameRingBuffer(object_detection_values.CAPTURE_BUFFER_SIZE)
+        self._capture_thread: Optional[threading.Thread] = None
+        self._stop_capture = threading.Event()
+
+        self._async_detection = object_detection_values.ASYNC_DETECTION
+        self._detection_processes = object_detection_values.DETECTION_PROCESSES
+        # replaced by a DetectionPool in setup() when the detection runs on other processes
+        self._detection_worker: Union[DetectionWorker, DetectionPool] = DetectionWorker(
+            self._frame_buffer, self._detect, self._publish_result)
+        self._detection_cache = DetectionCache(object_detection_values.DETECTION_CACHE_SIZE)
+        # serializes the synchronous detections, while the worker runs only its thread uses the detector
+        self._detection_lock = threading.Lock()
+        self._published = threading.Condition()
+        self._published_result: Optional[DetectionResult] = None
+
+        # the stride asked for by the behaviours (tracking) and the one picked by the policy, the larger one is used
+        self._requested_stride = 1
+        self._detection_scale = 1.0
+        self._adaptive_detection = object_detection_values.ADAPTIVE_DETECTION
+        self._observed_sequence = -1
+        self.detection_policy = AdaptiveDetectionPolicy(
+            scales=object_detection_values.DETECTION_SCALES,
+            max_stride=object_detection_values.DETECTION_MAX_STRIDE,
+            tick_budget=1 / bt_values.TICK_FREQUENCY_HZ if bt_values.TICK_FREQUENCY_HZ > 0 else 0.0,
+            budget_ticks=object_detection_values.DETECTION_BUDGET_TICKS,
+            tick_window=object_detection_values.ADAPT_TICK_WINDOW,
+            inference_window=object_detection_values.ADAPT_INFERENCE_WINDOW,
+            relax_fraction=object_detection_values.ADAPT_RELAX_FRACTION,
+        )
+
+        self._headless = True
+        self._preview = FramePreview(self._frame_buffer.latest, object_detection_values.PREVIEW_MAX_FPS)
+
+    def set_headless(self, headless: bool) -> None:
+        """
+        Enables or disables the preview window, it must be called before setup()
+        :param headless: when True nothing is ever drawn on screen
+        """
+        self._headless = headless
 
     def setup(self) -> None:
-        # Initialize the object detection model
-        base_options = core.BaseOptions(
-            file_name=self._model, use_coral=self._enable_edgetpu, num_threads=self._number_threads)
-        detection_options = processor.DetectionOptions(
-            max_results=object_detection_values.MAX_RESULTS, score_threshold=object_detection_values.SCORE_THRESHOLD)
-        options = vision.ObjectDetectorOptions(
-            base_options=base_options, detection_options=detection_options)
-        self.detector = vision.ObjectDetector.create_from_options(options)
-        print(type(self.detector))
+        self._detector_failed = False
+        # every process of the pool builds its own detector, the main process never loads the model
+        use_pool = self._async_detection and self._detection_processes > 0
+        self._detector_loading = not use_pool
+        if use_pool:
+            self._detection_worker = self._create_detection_pool()
+            self._apply_detection_settings()
+
+        if self._threaded_capture or self._async_detection:
+            self.start_capture()
+        # the worker is started before the model is loaded, so a failed load can always stop it
+        if self._async_detection:
+            self._detection_worker.start()
+
+        # Initialize the object detection model, until it is ready there are no detections
+        if not use_pool and self._deferred_model_loading:
+            self._detector_thread = threading.Thread(target=self._load_detector, name="detector-loader", daemon=True)
+            self._detector_thread.start()
+        elif not use_pool:
+            self._load_detector()
+
+        if not self._headless:
+            self._preview.start()
+
+    def _frame_shape(self) -> tuple[int, int, int]:
+        return (self._camera_height or object_detection_values.CAMERA_HEIGHT_MOCK,
+                self._camera_width or object_detection_values.CAMERA_WIDTH_MOCK, 3)
+
+    def _load_detector(self) -> None:
+        start = time.perf_counter()
+        try:
+            detector = build_warmed_up_detector(self._model, self._enable_edgetpu, self._number_threads,
+                                                object_detection_values.MAX_RESULTS,
+                                                object_detection_values.SCORE_THRESHOLD, self._frame_shape(),
+                                                object_detection_values.WARMUP_INFERENCES)
+        except Exception:
+            logger.exception("Could not build the object detector, continuing without detections")
+            self._detector_failed = True
+            self._detector_loading = False
+            # there is nothing to detect with, the worker would only spin on frames
+            self._detection_worker.stop()
+            return
+        self.detector = detector
+        self._detector_loading = False
+        logger.info(f"Object detector ready after {time.perf_counter() - start:.2f} s")
+
+    def _create_detection_pool(self) -> DetectionPool:
+        # the cores are split between the processes instead of every detector using all of them
+        number_threads = max(self._number_threads // self._detection_processes, 1)
+        detector_factory = partial(build_warmed_up_detector, self._model, self._enable_edgetpu, number_threads,
+                                   object_detection_values.MAX_RESULTS, object_detection_values.SCORE_THRESHOLD,
+                                   self._frame_shape(), object_detection_values.WARMUP_INFERENCES)
+        return DetectionPool(self._frame_buffer, self._detection_processes, detector_factory, get_detections,
+                             self._frame_shape(), self._publish_result)
+
+    @property
+    def is_detection_available(self) -> bool:
+        """
+        False once the detector failed to load, the detections are then always None
+        """
+        return not self._detector_failed
+
+    @property
+    def is_detector_ready(self) -> bool:
+        if isinstance(self._detection_worker, DetectionPool):
+            return self._detection_worker.ready_processes > 0
+        return self.detector is not None
 
     @abstractmethod
-    def get_current_frame(self) -> Optional[npt.NDArray[np.uint8]]:
+    def _read_frame(self) -> Optional[npt.NDArray[np.uint8]]:
+        """
+        Blocks until the camera delivers a new RGB frame
+        :return: the frame or None if the camera failed to deliver it
+        """
         pass
 
+    def start_capture(self) -> None:
+        """
+        Starts the background thread that keeps the ring buffer filled with the newest frames
+        """
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            return
+        self._stop_capture.clear()
+        self._capture_thread = threading.Thread(target=self._capture_loop, name="camera-capture", daemon=True)
+        self._capture_thread.start()
+        logger.info("Camera capture thread started")
+
+    def stop_capture(self) -> None:
+        if self._capture_thread is None:
+            return
+        self._stop_capture.set()
+        self._capture_thread.join()
+        self._capture_thread = None
+        logger.info("Camera capture thread stopped")
+
+    def _capture_loop(self) -> None:
+        while not self._stop_capture.is_set():
+            image = self._read_frame()
+            if image is None:
+                # avoid spinning on a camera that keeps failing
+                self._stop_capture.wait(0.01)
+                continue
+            self._frame_buffer.push(image, time.monotonic())
+
+    def get_latest_frame(self) -> Optional[Frame]:
+        """
+        Returns the newest frame along with its capture timestamp and sequence number. When the capture thread is
+        running this never waits for the camera, otherwise a frame is read synchronously.
+        """
+        if self._capture_thread is None:
+            image = self._read_frame()
+            if image is None:
+                return None
+            self._frame_buffer.push(image, time.monotonic())
+        return self._frame_buffer.latest()
+
+    @property
+    def is_exhausted(self) -> bool:
+        """
+        True when the camera will never deliver another frame (only recorded sources can run out)
+        """
+        return False
+
+    def get_current_frame(self) -> Optional[npt.NDArray[np.uint8]]:
+        frame = self.get_latest_frame()
+        if frame is None:
+            return None
+        return frame.rgb
+
+    def _detect(self, frame: Frame) -> Optional[list[Detection]]:
+        if self.detector is None:
+            # while the model loads there are no detections, and a failed load was already reported
+            if not self._detector_loading and not self._detector_failed:
+                logger.error("Detector is not initialized (Maybe call setup() first)")
+            return None
+        return get_detections(frame, self.detector, self._detection_scale)
+
+    def set_detection_stride(self, stride: int) -> None:
+        """
+        Makes the detection worker run the model on one frame every stride frames, the frames in between are left to
+        the tracker. The detection policy can still ask for a larger stride. It has no effect when the detection runs
+        synchronously.
+        """
+        self._requested_stride = stride
+        self._apply_detection_settings()
+
+    def _apply_detection_settings(self) -> None:
+        settings = self.detection_policy.settings
+        self._detection_worker.set_stride(max(self._requested_stride, settings.stride))
+        self._detection_scale = settings.scale
+        if isinstance(self._detection_worker, DetectionPool):
+            self._detection_worker.set_scale(settings.scale)
+
+    def observe_tick(self, latency: float) -> None:
+        """
+        Feeds the latency of a tick to the detection policy, it must be called after every tick of the tree
+        """
+        if self._adaptive_detection and self.detection_policy.observe_tick(latency):
+            self._apply_detection_settings()
+
+    def _observe_result(self, result: DetectionResult) -> None:
+        if result.sequence != self._observed_sequence:
+            self._observed_sequence = result.sequence
+            self.detection_policy.observe_inference(result.inference_time)
+
+    def request_detection(self) -> None:
+        self._detection_worker.request_detection()
+
+    @property
+    def detection_cache(self) -> DetectionCache:
+        return self._detection_cache
+
+    def _publish_result(self, result: DetectionResult) -> None:
+        """
+        Called by the detection worker (or the collector of the pool) with every result it publishes
+        """
+        self._detection_cache.put(result)
+        with self._published:
+            self._published_result = result
+            self._published.notify_all()
+
+    def get_detections_for(self, frame: Frame) -> Optional[DetectionResult]:
+        """
+        Returns the detections of a frame, the detector only runs the first time a frame is asked for and every other
+        behaviour gets the cached result. While the detection worker runs the frame is detected by the worker.
+        :param frame: a frame returned by get_latest_frame()
+        :return: the detection result or None if the detector is not ready (or the worker skipped the frame)
+        """
+        if self._detection_worker.is_running:
+            return self._wait_for_detection(frame)
+
+        with self._detection_lock:
+            # frames that did not come from the camera have no sequence number to be cached by
+            if frame.sequence >= 0:
+                cached = self._detection_cache.get(frame.sequence)
+                if cached is not None:
+                    return cached
+            start = time.perf_counter()
+            detections = self._detect(frame)
+            if detections is None:
+                return None
+            result = DetectionResult(detections=detections, frame=frame, inference_time=time.perf_counter() - start)
+            if frame.sequence >= 0:
+                self._detection_cache.put(result)
+            self._observe_result(result)
+            return result
+
+    def _wait_for_detection(self, frame: Frame) -> Optional[DetectionResult]:
+        # the detector is not thread safe and belongs to the worker, so the frame is never detected on this thread
+        if frame.sequence < 0:
+            return None
+        cached = self._detection_cache.get(frame.sequence)
+        if cached is not None:
+            return cached
+        self._detection_worker.request_detection()
+        with self._published:
+            self._published.wait_for(
+                lambda: self._published_result is not None and self._published_result.sequence >= frame.sequence,
+                timeout=object_detection_values.DETECTION_WAIT_SECONDS)
+            result = self._published_result
+        # the worker only detects the newest frame, an older one is skipped once a newer one is published
+        if result is None or result.sequence != frame.sequence:
+            return None
+        return result
+
+    def get_latest_detections(self) -> Optional[DetectionResult]:
+        """
+        Returns the newest detection result. When the detection worker is running this only reads the result it
+        published, otherwise the detector is run synchronously on the newest frame unless it was already detected.
+        """
+        if self._detection_worker.is_running:
+            # the worker already put the result in the cache when it published it
+            result = self._detection_worker.latest_result()
+            if result is not None:
+                self._observe_result(result)
+            return result
+
+        # reuse the frame already pulled this tick instead of reading a new one from the camera
+        frame = self._frame_buffer.latest() or self.get_latest_frame()
+        if frame is None:
+            return None
+        return self.get_detections_for(frame)
+
     @abstractmethod
     def disable(self) -> None:
-        cv2.destroyAllWindows()
+        """
+        Stops the preview, the detection and the capture threads. Subclasses release their camera after calling it,
+        since the threads read from it.
+        """
+        self._preview.stop()
+        self._detection_worker.stop()
+        self.stop_capture()
+        logger.debug(f"Detection cache: {self._detection_cache.hits} hits, {self._detection_cache.misses} misses")
 
 
 class CameraControllerMock(CameraController):
@@ -71,6 +361,8 @@ class CameraControllerMock(CameraController):
 
         self._cap: Optional[cv2.VideoCapture] = None
         self._camera_id = object_detection_values.CAMERA_ID
+        # on a computer the feed is shown unless the program runs headless
+        self._headless = False
         logger.info("Instantiating Singleton CameraControllerMock")
 
     def setup(self) -> None:
@@ -81,7 +373,7 @@ class CameraControllerMock(CameraController):
         self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self._camera_height)
         super().setup()
 
-    def get_current_frame(self) -> Optional[npt.NDArray[np.uint8]]:
+    def _read_frame(self) -> Optional[npt.NDArray[np.uint8]]:
         if self._cap is None:
             logger.error("CameraController is not initialized")
             return None
@@ -90,29 +382,28 @@ class CameraControllerMock(CameraController):
             logger.error("Failed to read image from camera")
             return None
 
-        image = cv2.flip(image, 1)
-        cv2.imshow('current frame', image)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            raise KeyboardInterrupt
-        # Convert the image from BGR to RGB as required by the TFLite model.
-        rgb_image: npt.NDArray[np.uint8] = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        rgb_image: npt.NDArray[np.uint8] = cv2.flip(image, 1)  # type: ignore
+        # Convert the image from BGR to RGB as required by the TFLite model, in place to avoid another copy.
+        cv2.cvtColor(rgb_image, cv2.COLOR_BGR2RGB, dst=rgb_image)
         return rgb_image
 
     def disable(self) -> None:
-        if self._cap is not None:
-            self._cap.release()
         logger.info("Disabling camera")
         super().disable()
+        if self._cap is not None:
+            self._cap.release()
 
 
 class CameraControllerRaspberry(CameraController):
     def __init__(self):
         super().__init__()
-        self._camera_width = object_detection_values.CAMERA_WIDTH_MOCK
-        self._camera_height = object_detection_values.CAMERA_HEIGHT_MOCK
+        self._camera_width = object_detection_values.CAMERA_WIDTH_RASPBERRY
+        self._camera_height = object_detection_values.CAMERA_HEIGHT_RASPBERRY
         self._picamera = None
 
     def setup(self) -> None:
+        from picamera2 import Picamera2
+
         self._picamera = Picamera2()
         self._picamera.preview_configuration.main.size = (self._camera_width, self._camera_height)
         self._picamera.preview_configuration.main.format = "RGB888"
@@ -122,7 +413,7 @@ class CameraControllerRaspberry(CameraController):
         self._picamera.start()
         super().setup()
 
-    def get_current_frame(self) -> Optional[npt.NDArray[np.uint8]]:
+    def _read_frame(self) -> Optional[npt.NDArray[np.uint8]]:
         if self._picamera is None:
             logger.error("PiCamera not found (Maybe call setup() first)")
             return None
@@ -134,12 +425,151 @@ class CameraControllerRaspberry(CameraController):
         super().disable()
 
 
+class CameraControllerReplay(CameraController):
+    """
+    This class streams frames from a video file or a directory of images, it is used to benchmark and test the
+    behaviour tree on the same footage on a computer without a camera
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._source: Optional[str] = None
+        self._realtime = True
+        self._loop = False
+        self._frame_period = 1 / object_detection_values.REPLAY_DEFAULT_FPS
+        self._next_frame_time = 0.0
+        self._exhausted = False
+
+        self._cap: Optional[cv2.VideoCapture] = None
+        self._image_paths: list[str] = []
+        self._image_index = 0
+        logger.info("Instantiating Singleton CameraControllerReplay")
+
+    def configure(self, source: str, realtime: bool = True, loop: bool = False) -> None:
+        """
+        Selects the footage to replay, it must be called before setup()
+        :param source: path to a video file or to a directory of images (replayed in name order)
+        :param realtime: when True frames are delivered at the footage frame rate, otherwise as fast as possible
+        :param loop: when True the footage starts again after the last frame
+        """
+        self._source = source
+        self._realtime = realtime
+        self._loop = loop
+        # every read must return the next frame when not in realtime, a background thread would skip frames and
+        # break determinism. The controller is a singleton, so a realtime source gets the configured values back.
+        self._threaded_capture = realtime and object_detection_values.THREADED_CAPTURE
+        self._async_detection = realtime and object_detection_values.ASYNC_DETECTION
+
+    def setup(self) -> None:
+        logger.info("CameraControllerReplay.setup() called")
+        if self._source is None:
+            raise RuntimeError("CameraControllerReplay.configure() must be called before setup()")
+
+        # the singleton may have replayed another source before
+        self._image_index = 0
+        self._cap = None
+        self._frame_period = 1 / object_detection_values.REPLAY_DEFAULT_FPS
+        if os.path.isdir(self._source):
+            self._image_paths = sorted(
+                os.path.join(self._source, file_name) for file_name in os.listdir(self._source)
+                if file_name.lower().endswith(object_detection_values.REPLAY_IMAGE_EXTENSIONS))
+            if not self._image_paths:
+                raise RuntimeError(f"No images found in {self._source}")
+        else:
+            self._cap = cv2.VideoCapture(self._source)
+            if not self._cap.isOpened():
+                raise RuntimeError(f"Could not open video {self._source}")
+            fps = self._cap.get(cv2.CAP_PROP_FPS)
+            if fps > 0:
+                self._frame_period = 1 / fps
+        self._exhausted = False
+        self._next_frame_time = time.monotonic()
+        super().setup()
+
+    @property
+    def is_exhausted(self) -> bool:
+        return self._exhausted
+
+    def _read_frame(self) -> Optional[npt.NDArray[np.uint8]]:
+        if self._exhausted:
+            return None
+        if self._realtime:
+            self._wait_next_frame_time()
+
+        image = self._read_image()
+        if image is None and self._loop:
+            self._rewind()
+            image = self._read_image()
+        if image is None:
+            logger.info("Replay finished")
+            self._exhausted = True
+            return None
+
+        # every image is read into a new array, so it can be converted in place
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)  # type: ignore
+
+    def _wait_next_frame_time(self) -> None:
+        delay = self._next_frame_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+            self._next_frame_time += self._frame_period
+        else:
+            # too slow to keep up, pace from now on instead of bursting to catch up
+            self._next_frame_time = time.monotonic() + self._frame_period
+
+    def _read_image(self) -> Optional[npt.NDArray[np.uint8]]:
+        if self._cap is not None:
+            success, frame = self._cap.read()
+            return frame if success else None  # type: ignore
+        if self._image_index >= len(self._image_paths):
+            return None
+        image_path = self._image_paths[self._image_index]
+        self._image_index += 1
+        image = cv2.imread(image_path)
+        if image is None:
+            logger.error(f"Could not read image {image_path}")
+        return image  # type: ignore
+
+    def _rewind(self) -> None:
+        if self._cap is not None:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._image_index = 0
+
+    def disable(self) -> None:
+        logger.info("Disabling replay camera")
+        super().disable()
+        if self._cap is not None:
+            self._cap.release()
+
+
+# when a replay source is selected every architecture gets the replay controller
+_replay_selected = False
+
+
+def select_replay_camera(source: str, realtime: bool = True, loop: bool = False) -> CameraControllerReplay:
+    """
+    Makes camera_controller_factory return the replay controller from now on, so every behaviour of the tree uses it
+    :param source: path to a video file or to a directory of images
+    :param realtime: when True frames are delivered at the footage frame rate, otherwise as fast as possible
+    :param loop: when True the footage starts again after the last frame
+    :return: the replay controller
+    """
+    global _replay_selected
+    _replay_selected = True
+    camera = CameraControllerReplay()
+    camera.configure(source, realtime, loop)
+    return camera
+
+
 def camera_controller_factory(architecture: str) -> CameraController:
     constructors: Mapping[str, Type[CameraController]] = {
         "x86_64": CameraControllerMock,
         "aarch64": CameraControllerRaspberry,
         "AMD64": CameraControllerMock,
+        "replay": CameraControllerReplay,
     }
+    if _replay_selected:
+        architecture = "replay"
 
     return constructors[architecture]()
 
@@ -149,12 +579,14 @@ def main():
     camera = camera_controller_factory(platform.machine())
     camera.setup()
     try:
+        last_sequence = -1
         while True:
-            current_image = camera.get_current_frame()
-            if current_image is None:
+            result = camera.get_latest_detections()
+            if result is None or result.sequence == last_sequence:
+                time.sleep(0.01)
                 continue
-            detections = get_detections(current_image, camera.detector)
-            print(detections)
+            last_sequence = result.sequence
+            print(f"frame {result.sequence} ({result.inference_time * 1000:.1f} ms): {result.detections}")
     except KeyboardInterrupt:
         pass
 
@@ -0,0 +1,60 @@
+"""
+This class is used by the camera controllers so every behaviour that asks for the detections of a frame shares one
+inference.
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from RLP_TMR2023.common_types.common_types import DetectionResult
+
+
+class DetectionCache:
+    """
+    Least recently used cache of detection results keyed by the sequence number of the frame they were computed on
+    """
+
+    def __init__(self, size: int) -> None:
+        if size < 1:
+            raise ValueError("DetectionCache needs at least 1 entry")
+        self._size = size
+        self._results: OrderedDict[int, DetectionResult] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get(self, sequence: int) -> Optional[DetectionResult]:
+        """
+        :param sequence: the sequence number of the frame
+        :return: the cached result or None if the frame has not been detected (or was evicted)
+        """
+        with self._lock:
+            result = self._results.get(sequence)
+            if result is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(sequence)
+            self.hits += 1
+            return result
+
+    def put(self, result: DetectionResult) -> None:
+        """
+        Stores a result, the least recently used one is evicted when the cache is full
+        """
+        with self._lock:
+            self._results[result.sequence] = result
+            self._results.move_to_end(result.sequence)
+            if len(self._results) > self._size:
+                self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
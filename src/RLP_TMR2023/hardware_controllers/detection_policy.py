@@ -0,0 +1,130 @@
+"""
+This class is used by the camera controllers to trade detection resolution and rate for tick rate when the robot is
+congested.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from typing import Sequence
+
+from RLP_TMR2023.hardware_controllers.rolling_statistics import RollingStatistics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DetectionSettings:
+    """
+    Fraction of the camera resolution the detector runs on and the number of frames between two detections
+    """
+    scale: float
+    stride: int
+
+
+@dataclass
+class PolicyDecision:
+    timestamp: float
+    settings: DetectionSettings
+    # "scale" or "stride", the setting that changed
+    setting: str
+    reason: str
+    tick_p95: float
+    inference_p95: float
+
+
+class AdaptiveDetectionPolicy:
+    """
+    Picks the detection settings from the measured tick and inference latencies. Each setting follows the latency it
+    can actually change: the p95 inference latency steps the resolution down the scales when it overruns
+    budget_ticks tick periods, and the p95 tick latency detects fewer frames (a larger stride) when it overruns the
+    tick budget, since a larger stride does not make a single inference any faster. A setting steps back up when its
+    latency is under relax_fraction of its budget. The latency windows start over after every step so each decision
+    is based only on the settings in use.
+    """
+
+    def __init__(self, scales: Sequence[float], max_stride: int, tick_budget: float, budget_ticks: float,
+                 tick_window: int, inference_window: int, relax_fraction: float) -> None:
+        if not scales:
+            raise ValueError("The policy needs at least one scale")
+        self._scales = list(scales)
+        self._max_stride = max(max_stride, 1)
+        self._scale_level = 0
+        self._stride = 1
+        self._tick_budget = tick_budget
+        self._budget_ticks = budget_ticks
+        self._tick_window = tick_window
+        self._inference_window = inference_window
+        self._relax_fraction = relax_fraction
+        self._tick_latencies = RollingStatistics(tick_window, columns=1)
+        self._inference_latencies = RollingStatistics(inference_window, columns=1)
+        self.decisions: list[PolicyDecision] = []
+
+    @property
+    def settings(self) -> DetectionSettings:
+        return DetectionSettings(self._scales[self._scale_level], self._stride)
+
+    def set_tick_budget(self, tick_budget: float) -> None:
+        """
+        :param tick_budget: the tick period in seconds, 0 (ticking as fast as possible) disables the policy
+        """
+        self._tick_budget = tick_budget
+
+    def observe_tick(self, latency: float) -> bool:
+        """
+        Records the latency of a tick and steps the settings if needed
+        :return: True when the settings changed
+        """
+        self._tick_latencies.push([latency])
+        return self._decide()
+
+    def observe_inference(self, latency: float) -> None:
+        self._inference_latencies.push([latency])
+
+    @staticmethod
+    def _step(latency: float, budget: float, relax_budget: float) -> int:
+        """
+        :return: 1 to step down (congested), -1 to step up (relaxed) or 0 to keep the setting
+        """
+        if latency > budget:
+            return 1
+        if latency < relax_budget:
+            return -1
+        return 0
+
+    def _decide(self) -> bool:
+        if self._tick_budget <= 0 or not self._tick_latencies.is_full or not self._inference_latencies.is_full:
+            return False
+        tick_p95 = float(self._tick_latencies.percentile(95)[0])
+        inference_p95 = float(self._inference_latencies.percentile(95)[0])
+        inference_budget = self._tick_budget * self._budget_ticks
+
+        scale_step = self._step(inference_p95, inference_budget, inference_budget * self._relax_fraction)
+        scale_level = min(max(self._scale_level + scale_step, 0), len(self._scales) - 1)
+        stride_step = self._step(tick_p95, self._tick_budget, self._tick_budget * self._relax_fraction)
+        stride = min(max(self._stride + stride_step, 1), self._max_stride)
+
+        changes = []
+        if scale_level != self._scale_level:
+            self._scale_level = scale_level
+            changes.append(("scale", scale_step))
+        if stride != self._stride:
+            self._stride = stride
+            changes.append(("stride", stride_step))
+        if not changes:
+            return False
+
+        for setting, step in changes:
+            reason = "congested" if step > 0 else "relaxed"
+            self.decisions.append(
+                PolicyDecision(time.monotonic(), self.settings, setting, reason, tick_p95, inference_p95))
+            logger.info(f"Detection policy {setting} {reason} (tick p95 {tick_p95 * 1000:.1f} ms, inference p95 "
+                        f"{inference_p95 * 1000:.1f} ms): scale {self.settings.scale}, stride {self.settings.stride}")
+        self._tick_latencies = RollingStatistics(self._tick_window, columns=1)
+        self._inference_latencies = RollingStatistics(self._inference_window, columns=1)
+        return True
+
+    def report(self) -> str:
+        steps = {reason: sum(decision.reason == reason for decision in self.decisions)
+                 for reason in ("congested", "relaxed")}
+        return (f"Detection policy: {steps['congested']} steps down, {steps['relaxed']} steps up, "
+                f"ended at scale {self.settings.scale} and stride {self.settings.stride}")
@@ -0,0 +1,273 @@
+"""
+This class runs the object detection model on several processes so the inference never competes with the behaviour
+tree for the interpreter lock.
+"""
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.queues import Queue
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from RLP_TMR2023.common_types.common_types import Detection, DetectionResult
+from RLP_TMR2023.hardware_controllers.frame_ring_buffer import FrameRingBuffer
+from RLP_TMR2023.image_processing.frame import Frame
+
+logger = logging.getLogger(__name__)
+
+DetectorFactory = Callable[[], Any]
+DetectFunction = Callable[[Frame, Any, float], Optional[list[Detection]]]
+# (sequence, slot name, shape, scale) of the frame written to the slot of the process, None stops the process. The
+# slot is replaced when a frame does not fit in it, so its name goes with every task.
+DetectionTask = Optional[tuple[int, str, tuple[int, ...], float]]
+# (process index, sequence, detections, inference time)
+DetectionOutcome = tuple[int, int, Optional[list[Detection]], float]
+
+# sequence number sent by a process once its detector is built and it is ready for frames
+_READY = -1
+
+
+def _detection_process(index: int, slot_name: str, tasks: "Queue[DetectionTask]", results: "Queue[DetectionOutcome]",
+                       detector_factory: DetectorFactory, detect: DetectFunction) -> None:
+    """
+    Body of every process of the pool, it builds its own detector and then detects the frames written to its shared
+    memory slot until it receives None
+    """
+    slot = shared_memory.SharedMemory(name=slot_name)
+    try:
+        try:
+            detector = detector_factory()
+        except Exception:
+            logger.exception(f"Detection process {index} could not build the detector")
+            return
+        results.put((index, _READY, None, 0.0))
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            sequence, task_slot_name, shape, scale = task
+            if task_slot_name != slot.name:
+                slot.close()
+                slot = shared_memory.SharedMemory(name=task_slot_name)
+            start = time.perf_counter()
+            rgb = np.ndarray(shape, dtype=np.uint8, buffer=slot.buf)
+            try:
+                detections = detect(Frame(rgb, sequence=sequence), detector, scale)
+            except Exception:
+                logger.exception(f"Detection failed on frame {sequence}")
+                detections = None
+            # the array must not outlive the slot, it is released before closing it
+            del rgb
+            results.put((index, sequence, detections, time.perf_counter() - start))
+    finally:
+        slot.close()
+
+
+class DetectionPool:
+    """
+    Drop-in replacement of DetectionWorker that spreads the frames over several processes, each one with its own
+    detector. A frame is copied once into the shared memory slot of an idle process and only its sequence number and
+    shape go through the task queue. Results come back tagged with the sequence number: one that is older than the
+    last published result is discarded, so the readers only ever see newer frames. Every published result is also
+    handed to on_result, from the collector thread.
+    """
+
+    def __init__(self, frame_buffer: FrameRingBuffer, processes: int, detector_factory: DetectorFactory,
+                 detect: DetectFunction, max_frame_shape: tuple[int, int, int],
+                 on_result: Optional[Callable[[DetectionResult], None]] = None) -> None:
+        if processes < 1:
+            raise ValueError("DetectionPool needs at least 1 process")
+        self._frame_buffer = frame_buffer
+        self._on_result = on_result
+        self._processes_count = processes
+        self._detector_factory = detector_factory
+        self._detect = detect
+        # initial size of the slots, a slot grows when a frame does not fit in it
+        self._slot_size = int(np.prod(max_frame_shape))
+
+        # spawn instead of fork, the parent has camera and controller threads running
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: list[multiprocessing.process.BaseProcess] = []
+        self._slots: list[shared_memory.SharedMemory] = []
+        self._tasks: list["Queue[DetectionTask]"] = []
+        self._results: Optional["Queue[DetectionOutcome]"] = None
+        self._idle: "queue.Queue[int]" = queue.Queue()
+        self._in_flight: dict[int, Frame] = {}
+        self._in_flight_lock = threading.Lock()
+
+        self._dispatch_thread: Optional[threading.Thread] = None
+        self._collect_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._latest_result: Optional[DetectionResult] = None
+        self._last_sequence = -1
+        self._last_detected_sequence = -1
+        self._stride = 1
+        self._scale = 1.0
+        self._detection_requested = threading.Event()
+
+        self.ready_processes = 0
+        self.stale_results = 0
+        self.slot_reallocations = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._dispatch_thread is not None and self._dispatch_thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._idle = queue.Queue()
+        self._in_flight.clear()
+        self._results = self._context.Queue()
+        for index in range(self._processes_count):
+            slot = shared_memory.SharedMemory(create=True, size=self._slot_size)
+            tasks: "Queue[DetectionTask]" = self._context.Queue()
+            process = self._context.Process(
+                target=_detection_process, name=f"detection-process-{index}", daemon=True,
+                args=(index, slot.name, tasks, self._results, self._detector_factory, self._detect))
+            process.start()
+            self._slots.append(slot)
+            self._tasks.append(tasks)
+            self._processes.append(process)
+
+        self._collect_thread = threading.Thread(target=self._collect, name="detection-collector", daemon=True)
+        self._collect_thread.start()
+        self._dispatch_thread = threading.Thread(target=self._dispatch, name="detection-dispatcher", daemon=True)
+        self._dispatch_thread.start()
+        logger.info(f"Detection pool started with {self._processes_count} processes")
+
+    def stop(self) -> None:
+        if self._dispatch_thread is None:
+            return
+        self._stop.set()
+        self._dispatch_thread.join()
+        self._dispatch_thread = None
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop, terminating it")
+                process.terminate()
+                process.join()
+        if self._collect_thread is not None:
+            self._collect_thread.join()
+            self._collect_thread = None
+        for slot in self._slots:
+            slot.close()
+            slot.unlink()
+        self._processes.clear()
+        self._slots.clear()
+        self._tasks.clear()
+        self.ready_processes = 0
+        logger.info("Detection pool stopped")
+
+    def set_stride(self, stride: int) -> None:
+        """
+        Detects only one frame every stride frames, 1 detects every frame the processes have time for
+        """
+        self._stride = max(stride, 1)
+
+    def set_scale(self, scale: float) -> None:
+        """
+        Fraction of the frame resolution the detectors run on from the next frame
+        """
+        self._scale = scale
+
+    def request_detection(self) -> None:
+        """
+        The next frame is detected regardless of the stride
+        """
+        self._detection_requested.set()
+
+    def latest_result(self) -> Optional[DetectionResult]:
+        """
+        Returns the newest published result, it is replaced as a whole so readers never see a partial one
+        """
+        return self._latest_result
+
+    def _next_frame(self) -> Optional[Frame]:
+        frame = self._frame_buffer.wait_for_frame(self._last_sequence, timeout=0.1)
+        if frame is None:
+            return None
+        self._last_sequence = frame.sequence
+        if frame.sequence - self._last_detected_sequence < self._stride and not self._detection_requested.is_set():
+            return None
+        return frame
+
+    def _slot_for(self, index: int, frame: Frame) -> shared_memory.SharedMemory:
+        """
+        Returns the slot of a process, replaced by a larger one when the frame does not fit (the camera can deliver
+        frames larger than the configured resolution after aligning it)
+        """
+        slot = self._slots[index]
+        if frame.rgb.nbytes <= slot.size:
+            return slot
+        logger.info(f"Growing the shared memory of process {index} to fit frames of shape {frame.rgb.shape}")
+        self.slot_reallocations += 1
+        # the process is idle, it opens the new slot with its next task and the old one is freed once it closes it
+        new_slot = shared_memory.SharedMemory(create=True, size=frame.rgb.nbytes)
+        slot.close()
+        slot.unlink()
+        self._slots[index] = new_slot
+        return new_slot
+
+    def _dispatch(self) -> None:
+        while not self._stop.is_set():
+            try:
+                index = self._idle.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            frame = None
+            while frame is None and not self._stop.is_set():
+                frame = self._next_frame()
+            if frame is None:
+                return
+            self._detection_requested.clear()
+            self._last_detected_sequence = frame.sequence
+
+            # the only copy of the frame, from the camera buffer to the slot of the idle process
+            slot = self._slot_for(index, frame)
+            slot_array = np.ndarray(frame.rgb.shape, dtype=np.uint8, buffer=slot.buf)
+            slot_array[...] = frame.rgb
+            del slot_array
+            with self._in_flight_lock:
+                self._in_flight[frame.sequence] = frame
+            self._tasks[index].put((frame.sequence, slot.name, frame.rgb.shape, self._scale))
+
+    def _collect(self) -> None:
+        assert self._results is not None
+        while True:
+            try:
+                index, sequence, detections, inference_time = self._results.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set() and not any(process.is_alive() for process in self._processes):
+                    return
+                continue
+            if sequence == _READY:
+                self.ready_processes += 1
+                self._idle.put(index)
+                continue
+
+            with self._in_flight_lock:
+                frame = self._in_flight.pop(sequence, None)
+            self._idle.put(index)
+            if frame is None:
+                # a late or duplicated result of a frame that is no longer in flight
+                self.stale_results += 1
+                continue
+            if detections is None:
+                continue
+            if self._latest_result is not None and sequence < self._latest_result.sequence:
+                # a slower process finished after a newer frame was published
+                self.stale_results += 1
+                continue
+            result = DetectionResult(detections=detections, frame=frame, inference_time=inference_time)
+            self._latest_result = result
+            if self._on_result is not None:
+                self._on_result(result)
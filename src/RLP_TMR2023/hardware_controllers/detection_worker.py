@@ -0,0 +1,102 @@
+"""
+This class runs the object detection model on its own thread so the behaviour tree never waits for the inference.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from RLP_TMR2023.common_types.common_types import Detection, DetectionResult
+from RLP_TMR2023.hardware_controllers.frame_ring_buffer import FrameRingBuffer
+from RLP_TMR2023.image_processing.frame import Frame
+
+logger = logging.getLogger(__name__)
+
+
+class DetectionWorker:
+    """
+    Takes the newest frame from the ring buffer, runs the detection function on it and publishes the result tagged
+    with the sequence number of the frame it belongs to. Frames captured while the model is busy are skipped, and
+    with a stride greater than 1 only one frame every stride frames is detected unless a detection is requested.
+    Every published result is also handed to on_result, from the thread of the worker.
+    """
+
+    def __init__(self, frame_buffer: FrameRingBuffer,
+                 detect: Callable[[Frame], Optional[list[Detection]]],
+                 on_result: Optional[Callable[[DetectionResult], None]] = None) -> None:
+        self._frame_buffer = frame_buffer
+        self._detect = detect
+        self._on_result = on_result
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._latest_result: Optional[DetectionResult] = None
+        self._last_sequence = -1
+        self._last_detected_sequence = -1
+        self._stride = 1
+        self._detection_requested = threading.Event()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="detection-worker", daemon=True)
+        self._thread.start()
+        logger.info("Detection worker started")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Detection worker stopped")
+
+    def set_stride(self, stride: int) -> None:
+        """
+        Detects only one frame every stride frames, 1 detects every frame the model has time for
+        """
+        self._stride = max(stride, 1)
+
+    def request_detection(self) -> None:
+        """
+        The next frame is detected regardless of the stride
+        """
+        self._detection_requested.set()
+
+    def latest_result(self) -> Optional[DetectionResult]:
+        """
+        Returns the newest published result, it is replaced as a whole so readers never see a partial one
+        """
+        return self._latest_result
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            frame = self._frame_buffer.wait_for_frame(self._last_sequence, timeout=0.1)
+            if frame is None:
+                continue
+            if frame.sequence - self._last_detected_sequence < self._stride and not self._detection_requested.is_set():
+                self._last_sequence = frame.sequence
+                continue
+            self._detection_requested.clear()
+            start = time.perf_counter()
+            try:
+                detections = self._detect(frame)
+            except Exception:
+                logger.exception(f"Detection failed on frame {frame.sequence}")
+                detections = None
+            self._last_sequence = frame.sequence
+            self._last_detected_sequence = frame.sequence
+            if detections is None:
+                continue
+            result = DetectionResult(
+                detections=detections,
+                frame=frame,
+                inference_time=time.perf_counter() - start,
+            )
+            self._latest_result = result
+            if self._on_result is not None:
+                self._on_result(result)
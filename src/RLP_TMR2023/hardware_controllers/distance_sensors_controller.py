@@ -3,12 +3,12 @@ This class should be used to detect the array of distances of the robot from an
 """
 import logging
 import platform
+import threading
 import time
 from abc import abstractmethod
-from typing import Type, Mapping, Callable
-
-import smbus
+from typing import Type, Mapping, Callable, Optional, Sequence
 
+from RLP_TMR2023.common_types.common_types import DistanceReading
 from RLP_TMR2023.constants import ultrasonic_values
 from RLP_TMR2023.hardware_controllers.singleton import Singleton
 
@@ -31,6 +31,19 @@ def any_sensor_strategy(sensor_values: tuple[int, int, int], min_distance: int,
     return any(min_distance < sensor_value < max_distance for sensor_value in sensor_values)
 
 
+def parse_distances(block: Sequence[int]) -> Optional[tuple[int, int, int]]:
+    """
+    Finds the first whole frame (a separator followed by the 3 distances) in a block read from the sensors, so the
+    distances keep their order wherever the block starts
+    :return: the distances or None if the block has no whole frame
+    """
+    separator = ultrasonic_values.FRAME_SEPARATOR
+    for index in range(len(block) - 3):
+        if block[index] == separator and separator not in block[index + 1:index + 4]:
+            return block[index + 1], block[index + 2], block[index + 3]
+    return None
+
+
 class DistanceSensorsController(metaclass=Singleton):
     @abstractmethod
     def setup(self) -> None:
@@ -40,6 +53,12 @@ class DistanceSensorsController(metaclass=Singleton):
     def is_about_to_collide(self, strategy: Callable[[tuple[int, int, int], int, int], bool]) -> bool:
         pass
 
+    def latest_reading(self) -> Optional[DistanceReading]:
+        """
+        Returns the newest distances read from the sensors or None if there is no reading yet
+        """
+        return None
+
     @abstractmethod
     def disable(self) -> None:
         pass
@@ -74,32 +93,90 @@ class DistanceSensorsControllerRaspberry(DistanceSensorsController):
         self._addr = None
         self._max_distance = ultrasonic_values.MAX_DISTANCE
         self._min_distance = ultrasonic_values.MIN_DISTANCE
-        self.last_data = 0
+
+        self._poll_period = 1 / ultrasonic_values.POLL_RATE_HZ
+        self._poller_thread: Optional[threading.Thread] = None
+        self._stop_poller = threading.Event()
+        # replaced as a whole by the poller, so the tick thread reads it without locks
+        self._latest_reading: Optional[DistanceReading] = None
+        self._started_at = time.monotonic()
+        self._reported_stale = False
+        self.failed_reads = 0
 
     def setup(self) -> None:
+        import smbus
+
         self._addr = ultrasonic_values.I2C_ADDR
         self._i2c_bus = smbus.SMBus(ultrasonic_values.I2C_BUS)
 
-    def is_about_to_collide(self, strategy: Callable[[tuple[int, int, int], int, int], bool]) -> bool:
+        self._started_at = time.monotonic()
+        self._stop_poller.clear()
+        self._poller_thread = threading.Thread(target=self._poll_loop, name="distance-sensors-poller", daemon=True)
+        self._poller_thread.start()
+
+    def _read_distances(self) -> Optional[tuple[int, int, int]]:
+        """
+        Reads the 3 distances with a single block read, retrying a bounded number of times before the timeout
+        :return: the distances or None if no valid block could be read
+        """
         if self._i2c_bus is None:
-            raise RuntimeError("The distance sensors controller has not been setup yet")
-        # read the first 3 bytes that are not 255
-        sensor_data_list: list[int] = []
-        while len(sensor_data_list) < 3:
+            return None
+        deadline = time.monotonic() + ultrasonic_values.READ_TIMEOUT_SECONDS
+        for _ in range(ultrasonic_values.READ_RETRIES):
+            if time.monotonic() > deadline:
+                break
             try:
-                data = self._i2c_bus.read_byte_data(self._addr, 0)
-                self.last_data = data
+                block = self._i2c_bus.read_i2c_block_data(self._addr, 0, ultrasonic_values.BLOCK_READ_LENGTH)
             except OSError:
-                data = self.last_data
-            if data != 255:
-                sensor_data_list.append(data)
-        sensor_data = (sensor_data_list[0], sensor_data_list[1], sensor_data_list[2])  # just for type hinting
-        return strategy(sensor_data, self._min_distance, self._max_distance)
+                continue
+            distances = parse_distances(block)
+            if distances is not None:
+                return distances
+        return None
+
+    def _poll_loop(self) -> None:
+        next_poll_time = time.monotonic()
+        while not self._stop_poller.is_set():
+            distances = self._read_distances()
+            if distances is None:
+                self.failed_reads += 1
+            else:
+                self._latest_reading = DistanceReading(distances=distances, timestamp=time.monotonic())
+
+            next_poll_time += self._poll_period
+            delay = next_poll_time - time.monotonic()
+            if delay > 0:
+                self._stop_poller.wait(delay)
+            else:
+                next_poll_time = time.monotonic()
+
+    def latest_reading(self) -> Optional[DistanceReading]:
+        return self._latest_reading
+
+    def is_about_to_collide(self, strategy: Callable[[tuple[int, int, int], int, int], bool]) -> bool:
+        if self._i2c_bus is None:
+            raise RuntimeError("The distance sensors controller has not been setup yet")
+        reading = self._latest_reading
+        age = time.monotonic() - (reading.timestamp if reading is not None else self._started_at)
+        if age > ultrasonic_values.STALE_READING_SECONDS:
+            # the obstacles are unknown, fail safe instead of trusting an old reading
+            if not self._reported_stale:
+                logger.error(f"No distance reading for {age:.2f} s ({self.failed_reads} failed reads), assuming an "
+                             f"obstacle")
+                self._reported_stale = True
+            return True
+        self._reported_stale = False
+        if reading is None:
+            return False
+        return strategy(reading.distances, self._min_distance, self._max_distance)
 
     def disable(self) -> None:
         """ This method is used to disable the distance sensors
         """
-        pass
+        self._stop_poller.set()
+        if self._poller_thread is not None:
+            self._poller_thread.join()
+            self._poller_thread = None
 
 
 def distance_sensors_controller_factory(architecture: str) -> DistanceSensorsController:
@@ -0,0 +1,60 @@
+"""
+This class shows the camera feed in a window without getting in the way of the capture or the behaviour tree.
+"""
+import _thread
+import logging
+import threading
+from typing import Callable, Optional
+
+import cv2
+
+from RLP_TMR2023.image_processing.frame import Frame
+
+logger = logging.getLogger(__name__)
+
+
+class FramePreview:
+    """
+    Draws the newest frame at most max_fps times per second from its own thread. Every HighGUI call is made from
+    that thread, and pressing 'q' in the window interrupts the main thread like Ctrl+C would.
+    """
+
+    def __init__(self, frame_source: Callable[[], Optional[Frame]], max_fps: float,
+                 window_name: str = "current frame") -> None:
+        self._frame_source = frame_source
+        self._period = 1 / max_fps
+        self._window_name = window_name
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="camera-preview", daemon=True)
+        self._thread.start()
+        logger.info("Camera preview started")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Camera preview stopped")
+
+    def _run(self) -> None:
+        last_sequence = -1
+        try:
+            while not self._stop.wait(self._period):
+                frame = self._frame_source()
+                if frame is None or frame.sequence == last_sequence:
+                    continue
+                last_sequence = frame.sequence
+                cv2.imshow(self._window_name, frame.bgr)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    _thread.interrupt_main()
+        except cv2.error:
+            logger.exception("Camera preview failed, continuing without it (maybe run with --headless)")
+        finally:
+            cv2.destroyAllWindows()
@@ -0,0 +1,73 @@
+"""
+This class is used by the camera controllers to share the newest captured frame between threads without copies.
+"""
+import threading
+from collections import deque
+from typing import Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from RLP_TMR2023.image_processing.frame import Frame
+
+
+class FrameRingBuffer:
+    """
+    Keeps the last captured frames. A frame is published by reference and its pixels are never written again, so any
+    number of readers can share it (and the colour planes cached in it) without copying it or holding a lock while
+    they use it. The writer hands over a new image for every frame.
+    """
+
+    def __init__(self, size: int) -> None:
+        if size < 1:
+            raise ValueError("FrameRingBuffer needs at least 1 slot")
+        self._frames: deque[Frame] = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._next_sequence = 0
+
+    @property
+    def latest_sequence(self) -> int:
+        """
+        Sequence number of the newest published frame, -1 if nothing has been published yet
+        """
+        with self._lock:
+            if not self._frames:
+                return -1
+            return self._frames[-1].sequence
+
+    def push(self, image: npt.NDArray[np.uint8], timestamp: float) -> int:
+        """
+        Publishes an image, the buffer takes ownership of it so the caller must not modify it afterwards
+        :param image: the RGB frame to publish
+        :param timestamp: the moment the frame was captured
+        :return: the sequence number assigned to the frame
+        """
+        with self._lock:
+            sequence = self._next_sequence
+            self._next_sequence += 1
+            self._frames.append(Frame(image, timestamp, sequence))
+            self._new_frame.notify_all()
+        return sequence
+
+    def latest(self) -> Optional[Frame]:
+        """
+        Returns the newest frame, never waits for the writer
+        :return: the newest frame or None if nothing has been published yet
+        """
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def wait_for_frame(self, after_sequence: int, timeout: Optional[float] = None) -> Optional[Frame]:
+        """
+        Waits until a frame newer than after_sequence is published and returns the newest one
+        :param after_sequence: the last sequence number the caller already processed
+        :param timeout: maximum time to wait in seconds, None waits forever
+        :return: the newest frame or None if the timeout expired
+        """
+        with self._new_frame:
+            published = self._new_frame.wait_for(
+                lambda: bool(self._frames) and self._frames[-1].sequence > after_sequence, timeout=timeout)
+            if not published:
+                return None
+            return self._frames[-1]
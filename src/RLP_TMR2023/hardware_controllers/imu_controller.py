@@ -3,21 +3,22 @@ This class should be used to detect if the robot is stuck.
 """
 import logging
 import platform
+import threading
 import time
 from abc import abstractmethod
+from dataclasses import dataclass
 from enum import Enum
-from typing import Type, Mapping, Callable
+from typing import Type, Mapping, Callable, Optional, Sequence
 
 import numpy as np
 import numpy.typing as npt
-from mpu9250_jmdev.mpu_9250 import MPU9250
-from mpu9250_jmdev.registers import \
-    MPU9050_ADDRESS_68, GFS_1000, AFS_8G, AK8963_BIT_16, AK8963_MODE_C100HZ
 
+from RLP_TMR2023.constants import imu_values
+from RLP_TMR2023.hardware_controllers.rolling_statistics import RollingStatistics
 from RLP_TMR2023.hardware_controllers.singleton import Singleton
 
 logger = logging.getLogger(__name__)
-NUM_SAMPLES = 25
+NUM_SAMPLES = imu_values.NUM_SAMPLES
 
 
 class DataRecollectedType(Enum):
@@ -25,47 +26,113 @@ class DataRecollectedType(Enum):
     ACCELEROMETER = 1
 
 
-def gyroscope_any_iqr_strategy(full_data: Mapping[DataRecollectedType, npt.NDArray[np.float64]]) -> bool:
-    data = full_data[DataRecollectedType.GYROSCOPE]
-    q1, q3 = np.percentile(data, [25, 75], axis=0)
-    gyro_iqr = q3 - q1
+@dataclass
+class WindowStatistics:
+    """
+    Statistics of every axis over the window of samples of one sensor
+    """
+    std: npt.NDArray[np.float64]
+    q1: npt.NDArray[np.float64]
+    q3: npt.NDArray[np.float64]
+
+    @property
+    def iqr(self) -> npt.NDArray[np.float64]:
+        return self.q3 - self.q1
+
+
+StuckStrategy = Callable[[Mapping[DataRecollectedType, WindowStatistics]], bool]
+
+
+def gyroscope_any_iqr_strategy(full_data: Mapping[DataRecollectedType, WindowStatistics]) -> bool:
+    gyro_iqr = full_data[DataRecollectedType.GYROSCOPE].iqr
     return not np.any(gyro_iqr > 5)  # TODO: use a config file to set the threshold
 
 
-def gyroscope_all_iqr_strategy(full_data: Mapping[DataRecollectedType, npt.NDArray[np.float64]]) -> bool:
-    data = full_data[DataRecollectedType.GYROSCOPE]
-    q1, q3 = np.percentile(data, [25, 75], axis=0)
-    gyro_iqr = q3 - q1
+def gyroscope_all_iqr_strategy(full_data: Mapping[DataRecollectedType, WindowStatistics]) -> bool:
+    gyro_iqr = full_data[DataRecollectedType.GYROSCOPE].iqr
     return bool(np.all(gyro_iqr < 5))  # TODO: use a config file to set the threshold
 
 
-def gyroscope_all_std_strategy(full_data: Mapping[DataRecollectedType, npt.NDArray[np.float64]]) -> bool:
-    data = full_data[DataRecollectedType.GYROSCOPE]
-    gyro_std = np.std(data, axis=0)
+def gyroscope_all_std_strategy(full_data: Mapping[DataRecollectedType, WindowStatistics]) -> bool:
+    gyro_std = full_data[DataRecollectedType.GYROSCOPE].std
     return bool(np.all(gyro_std < 1))  # TODO: use a config file to set the threshold
 
 
-def accelerometer_all_std_strategy(full_data: Mapping[DataRecollectedType, npt.NDArray[np.float64]]) -> bool:
-    data = full_data[DataRecollectedType.ACCELEROMETER]
-    accel_std = np.std(data, axis=0)
+def accelerometer_all_std_strategy(full_data: Mapping[DataRecollectedType, WindowStatistics]) -> bool:
+    accel_std = full_data[DataRecollectedType.ACCELEROMETER].std
     return bool(np.all(accel_std < 0.02))  # TODO: use a config file to set the threshold
 
 
-def accelerometer_all_iqr_strategy(full_data: Mapping[DataRecollectedType, npt.NDArray[np.float64]]) -> bool:
-    data = full_data[DataRecollectedType.ACCELEROMETER]
-    q1, q3 = np.percentile(data, [25, 75], axis=0)
-    accel_iqr = q3 - q1
+def accelerometer_all_iqr_strategy(full_data: Mapping[DataRecollectedType, WindowStatistics]) -> bool:
+    accel_iqr = full_data[DataRecollectedType.ACCELEROMETER].iqr
     logger.info(f"accel_iqr: {accel_iqr}")
     return bool(np.all(accel_iqr < 0.02))  # TODO: use a config file to set the threshold
 
 
+STUCK_STRATEGIES: Mapping[str, StuckStrategy] = {
+    "gyroscope_any_iqr": gyroscope_any_iqr_strategy,
+    "gyroscope_all_iqr": gyroscope_all_iqr_strategy,
+    "gyroscope_all_std": gyroscope_all_std_strategy,
+    "accelerometer_all_std": accelerometer_all_std_strategy,
+    "accelerometer_all_iqr": accelerometer_all_iqr_strategy,
+}
+
+
+class VotingPolicy(Enum):
+    ANY = 0
+    ALL = 1
+    MAJORITY = 2
+
+
+@dataclass
+class StuckVerdict:
+    """
+    Verdict of every stuck strategy and the composed decision of the voters
+    """
+    verdicts: Mapping[str, bool]
+    policy: VotingPolicy
+    is_stuck: bool
+
+
+def evaluate_stuck_strategies(statistics: Mapping[DataRecollectedType, WindowStatistics],
+                              policy: VotingPolicy = VotingPolicy[imu_values.STUCK_VOTING_POLICY],
+                              voters: Sequence[str] = imu_values.STUCK_VOTERS) -> StuckVerdict:
+    """
+    Evaluates every strategy in STUCK_STRATEGIES on the same statistics and combines the votes of the voters
+    :param statistics: the statistics of every sensor
+    :param policy: how the votes are combined
+    :param voters: name of the strategies that take part in the composed decision
+    :return: the verdict of every strategy and the composed one
+    """
+    verdicts = {name: strategy(statistics) for name, strategy in STUCK_STRATEGIES.items()}
+    votes = [verdicts[name] for name in voters]
+    if policy == VotingPolicy.ANY:
+        is_stuck = any(votes)
+    elif policy == VotingPolicy.ALL:
+        is_stuck = bool(votes) and all(votes)
+    else:
+        is_stuck = sum(votes) * 2 > len(votes)
+    return StuckVerdict(verdicts=verdicts, policy=policy, is_stuck=is_stuck)
+
+
+def _not_stuck_verdict(policy: VotingPolicy) -> StuckVerdict:
+    return StuckVerdict(verdicts={name: False for name in STUCK_STRATEGIES}, policy=policy, is_stuck=False)
+
+
 class IMUController(metaclass=Singleton):
     @abstractmethod
     def setup(self) -> None:
         pass
 
     @abstractmethod
-    def is_robot_stuck(self, strategy: Callable[[Mapping[DataRecollectedType, npt.NDArray[np.float64]]], bool]) -> bool:
+    def is_robot_stuck(self, strategy: StuckStrategy) -> bool:
+        pass
+
+    @abstractmethod
+    def evaluate_stuck(self, policy: VotingPolicy = VotingPolicy[imu_values.STUCK_VOTING_POLICY]) -> StuckVerdict:
+        """
+        Evaluates every stuck strategy once on the current window and composes their votes with the given policy
+        """
         pass
 
     def disable(self) -> None:
@@ -80,10 +147,14 @@ class IMUControllerMock(IMUController):
     def setup(self) -> None:
         logger.info("IMUControllerMock.setup() called")
 
-    def is_robot_stuck(self, strategy: Callable[[Mapping[DataRecollectedType, npt.NDArray[np.float64]]], bool]) -> bool:
+    def is_robot_stuck(self, strategy: StuckStrategy) -> bool:
         logger.info("IMUControllerMock.is_robot_stuck() called with strategy: " + str(strategy))
         return False
 
+    def evaluate_stuck(self, policy: VotingPolicy = VotingPolicy[imu_values.STUCK_VOTING_POLICY]) -> StuckVerdict:
+        logger.info("IMUControllerMock.evaluate_stuck() called with policy: " + policy.name)
+        return _not_stuck_verdict(policy)
+
     def disable(self) -> None:
         logger.info("IMUControllerMock.disable() called")
 
@@ -92,6 +163,25 @@ class IMUControllerMockRaspberry(IMUController):
     def __init__(self):
         super().__init__()
         logger.info("Instantiating Singleton IMUControllerRaspberry")
+        self.mpu = None
+
+        # the statistics of the window are updated after every sample instead of recomputed on every tick
+        self.data = {
+            DataRecollectedType.GYROSCOPE: RollingStatistics(NUM_SAMPLES, 3),
+            DataRecollectedType.ACCELEROMETER: RollingStatistics(NUM_SAMPLES, 3)
+        }
+        # statistics published by the sampler, they are replaced as a whole so readers never need a lock
+        self._snapshot: Optional[Mapping[DataRecollectedType, WindowStatistics]] = None
+        self._sample_period = 1 / imu_values.SAMPLE_RATE_HZ
+        self._sampler_thread: Optional[threading.Thread] = None
+        self._stop_sampler = threading.Event()
+
+    def setup(self) -> None:
+        # logger.info("IMUControllerRaspberry.setup() called")
+        from mpu9250_jmdev.mpu_9250 import MPU9250
+        from mpu9250_jmdev.registers import \
+            MPU9050_ADDRESS_68, GFS_1000, AFS_8G, AK8963_BIT_16, AK8963_MODE_C100HZ
+
         self.mpu = MPU9250(
             address_ak=0x68,
             address_mpu_master=MPU9050_ADDRESS_68,
@@ -102,34 +192,67 @@ class IMUControllerMockRaspberry(IMUController):
             mfs=AK8963_BIT_16,
             mode=AK8963_MODE_C100HZ
         )
-
-        # TODO: implement the static values from a config file
-        self.data = {
-            DataRecollectedType.GYROSCOPE: np.zeros(shape=(NUM_SAMPLES, 3)),
-            DataRecollectedType.ACCELEROMETER: np.zeros(shape=(NUM_SAMPLES, 3))
-        }
-        self._data_index = 0
-
-    def setup(self) -> None:
-        # logger.info("IMUControllerRaspberry.setup() called")
         self.mpu.calibrateMPU6500()
         time.sleep(1)
         self.mpu.configure()
-
-    def is_robot_stuck(self, strategy: Callable[[Mapping[DataRecollectedType, npt.NDArray[np.float64]]], bool]) -> bool:
-        # create a function that returns true if the robot is stuck
-
-        gyro = self.mpu.readGyroscopeMaster()
-        accel = self.mpu.readAccelerometerMaster()
-
-        # update current data
-        self.data[DataRecollectedType.GYROSCOPE][self._data_index] = gyro
-        self.data[DataRecollectedType.ACCELEROMETER][self._data_index] = accel
-        self._data_index = (self._data_index + 1) % NUM_SAMPLES  # TODO: use a config file to set the size of the array
-
-        return strategy(self.data)
+        self._start_sampler()
+
+    def _start_sampler(self) -> None:
+        # samples taken before a disable() do not belong to the new window
+        self.data = {data_type: RollingStatistics(NUM_SAMPLES, 3) for data_type in DataRecollectedType}
+        self._snapshot = None
+        self._stop_sampler.clear()
+        self._sampler_thread = threading.Thread(target=self._sample_loop, name="imu-sampler", daemon=True)
+        self._sampler_thread.start()
+
+    def _sample_loop(self) -> None:
+        mpu = self.mpu
+        if mpu is None:
+            logger.error("IMU is not initialized (Maybe call setup() first)")
+            return
+        next_sample_time = time.monotonic()
+        while not self._stop_sampler.is_set():
+            try:
+                gyro = mpu.readGyroscopeMaster()
+                accel = mpu.readAccelerometerMaster()
+            except OSError:
+                logger.exception("Failed to read the IMU, skipping sample")
+            else:
+                self.data[DataRecollectedType.GYROSCOPE].push(gyro)
+                self.data[DataRecollectedType.ACCELEROMETER].push(accel)
+                if self.data[DataRecollectedType.GYROSCOPE].is_full:
+                    self._snapshot = {
+                        data_type: WindowStatistics(std=data.std(), q1=data.percentile(25), q3=data.percentile(75))
+                        for data_type, data in self.data.items()
+                    }
+
+            # absolute deadlines keep the window length fixed even if a read is slow
+            next_sample_time += self._sample_period
+            delay = next_sample_time - time.monotonic()
+            if delay > 0:
+                self._stop_sampler.wait(delay)
+            else:
+                next_sample_time = time.monotonic()
+
+    def is_robot_stuck(self, strategy: StuckStrategy) -> bool:
+        # the sampler thread fills the window, here the strategy only evaluates the last published statistics
+        snapshot = self._snapshot
+        if snapshot is None:
+            # the window is not full yet, there is not enough data to say the robot is stuck
+            return False
+        return strategy(snapshot)
+
+    def evaluate_stuck(self, policy: VotingPolicy = VotingPolicy[imu_values.STUCK_VOTING_POLICY]) -> StuckVerdict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return _not_stuck_verdict(policy)
+        return evaluate_stuck_strategies(snapshot, policy)
 
     def disable(self) -> None:
+        self._stop_sampler.set()
+        if self._sampler_thread is not None:
+            self._sampler_thread.join()
+            self._sampler_thread = None
         logger.info("IMUControllerRaspberry.disable() called")
 
 
@@ -155,13 +278,10 @@ def main():
     imu_controller.setup()
     try:
         while True:
-            # print(f"stuck all iqr gyro: {imu_controller.is_robot_stuck(gyroscope_all_iqr_strategy)}") # best gyro
-            # print(f"stuck any iqr gyro: {imu_controller.is_robot_stuck(gyroscope_any_iqr_strategy)}")
-            # print(f"stuck all std gyro: {imu_controller.is_robot_stuck(gyroscope_all_std_strategy)}")
-            # print(f"stuck all std accel: {imu_controller.is_robot_stuck(accelerometer_all_std_strategy)}")
-            print(f"stuck all iqr accel: {imu_controller.is_robot_stuck(accelerometer_all_iqr_strategy)}")  # best accel
-            # TODO Implement a composed strategy
-            # - If the robot is stuck print it
+            # best gyro: gyroscope_all_iqr, best accel: accelerometer_all_iqr
+            verdict = imu_controller.evaluate_stuck(VotingPolicy.MAJORITY)
+            print(f"stuck: {verdict.is_stuck} ({verdict.policy.name}) {verdict.verdicts}")
+            # TODO
             # - Reconfigure mpu
             # - Validate again the variables
             time.sleep(0.1)
@@ -1,9 +1,11 @@
 import enum
 import logging
 import platform
+import threading
 import time
 from abc import abstractmethod
-from typing import Type, Mapping
+from dataclasses import dataclass
+from typing import Type, Mapping, Optional
 
 from RLP_TMR2023.hardware_controllers.singleton import Singleton
 
@@ -25,17 +27,78 @@ class MotorDirection(enum.Enum):
     BACKWARD = enum.auto()
 
 
+@dataclass(frozen=True)
+class MotorState:
+    direction: Optional[MotorDirection]  # None when the motor is stopped
+    speed: int
+
+
+STOPPED = MotorState(direction=None, speed=0)
+
+
 class MotorsControllers(metaclass=Singleton):
+    """
+    Keeps the last state commanded to every motor and only writes to the hardware when it changes, the behaviours
+    command the motors on every tick even when nothing changed. The motion executor and the behaviours command the
+    motors from different threads, so the comparison, the write and the update of the state are done under one lock:
+    otherwise the state could say a motor is stopped while it is still driving and every later stop() would be
+    suppressed.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._states: dict[MotorSide, MotorState] = {side: STOPPED for side in MotorSide}
+        self.writes_issued = 0
+        self.writes_suppressed = 0
+
     @abstractmethod
     def setup(self) -> None:
         pass
 
-    @abstractmethod
+    def _reset_state(self) -> None:
+        with self._lock:
+            self._states = {side: STOPPED for side in MotorSide}
+
+    def state(self, motor_side: MotorSide) -> MotorState:
+        with self._lock:
+            return self._states[motor_side]
+
     def stop(self) -> None:
+        with self._lock:
+            if all(state == STOPPED for state in self._states.values()):
+                self.writes_suppressed += len(self._states)
+                return
+            self._write_stop()
+            self._states = {side: STOPPED for side in MotorSide}
+            self.writes_issued += len(self._states)
+
+    def move(self, motor_side: MotorSide, speed: int, direction: MotorDirection) -> None:
+        new_state = MotorState(direction=direction, speed=speed)
+        with self._lock:
+            old_state = self._states[motor_side]
+            if new_state == old_state:
+                self.writes_suppressed += 1
+                return
+            self._write(motor_side, new_state, old_state)
+            self._states[motor_side] = new_state
+            self.writes_issued += 1
+
+    def move_both(self, left_speed: int, left_direction: MotorDirection,
+                  right_speed: int, right_direction: MotorDirection) -> None:
+        # both sides change together, a stop() from another thread can not land in between
+        with self._lock:
+            self.move(MotorSide.LEFT, left_speed, left_direction)
+            self.move(MotorSide.RIGHT, right_speed, right_direction)
+
+    @abstractmethod
+    def _write(self, motor_side: MotorSide, new_state: MotorState, old_state: MotorState) -> None:
+        """
+        Applies the new state to the motor, it is only called when it differs from the old one
+        """
         pass
 
     @abstractmethod
-    def move(self, motor_side: MotorSide, speed: int, direction: MotorDirection) -> None:
+    def _write_stop(self) -> None:
         pass
 
     @abstractmethod
@@ -54,12 +117,15 @@ class MotorsControllerMock(MotorsControllers):
 
     def setup(self) -> None:
         logger.info("MotorsControllerMock.setup() called")
+        self._reset_state()
 
-    def stop(self) -> None:
+    def _write_stop(self) -> None:
         logger.info("Stopping motors")
 
-    def move(self, motor_side: MotorSide, speed: int, direction: MotorDirection) -> None:
-        logger.info(f"Moving {motor_side.name} motors with speed: {speed} and direction {direction.name}")
+    def _write(self, motor_side: MotorSide, new_state: MotorState, old_state: MotorState) -> None:
+        assert new_state.direction is not None
+        logger.info(f"Moving {motor_side.name} motors with speed: {new_state.speed} and direction "
+                    f"{new_state.direction.name}")
 
     def disable(self) -> None:
         logger.info("Disabling motors")
@@ -97,8 +163,9 @@ class MotorsControllerRaspberry(MotorsControllers):
         duty_cycle = 0  # set dc variable to 0 for 0%
         self.pwm_motor_1.start(duty_cycle)  # Start PWM with 0% duty cycle
         self.pwm_motor_2.start(duty_cycle)
+        self._reset_state()
 
-    def stop(self) -> None:
+    def _write_stop(self) -> None:
         duty_cycle = 1
         self.pwm_motor_1.ChangeDutyCycle(duty_cycle)
         self.pwm_motor_2.ChangeDutyCycle(duty_cycle)
@@ -106,22 +173,24 @@ class MotorsControllerRaspberry(MotorsControllers):
         for pin in self._pin_dir_motor_1_input + self.pin_dir_motor_2_input:
             GPIO.output(pin, GPIO.LOW)
 
-    def move(self, motor_side: MotorSide, speed: int, direction: MotorDirection) -> None:
-        in_pin1 = GPIO.LOW
-        in_pin2 = GPIO.HIGH
-
-        if direction == MotorDirection.FORWARD:
-            in_pin1 = GPIO.HIGH
-            in_pin2 = GPIO.LOW
-
+    def _write(self, motor_side: MotorSide, new_state: MotorState, old_state: MotorState) -> None:
         if motor_side == MotorSide.LEFT:
-            GPIO.output(self._pin_dir_motor_1_input[0], in_pin1)
-            GPIO.output(self._pin_dir_motor_1_input[1], in_pin2)
-            self.pwm_motor_1.ChangeDutyCycle(speed)
+            pins_dir, pwm = self._pin_dir_motor_1_input, self.pwm_motor_1
         else:
-            GPIO.output(self.pin_dir_motor_2_input[0], in_pin1)
-            GPIO.output(self.pin_dir_motor_2_input[1], in_pin2)
-            self.pwm_motor_2.ChangeDutyCycle(speed)
+            pins_dir, pwm = self.pin_dir_motor_2_input, self.pwm_motor_2
+
+        if new_state.direction != old_state.direction:
+            in_pin1 = GPIO.LOW
+            in_pin2 = GPIO.HIGH
+            if new_state.direction == MotorDirection.FORWARD:
+                in_pin1 = GPIO.HIGH
+                in_pin2 = GPIO.LOW
+            GPIO.output(pins_dir[0], in_pin1)
+            GPIO.output(pins_dir[1], in_pin2)
+
+        # stop() leaves a 1% duty cycle, so the speed is always written when the motor starts again
+        if new_state.speed != old_state.speed or old_state.direction is None:
+            pwm.ChangeDutyCycle(new_state.speed)
 
     def disable(self) -> None:
         self.stop()
@@ -147,20 +216,19 @@ def main() -> None:
     motors.setup()
     try:
         while True:
-            motors.move(MotorSide.RIGHT, 100, MotorDirection.FORWARD)
-            motors.move(MotorSide.LEFT, 100, MotorDirection.FORWARD)
+            motors.move_both(100, MotorDirection.FORWARD, 100, MotorDirection.FORWARD)
             time.sleep(1.2)
 
             motors.stop()
             time.sleep(1)
 
-            motors.move(MotorSide.RIGHT, 100, MotorDirection.BACKWARD)
-            motors.move(MotorSide.LEFT, 100, MotorDirection.BACKWARD)
+            motors.move_both(100, MotorDirection.BACKWARD, 100, MotorDirection.BACKWARD)
             time.sleep(1.2)
 
             motors.stop()
             time.sleep(1)
     except KeyboardInterrupt:
+        logger.info(f"{motors.writes_issued} motor writes issued, {motors.writes_suppressed} suppressed")
         motors.disable()
         logger.info("Program stopped by user")
 
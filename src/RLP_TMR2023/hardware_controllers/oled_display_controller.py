@@ -1,23 +1,19 @@
+import dataclasses
 import logging
 import platform
+import threading
 import time
 from abc import abstractmethod
 from dataclasses import dataclass
 from importlib.resources import path
 from typing import Type, Mapping, Optional
 
+from RLP_TMR2023.constants import oled_values
 from RLP_TMR2023.hardware_controllers import fonts
 from RLP_TMR2023.hardware_controllers.singleton import Singleton
 
 logger = logging.getLogger(__name__)
 
-try:
-    import busio
-    from board import SCL, SDA
-    import adafruit_ssd1306
-except ImportError:
-    logger.warning("Could not import busio, board, adafruit_ssd1306. This is expected when running on a computer")
-
 
 @dataclass
 class DisplayMessage:
@@ -32,29 +28,114 @@ def get_default_font() -> str:
         return str(font_path)
 
 
+class BitmapFontRenderer:
+    """
+    Rasterises lines of text with a framebuf bitmap font straight into the bytes of a display page (one byte per
+    column, least significant bit on top), the same pixels framebuf.text() draws for a line that starts on a page.
+    The columns of every character are cached the first time it is drawn.
+    """
+
+    def __init__(self, font_file: str, width: int) -> None:
+        with open(font_file, "rb") as file:
+            data = file.read()
+        self._font_width = data[0]
+        self._font_height = data[1]
+        if self._font_height != 8:
+            raise ValueError("Only fonts 8 pixels high fit in a display page")
+        self._font_data = data[2:]
+        self._width = width
+        self._glyphs: dict[str, bytes] = {}
+
+    def glyph(self, char: str) -> bytes:
+        """
+        Columns of a character followed by the blank column that separates it from the next one
+        """
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            start = ord(char) * self._font_width
+            columns = self._font_data[start:start + self._font_width]
+            if len(columns) < self._font_width:
+                # characters outside the font are left blank
+                columns = bytes(self._font_width)
+            glyph = self._glyphs[char] = columns + b"\x00"
+        return glyph
+
+    def render_line(self, text: str) -> bytes:
+        line = b"".join(self.glyph(char) for char in text)[:self._width]
+        return line.ljust(self._width, b"\x00")
+
+
 class OLEDDisplayController(metaclass=Singleton):
+    """
+    The messages are drawn by a background thread at most OLED_MAX_FPS times per second, update_message only stores
+    the new text so the behaviour tree never waits for the display
+    """
+
     def __init__(self):
         self._display_message = DisplayMessage()
+        self._condition = threading.Condition()
+        self._pending = False
+        self._stop_rendering = False
+        self._render_thread: Optional[threading.Thread] = None
+        self._render_period = 1 / oled_values.OLED_MAX_FPS
+        self.renders = 0
 
     @abstractmethod
     def setup(self) -> None:
         pass
 
+    def _start_render_thread(self) -> None:
+        if self._render_thread is not None:
+            return
+        self._stop_rendering = False
+        self._render_thread = threading.Thread(target=self._render_loop, name="oled-render", daemon=True)
+        self._render_thread.start()
+
+    def _stop_render_thread(self) -> None:
+        """
+        Draws the pending message and stops the thread
+        """
+        if self._render_thread is None:
+            return
+        with self._condition:
+            self._stop_rendering = True
+            self._condition.notify_all()
+        self._render_thread.join()
+        self._render_thread = None
+
+    def _render_loop(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stop_rendering)
+                if not self._pending:
+                    break
+                message = dataclasses.replace(self._display_message)
+                self._pending = False
+            try:
+                self._display(message)
+            except Exception:
+                logger.exception("Could not draw the message on the display")
+            self.renders += 1
+            # the updates that arrive while waiting are drawn together in the next frame
+            with self._condition:
+                self._condition.wait_for(lambda: self._stop_rendering, timeout=self._render_period)
+
     def update_message(self, state: Optional[str] = None, substate: Optional[str] = None, message: Optional[str] = None,
                        debug: Optional[str] = None) -> None:
-        if state is not None:
-            self._display_message.state = state
-        if substate is not None:
-            self._display_message.substate = substate
-        if message is not None:
-            self._display_message.message = message
-        if debug is not None:
-            self._display_message.debug = debug
-
-        self._display()
+        with self._condition:
+            if state is not None:
+                self._display_message.state = state
+            if substate is not None:
+                self._display_message.substate = substate
+            if message is not None:
+                self._display_message.message = message
+            if debug is not None:
+                self._display_message.debug = debug
+            self._pending = True
+            self._condition.notify_all()
 
     @abstractmethod
-    def _display(self) -> None:
+    def _display(self, message: DisplayMessage) -> None:
         pass
 
     def clear(self) -> None:
@@ -76,32 +157,54 @@ class OLEDDisplayControllerMock(OLEDDisplayController):
 
     def setup(self) -> None:
         logger.info("OLEDDisplayControllerMock.setup() called")
+        self._start_render_thread()
 
-    def _display(self) -> None:
-        logger.info(f"Displaying text: {self._display_message}")
+    def _display(self, message: DisplayMessage) -> None:
+        logger.info(f"Displaying text: {message}")
 
     def disable(self) -> None:
+        self._stop_render_thread()
         logger.info("Disabling OLEDDisplayControllerMock")
 
 
 class OLEDDisplayControllerRaspberry(OLEDDisplayController):
     def setup(self) -> None:
-        i2c = busio.I2C(SCL, SDA)
-        self._oled_display = adafruit_ssd1306.SSD1306_I2C(128, 32, i2c)
-        self._font = get_default_font()
+        # the adafruit stack is slow to import and only exists on the robot
+        import adafruit_ssd1306
+        import busio
+        from board import SCL, SDA
 
-        self.clear()
+        i2c = busio.I2C(SCL, SDA)
+        self._oled_display = adafruit_ssd1306.SSD1306_I2C(oled_values.OLED_WIDTH, oled_values.OLED_HEIGHT, i2c)
+        self._renderer = BitmapFontRenderer(get_default_font(), oled_values.OLED_WIDTH)
+        # every line of text is drawn on its own page of 8 pixel rows
+        self._lines: list[Optional[str]] = [None] * (oled_values.OLED_HEIGHT // 8)
+        self.skipped_shows = 0
 
-    def _display(self) -> None:
         self._oled_display.fill(0)
-        self._oled_display.text(self._display_message.state, 0, 0, 1, font_name=self._font)
-        self._oled_display.text(self._display_message.substate, 0, 8, 1, font_name=self._font)
-        self._oled_display.text(self._display_message.message, 0, 16, 1, font_name=self._font)
-        self._oled_display.text(self._display_message.debug, 0, 24, 1, font_name=self._font)
         self._oled_display.show()
+        self._start_render_thread()
+        self.clear()
+
+    def _display(self, message: DisplayMessage) -> None:
+        changed = False
+        for page, text in enumerate((message.state, message.substate, message.message, message.debug)):
+            if text == self._lines[page]:
+                continue
+            start = page * oled_values.OLED_WIDTH
+            # buf is the framebuffer without the I2C control byte
+            self._oled_display.buf[start:start + oled_values.OLED_WIDTH] = self._renderer.render_line(text)
+            self._lines[page] = text
+            changed = True
+
+        if changed:
+            self._oled_display.show()
+        else:
+            self.skipped_shows += 1
 
     def disable(self) -> None:
-        self.update_message(state="", substate="", message="", debug="")
+        self.clear()
+        self._stop_render_thread()
 
 
 def oled_display_controller_factory(architecture: str) -> OLEDDisplayController:
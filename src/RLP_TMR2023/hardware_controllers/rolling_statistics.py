@@ -0,0 +1,98 @@
+"""
+This class keeps the statistics of a sliding window of samples up to date after every push, so reading them does not
+depend on the size of the window.
+"""
+import bisect
+import math
+
+import numpy as np
+import numpy.typing as npt
+
+
+class RollingStatistics:
+    """
+    Sliding window of multi column samples. The mean and the variance are updated with Welford's algorithm (adding the
+    new sample and removing the oldest one) and every column is kept in a sorted list, so any percentile is available
+    after each push without sorting the window.
+    """
+
+    def __init__(self, window_size: int, columns: int) -> None:
+        if window_size < 1:
+            raise ValueError("The window needs at least one sample")
+        self._window_size = window_size
+        self._window = np.zeros((window_size, columns), dtype=np.float64)
+        self._index = 0
+        self._count = 0
+        self._pushes_since_resync = 0
+
+        self._mean = np.zeros(columns, dtype=np.float64)
+        self._m2 = np.zeros(columns, dtype=np.float64)
+        self._sorted: list[list[float]] = [[] for _ in range(columns)]
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def is_full(self) -> bool:
+        return self._count == self._window_size
+
+    def push(self, sample: npt.ArrayLike) -> None:
+        new = np.asarray(sample, dtype=np.float64)
+        if self.is_full:
+            old = self._window[self._index].copy()
+            mean = self._mean + (new - old) / self._count
+            self._m2 += (new - old) * (new - mean + old - self._mean)
+            self._mean = mean
+            for column, (old_value, new_value) in enumerate(zip(old.tolist(), new.tolist())):
+                values = self._sorted[column]
+                del values[bisect.bisect_left(values, old_value)]
+                bisect.insort(values, new_value)
+        else:
+            self._count += 1
+            delta = new - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (new - self._mean)
+            for column, new_value in enumerate(new.tolist()):
+                bisect.insort(self._sorted[column], new_value)
+
+        self._window[self._index] = new
+        self._index = (self._index + 1) % self._window_size
+
+        # removing samples accumulates rounding errors, recompute from scratch once per window (O(1) amortized)
+        self._pushes_since_resync += 1
+        if self._pushes_since_resync >= self._window_size and self.is_full:
+            self._pushes_since_resync = 0
+            self._mean = self._window.mean(axis=0)
+            self._m2 = ((self._window - self._mean) ** 2).sum(axis=0)
+
+    def mean(self) -> npt.NDArray[np.float64]:
+        return self._mean.copy()
+
+    def std(self) -> npt.NDArray[np.float64]:
+        """
+        Population standard deviation of every column, the same as np.std(window, axis=0)
+        """
+        if self._count == 0:
+            return np.zeros_like(self._mean)
+        return np.sqrt(np.maximum(self._m2, 0) / self._count)  # type: ignore
+
+    def percentile(self, q: float) -> npt.NDArray[np.float64]:
+        """
+        Percentile of every column with linear interpolation, the same as np.percentile(window, q, axis=0)
+        """
+        if self._count == 0:
+            return np.zeros_like(self._mean)
+        position = q / 100 * (self._count - 1)
+        lower = math.floor(position)
+        upper = min(lower + 1, self._count - 1)
+        fraction = position - lower
+        return np.array([values[lower] + (values[upper] - values[lower]) * fraction for values in self._sorted])
+
+    def window(self) -> npt.NDArray[np.float64]:
+        """
+        Copy of the samples in the window, oldest first
+        """
+        if not self.is_full:
+            return self._window[:self._count].copy()
+        return np.roll(self._window, -self._index, axis=0)
@@ -1,23 +1,18 @@
 import enum
 import logging
 import platform
+import queue
 import threading
 from abc import abstractmethod
-from typing import Type, Mapping
-
-from adafruit_motor import servo
-
-try:
-    import busio
-    from adafruit_pca9685 import PCA9685
-    from board import SCL, SDA
-except ImportError:
-    logger = logging.getLogger(__name__)
-    logger.warning("Adafruit libraries not installed. Servos will not work")
+from dataclasses import dataclass, field
+from typing import Type, Mapping, Optional, TYPE_CHECKING
 
 from RLP_TMR2023.constants import servos_values
 from RLP_TMR2023.hardware_controllers.singleton import Singleton
 
+if TYPE_CHECKING:
+    from adafruit_motor import servo
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,11 +27,20 @@ class ServoStatus(enum.Enum):
     RETRACTED = enum.auto()
 
 
+@dataclass
+class ServoMove:
+    servo_pair: ServoPair
+    status: ServoStatus
+    angle: int
+    done: threading.Event = field(default_factory=threading.Event)
+    succeeded: bool = False
+
+
 class ServosController(metaclass=Singleton):
 
     def __init__(self):
         super().__init__()
-        self._servos_status = {
+        self._servos_status: dict[ServoPair, Optional[ServoStatus]] = {
             ServoPair.ARM: ServoStatus.RETRACTED,
             ServoPair.CLAW: ServoStatus.RETRACTED,
             ServoPair.TRAY: ServoStatus.RETRACTED,
@@ -69,12 +73,15 @@ class ServosController(metaclass=Singleton):
         pass
 
     @abstractmethod
-    def disable(self) -> None:
+    def queue_move(self, servo_pair: ServoPair, status: ServoStatus) -> None:
+        """
+        Same as move but returns right away, the moves are applied in the order they were queued
+        """
         pass
 
-    @staticmethod
-    def _move_servo(servo: servo.Servo, angle: int) -> None:
-        servo.angle = angle
+    @abstractmethod
+    def disable(self) -> None:
+        pass
 
 
 class ServosControllerMock(ServosController):
@@ -95,13 +102,12 @@ class ServosControllerMock(ServosController):
 
     def toggle(self, servo_pair: ServoPair) -> None:
         if self._servos_status[servo_pair] == ServoStatus.RETRACTED:
-            self._servos_status[servo_pair] = ServoStatus.EXPANDED
+            status = ServoStatus.EXPANDED
         else:
-            self._servos_status[servo_pair] = ServoStatus.RETRACTED
-        logger.info(f"moving to {self._servos_values[servo_pair][self._servos_status[servo_pair]]}")
-        logger.info(
-            f"Servo {servo_pair.name} moved to {self._servos_values[servo_pair][self._servos_status[servo_pair]]}°"
-            f" is now {self._servos_status[servo_pair].name}")
+            status = ServoStatus.RETRACTED
+        self._servos_status[servo_pair] = status
+        logger.info(f"moving to {self._servos_values[servo_pair][status]}")
+        logger.info(f"Servo {servo_pair.name} moved to {self._servos_values[servo_pair][status]}° is now {status.name}")
 
     def move(self, servo_pair: ServoPair, status: ServoStatus, bypass_check: bool = False) -> None:
         # Check if the servo is already in the correct position
@@ -110,9 +116,10 @@ class ServosControllerMock(ServosController):
             return
         # Change the status of the servo
         self._servos_status[servo_pair] = status
-        logger.info(
-            f"Servo {servo_pair.name} moved to {self._servos_values[servo_pair][self._servos_status[servo_pair]]}°"
-            f" is now {self._servos_status[servo_pair].name}")
+        logger.info(f"Servo {servo_pair.name} moved to {self._servos_values[servo_pair][status]}° is now {status.name}")
+
+    def queue_move(self, servo_pair: ServoPair, status: ServoStatus) -> None:
+        self.move(servo_pair, status)
 
     def disable(self) -> None:
         logger.info("ServosControllerMock.disable() called")
@@ -123,19 +130,37 @@ class ServosControllerRaspberry(ServosController):
         super().__init__()
         self._pca = None
         self._i2c = None
-        self._servos_status = {
-            ServoPair.ARM: ServoStatus.RETRACTED,
-            ServoPair.CLAW: ServoStatus.RETRACTED,
-            ServoPair.TRAY: ServoStatus.RETRACTED,
-        }
+        # a status is None when a write failed and the position of the pair is unknown, so the next move is never
+        # skipped
+        self._status_lock = threading.Lock()
+        self._servos: dict[ServoPair, tuple["servo.Servo", "servo.Servo"]] = {}
+        self._moves: queue.Queue[Optional[ServoMove]] = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self.failed_moves = 0
 
     def setup(self) -> None:
+        # the adafruit stack is slow to import and only exists on the robot
+        import busio
+        from adafruit_motor import servo
+        from adafruit_pca9685 import PCA9685
+        from board import SCL, SDA
+
         self._i2c = busio.I2C(SCL, SDA)
         self._pca = PCA9685(self._i2c)
         self._pca.frequency = servos_values.PCA9685_FREQUENCY
+        self._servos = {
+            servo_pair: (servo.Servo(self._pca.channels[servo_pair.value[0]]),
+                         servo.Servo(self._pca.channels[servo_pair.value[1]]))
+            for servo_pair in ServoPair
+        }
+        self._start_worker()
+
+    def _start_worker(self) -> None:
+        self._worker = threading.Thread(target=self._run, name="servos-worker", daemon=True)
+        self._worker.start()
 
         # verify that the servos are in the correct position
-        for servo_pair, _ in self._servos_status.items():
+        for servo_pair in ServoPair:
             self.move(servo_pair, ServoStatus.RETRACTED, bypass_check=True)
 
     def toggle(self, servo_pair: ServoPair) -> None:
@@ -147,31 +172,57 @@ class ServosControllerRaspberry(ServosController):
         self.move(servo_pair, status)
 
     def move(self, servo_pair: ServoPair, status: ServoStatus, bypass_check: bool = False) -> None:
-        if not bypass_check and self._servos_status[servo_pair] == status:
+        servo_move = self._enqueue(servo_pair, status, bypass_check)
+        if servo_move is None:
             return
-        s1, s2 = self._get_servos(servo_pair)
-        angle_1 = self._servos_values[servo_pair][status]
-        angle_2 = 180 - angle_1
-        t1 = threading.Thread(target=self._move_servo, args=(s1, angle_1))
-        t2 = threading.Thread(target=self._move_servo, args=(s2, angle_2))
-        t1.start()
-        t2.start()
-        t1.join()
-        t2.join()
-        print(angle_1, angle_2)  # TODO: remove all prints in this file
-        print(self._servos_status[servo_pair].name)
-        self._servos_status[servo_pair] = status
+        if not servo_move.done.wait(timeout=servos_values.MOVE_TIMEOUT_SECONDS):
+            logger.error(f"Timed out waiting for servo {servo_pair.name} to move")
 
-    def _get_servos(self, servo_pair: ServoPair) -> tuple[servo.Servo, servo.Servo]:
-        if self._pca is None:
+    def queue_move(self, servo_pair: ServoPair, status: ServoStatus) -> None:
+        self._enqueue(servo_pair, status, bypass_check=False)
+
+    def _enqueue(self, servo_pair: ServoPair, status: ServoStatus, bypass_check: bool) -> Optional[ServoMove]:
+        if self._worker is None:
             raise RuntimeError("ServosControllerRaspberry.setup() must be called before using the servos")
-        s1 = servo.Servo(self._pca.channels[servo_pair.value[0]])
-        s2 = servo.Servo(self._pca.channels[servo_pair.value[1]])
-        return s1, s2
+        with self._status_lock:
+            # the status is the target of the last queued move, so queueing the same move twice does nothing
+            if not bypass_check and self._servos_status[servo_pair] == status:
+                return None
+            servo_move = ServoMove(servo_pair=servo_pair, status=status,
+                                   angle=self._servos_values[servo_pair][status])
+            self._servos_status[servo_pair] = status
+            self._moves.put(servo_move)
+        return servo_move
+
+    def _run(self) -> None:
+        while True:
+            servo_move = self._moves.get()
+            if servo_move is None:
+                break
+            try:
+                # both channels are written back to back so the two servos of the pair move together
+                s1, s2 = self._servos[servo_move.servo_pair]
+                s1.angle = servo_move.angle
+                s2.angle = 180 - servo_move.angle
+                servo_move.succeeded = True
+                logger.debug(f"Servo {servo_move.servo_pair.name} moved to {servo_move.angle}°")
+            except Exception:
+                self.failed_moves += 1
+                logger.exception(f"Could not move servo {servo_move.servo_pair.name} to {servo_move.angle}°")
+                with self._status_lock:
+                    # unless a newer move is queued the position is unknown, the next move must not be skipped
+                    if self._servos_status[servo_move.servo_pair] == servo_move.status:
+                        self._servos_status[servo_move.servo_pair] = None
+            finally:
+                servo_move.done.set()
 
     def disable(self) -> None:
-        """ Servos don't need to be disabled on the Raspberry Pi """
-        pass
+        """ Waits for the queued moves and stops the worker, the servos keep their position """
+        if self._worker is None:
+            return
+        self._moves.put(None)
+        self._worker.join()
+        self._worker = None
 
 
 def servos_controller_factory(architecture: str) -> ServosController:
@@ -1,6 +1,8 @@
+import cv2
 import numpy as np
 import numpy.typing as npt
 
+from RLP_TMR2023.common_types.common_types import BoundingBox
 from RLP_TMR2023.image_processing.image_filtering import otsu_filtering
 
 
@@ -8,3 +10,25 @@ def get_area_of_can(image: npt.NDArray[np.uint8]) -> int:
     otsu_filtered = otsu_filtering(image)
 
     return np.count_nonzero(otsu_filtered)
+
+
+def get_area_of_can_in_box(blurred_grey: npt.NDArray[np.uint8], bounding_box: BoundingBox) -> int:
+    """
+    Counts the pixels of the can inside a bounding box, the Otsu threshold is calculated only with the pixels of the
+    box so every detection gets its own area
+
+    :param blurred_grey: The blurred grey plane of the whole frame (see Frame.blurred)
+    :param bounding_box: The bounding box of the detection
+    :return: The number of pixels that belong to the can
+    """
+    frame_height, frame_width = blurred_grey.shape[:2]
+    x_start, y_start = max(bounding_box.x, 0), max(bounding_box.y, 0)
+    x_end = min(bounding_box.x + bounding_box.width, frame_width)
+    y_end = min(bounding_box.y + bounding_box.height, frame_height)
+    if x_end <= x_start or y_end <= y_start:
+        return 0
+
+    roi = blurred_grey[y_start:y_end, x_start:x_end]
+    otsu_filtered = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+    return int(np.count_nonzero(otsu_filtered))
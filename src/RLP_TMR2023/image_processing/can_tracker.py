@@ -0,0 +1,91 @@
+from typing import Optional
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from RLP_TMR2023.common_types.common_types import BoundingBox
+
+# smaller templates match almost anywhere
+_MIN_TEMPLATE_SIZE = 4
+
+
+def _clip_box(bounding_box: BoundingBox, frame_height: int, frame_width: int) -> Optional[tuple[int, int, int, int]]:
+    x_start, y_start = max(bounding_box.x, 0), max(bounding_box.y, 0)
+    x_end = min(bounding_box.x + bounding_box.width, frame_width)
+    y_end = min(bounding_box.y + bounding_box.height, frame_height)
+    if x_end - x_start < _MIN_TEMPLATE_SIZE or y_end - y_start < _MIN_TEMPLATE_SIZE:
+        return None
+    return x_start, y_start, x_end, y_end
+
+
+class TemplateTracker:
+    """
+    Follows a detected object between detections by matching the grey template of its bounding box in a window
+    around its last position. Only the pixels of the window are converted to grey, so an update costs a fraction of
+    a detection. The template is not refreshed while tracking, the next detection anchors it again.
+    """
+
+    def __init__(self, search_margin: float, min_score: float) -> None:
+        self._search_margin = search_margin
+        self._min_score = min_score
+        self._template: Optional[npt.NDArray[np.uint8]] = None
+        self._bounding_box: Optional[BoundingBox] = None
+        self.score = 0.0
+
+    @property
+    def is_tracking(self) -> bool:
+        return self._template is not None
+
+    @property
+    def bounding_box(self) -> Optional[BoundingBox]:
+        return self._bounding_box
+
+    def start(self, rgb_image: npt.NDArray[np.uint8], bounding_box: BoundingBox) -> bool:
+        """
+        Takes the template of the object from the frame it was detected in
+        :return: False if the box is too small or outside the frame
+        """
+        self.reset()
+        box = _clip_box(bounding_box, *rgb_image.shape[:2])
+        if box is None:
+            return False
+        x_start, y_start, x_end, y_end = box
+        self._template = cv2.cvtColor(rgb_image[y_start:y_end, x_start:x_end], cv2.COLOR_RGB2GRAY)  # type: ignore
+        self._bounding_box = BoundingBox(x=x_start, y=y_start, width=x_end - x_start, height=y_end - y_start)
+        self.score = 1.0
+        return True
+
+    def update(self, rgb_image: npt.NDArray[np.uint8]) -> Optional[BoundingBox]:
+        """
+        Looks for the object in a new frame
+        :return: the new bounding box or None if the object was lost, in that case tracking stops
+        """
+        if self._template is None or self._bounding_box is None:
+            return None
+        frame_height, frame_width = rgb_image.shape[:2]
+        box = self._bounding_box
+        margin_x = int(box.width * self._search_margin)
+        margin_y = int(box.height * self._search_margin)
+        x_start, y_start = max(box.x - margin_x, 0), max(box.y - margin_y, 0)
+        x_end = min(box.x + box.width + margin_x, frame_width)
+        y_end = min(box.y + box.height + margin_y, frame_height)
+        template_height, template_width = self._template.shape
+        if x_end - x_start < template_width or y_end - y_start < template_height:
+            self.reset()
+            return None
+
+        window = cv2.cvtColor(rgb_image[y_start:y_end, x_start:x_end], cv2.COLOR_RGB2GRAY)
+        matches = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, self.score, _, (match_x, match_y) = cv2.minMaxLoc(matches)
+        if self.score < self._min_score:
+            self.reset()
+            return None
+        self._bounding_box = BoundingBox(x=x_start + match_x, y=y_start + match_y, width=template_width,
+                                         height=template_height)
+        return self._bounding_box
+
+    def reset(self) -> None:
+        self._template = None
+        self._bounding_box = None
+        self.score = 0.0
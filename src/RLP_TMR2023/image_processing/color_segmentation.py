@@ -0,0 +1,62 @@
+from typing import Mapping, Sequence
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from RLP_TMR2023.constants.color_filters import COLOR_RANGES, FILTER_KERNEL_SIZE
+from RLP_TMR2023.image_processing.image_filtering import get_kernel
+
+
+class ColorSegmenter:
+    """
+    Produces the mask of every configured colour from a single HSV conversion. The masks are written into buffers
+    that are allocated once per frame size, so they are overwritten by the next call to segment().
+    """
+
+    def __init__(self, color_ranges: Mapping[str, tuple[Sequence[int], Sequence[int]]] = COLOR_RANGES,
+                 kernel_size: int = FILTER_KERNEL_SIZE) -> None:
+        self._color_ranges = {
+            name: (np.array(lower, dtype=np.uint8), np.array(upper, dtype=np.uint8))
+            for name, (lower, upper) in color_ranges.items()
+        }
+        self._kernel = get_kernel(kernel_size)
+
+        self._hsv = np.empty((0, 0, 3), dtype=np.uint8)
+        self._in_range = np.empty((0, 0), dtype=np.uint8)
+        self._opened = np.empty((0, 0), dtype=np.uint8)
+        self._masks: dict[str, npt.NDArray[np.uint8]] = {}
+
+    def _allocate(self, shape: tuple[int, ...]) -> None:
+        height, width = shape[:2]
+        if self._in_range.shape == (height, width):
+            return
+        self._hsv = np.empty((height, width, 3), dtype=np.uint8)
+        self._in_range = np.empty((height, width), dtype=np.uint8)
+        self._opened = np.empty((height, width), dtype=np.uint8)
+        self._masks = {name: np.empty((height, width), dtype=np.uint8) for name in self._color_ranges}
+
+    def segment(self, bgr_image: npt.NDArray[np.uint8]) -> Mapping[str, npt.NDArray[np.uint8]]:
+        """
+        Converts the image to HSV once and filters every configured colour
+
+        :param bgr_image: The image to segment
+        :return: The filtered mask of every colour
+        """
+        self._allocate(bgr_image.shape)
+        cv2.cvtColor(bgr_image, cv2.COLOR_BGR2HSV, dst=self._hsv)
+        return self.segment_hsv(self._hsv)
+
+    def segment_hsv(self, hsv_image: npt.NDArray[np.uint8]) -> Mapping[str, npt.NDArray[np.uint8]]:
+        """
+        Filters every configured colour of an image that is already in HSV (see Frame.hsv)
+
+        :param hsv_image: The HSV image to segment
+        :return: The filtered mask of every colour
+        """
+        self._allocate(hsv_image.shape)
+        for name, (lower, upper) in self._color_ranges.items():
+            cv2.inRange(hsv_image, lower, upper, dst=self._in_range)
+            cv2.morphologyEx(self._in_range, cv2.MORPH_OPEN, self._kernel, dst=self._opened)
+            cv2.dilate(self._opened, self._kernel, dst=self._masks[name], iterations=1)
+        return self._masks
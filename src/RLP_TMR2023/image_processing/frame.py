@@ -0,0 +1,62 @@
+from functools import cached_property
+from typing import Optional
+
+import cv2
+import numpy as np
+import numpy.typing as npt
+
+from RLP_TMR2023.common_types.common_types import BoundingBox
+
+
+class Frame:
+    """
+    A captured RGB frame and the colour planes derived from it. Every plane is computed the first time it is
+    requested and then shared by every function and thread that works on the same frame, so each colour space is
+    converted at most once per frame. Frames are passed around by reference: the pixels must not be modified.
+    """
+
+    def __init__(self, rgb: npt.NDArray[np.uint8], timestamp: float = 0.0, sequence: int = -1) -> None:
+        self.rgb = rgb
+        self.timestamp = timestamp
+        self.sequence = sequence
+
+    @property
+    def height(self) -> int:
+        return int(self.rgb.shape[0])
+
+    @property
+    def width(self) -> int:
+        return int(self.rgb.shape[1])
+
+    @cached_property
+    def bgr(self) -> npt.NDArray[np.uint8]:
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2BGR)  # type: ignore
+
+    @cached_property
+    def hsv(self) -> npt.NDArray[np.uint8]:
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2HSV)  # type: ignore
+
+    @cached_property
+    def grey(self) -> npt.NDArray[np.uint8]:
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)  # type: ignore
+
+    @cached_property
+    def blurred(self) -> npt.NDArray[np.uint8]:
+        """
+        Grey plane with the same gaussian blur used by otsu_filtering
+        """
+        return cv2.GaussianBlur(self.grey, (5, 5), 0)  # type: ignore
+
+    def crop(self, bounding_box: BoundingBox, plane: Optional[npt.NDArray[np.uint8]] = None) -> \
+            npt.NDArray[np.uint8]:
+        """
+        Returns the region of a bounding box clipped to the frame, the result is a view so nothing is copied
+        :param bounding_box: x and width are columns, y and height are rows
+        :param plane: one of the planes of this frame, the RGB one by default
+        """
+        if plane is None:
+            plane = self.rgb
+        x_start, y_start = max(bounding_box.x, 0), max(bounding_box.y, 0)
+        x_end = max(min(bounding_box.x + bounding_box.width, self.width), x_start)
+        y_end = max(min(bounding_box.y + bounding_box.height, self.height), y_start)
+        return plane[y_start:y_end, x_start:x_end]
@@ -1,8 +1,14 @@
+from functools import lru_cache
+from typing import Sequence
+
 import cv2
 import numpy as np
 import numpy.typing as npt
 
+from RLP_TMR2023.constants.color_filters import COLOR_RANGES, FILTER_KERNEL_SIZE
+from RLP_TMR2023.constants.water_detection_values import WATER_HORIZON_BANDS, WATER_DECIMATION
 from RLP_TMR2023.image_processing.blue_filter import blue_filter
+from RLP_TMR2023.image_processing.color_segmentation import ColorSegmenter
 
 
 def trimmer_image(image: npt.NDArray[np.uint8], percentage_trimmed: int) -> npt.NDArray[np.uint8]:
@@ -10,21 +16,64 @@ def trimmer_image(image: npt.NDArray[np.uint8], percentage_trimmed: int) -> npt.
     Cut the image to only show the blue part
 
     """
-    percentage_crop = int(percentage_trimmed * 480 / 100)
+    height = image.shape[0]
+    percentage_crop = int(percentage_trimmed * height / 100)
     blue_image = blue_filter(image)
-    cropped_image = blue_image[percentage_crop:480, 0:640]
-    return cropped_image  # type: ignore
+    # the mask of blue_filter is reused by its next call
+    cropped_image = blue_image[percentage_crop:height, :].copy()
+    return cropped_image
+
+
+@lru_cache(maxsize=None)
+def _water_segmenter(kernel_size: int) -> ColorSegmenter:
+    """
+    Blue segmenter for a kernel size, created once so its buffers are reused by every call of water_coverage
+    """
+    return ColorSegmenter({"blue": COLOR_RANGES["blue"]}, kernel_size=kernel_size)
+
+
+def water_coverage(image: npt.NDArray[np.uint8], horizon_bands: Sequence[float] = WATER_HORIZON_BANDS,
+                   decimation: int = WATER_DECIMATION) -> list[float]:
+    """
+    Estimate which fraction of each horizon band is water. The image is cropped to the highest band and decimated
+    before any filtering, and every band is measured from the same mask using cumulative row counts
+
+    :param image: The BGR image
+    :param horizon_bands: Fraction of the image height where each band starts, every band ends at the bottom
+    :param decimation: Only one of every `decimation` rows and columns is filtered
+    :return: The fraction (0 to 1) of water pixels in each band, in the same order as horizon_bands
+    """
+    height = image.shape[0]
+    top = int(min(horizon_bands) * height)
+    # slicing is a view, so the crop and the decimation do not copy any pixel
+    region = image[top::decimation, ::decimation]
+
+    # the kernel shrinks with the decimation so it covers the same area of the full resolution image
+    mask = _water_segmenter(max(1, FILTER_KERNEL_SIZE // decimation)).segment(region)["blue"]
+
+    rows, columns = mask.shape
+    # water_below[r] is the number of water pixels from row r to the bottom of the region
+    water_below = np.zeros(rows + 1, dtype=np.int64)
+    water_below[:rows] = np.cumsum(np.count_nonzero(mask, axis=1)[::-1])[::-1]
+
+    coverages = []
+    for band_start in horizon_bands:
+        first_row = min(rows, -(-(int(band_start * height) - top) // decimation))
+        band_pixels = (rows - first_row) * columns
+        coverages.append(float(water_below[first_row] / band_pixels) if band_pixels else 0.0)
+    return coverages
 
 
 def check_water_percentage(image: npt.NDArray[np.uint8]) -> float:
     """
     Check if the water is present in the image
     """
-    new_image = trimmer_image(image, 80)
-    # count the number of white pixels
-    ratio_water = cv2.countNonZero(new_image) / (image.size / 3)
+    band_start = 0.8
+    band_coverage = water_coverage(image, (band_start,))[0]
+    # ratio of water pixels over the whole image, as if the band had been filtered at full resolution
+    ratio_water = band_coverage * (1 - band_start)
     color_percent = (ratio_water * 100) / .3
-    return float(color_percent)  # type: ignore
+    return float(color_percent)
 
 
 def check_is_water(image_percentage: float) -> bool:
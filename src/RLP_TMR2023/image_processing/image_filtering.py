@@ -1,8 +1,23 @@
+from functools import lru_cache
+
 import cv2
 import numpy as np
 import numpy.typing as npt
 
 
+@lru_cache(maxsize=None)
+def get_kernel(kernel_size: int) -> npt.NDArray[np.uint8]:
+    """
+    Square structuring element for morphological operations, it is created once per size and then reused
+
+    :param kernel_size: The size of the kernel
+    :return: The kernel, it must not be modified
+    """
+    kernel = np.ones((kernel_size, kernel_size), "uint8")
+    kernel.setflags(write=False)
+    return kernel
+
+
 def hsv_filter(image: npt.NDArray[np.uint8], lower: npt.NDArray[np.uint8], upper: npt.NDArray[np.uint8],
                kernel_size: int) -> npt.NDArray[np.uint8]:
     """
@@ -17,7 +32,7 @@ def hsv_filter(image: npt.NDArray[np.uint8], lower: npt.NDArray[np.uint8], upper
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
     filtered = cv2.inRange(hsv, lower, upper)
 
-    kernel = np.ones((kernel_size, kernel_size), "uint8")
+    kernel = get_kernel(kernel_size)
     filtered = cv2.morphologyEx(filtered, cv2.MORPH_OPEN, kernel)
     dilated_filtered: npt.NDArray[np.uint8] = cv2.dilate(filtered, kernel, iterations=1)
 
@@ -42,7 +57,15 @@ def adaptive_gaussian(image: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
 def otsu_filtering(image: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
     img_grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     gaussian_blur = cv2.GaussianBlur(img_grey, (5, 5), 0)
-    otsu_filtered = cv2.threshold(gaussian_blur, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+    return otsu_threshold(gaussian_blur)  # type: ignore
+
+
+def otsu_threshold(blurred_grey: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """
+    Same as otsu_filtering for an image that is already grey and blurred (see Frame.blurred)
+    """
+    otsu_filtered = cv2.threshold(blurred_grey, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
 
     return otsu_filtered  # type: ignore
 
@@ -2,8 +2,11 @@ import cv2
 import numpy as np
 import numpy.typing as npt
 
-from RLP_TMR2023.constants.color_filters import RED_LOWER_HSV, RED_UPPER_HSV
-from RLP_TMR2023.image_processing.image_filtering import hsv_filter
+from RLP_TMR2023.constants.color_filters import COLOR_RANGES
+from RLP_TMR2023.image_processing.color_segmentation import ColorSegmenter
+
+# the buffers of the segmenter are allocated once per frame size and reused by every call
+_SEGMENTER = ColorSegmenter({"red": COLOR_RANGES["red"]})
 
 
 def red_filter(image: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
@@ -11,15 +14,9 @@ def red_filter(image: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
     Filter an image using blue HSV params
 
     :param image: The image to filter
-    :return: The filtered image
+    :return: The filtered image, it is overwritten by the next call (copy it to keep it)
     """
-
-    # lower = np.array([0, 20, 0])
-    # upper = np.array([50, 255, 255])
-    lower = np.array(RED_LOWER_HSV)
-    upper = np.array(RED_UPPER_HSV)
-
-    return hsv_filter(image, lower, upper, 5)  # type: ignore
+    return _SEGMENTER.segment(image)["red"]
 
 
 def main():
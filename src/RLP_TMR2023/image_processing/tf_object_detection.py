@@ -1,40 +1,86 @@
 import logging
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
 import cv2
 import numpy as np
-import numpy.typing as npt
-from tflite_support.task import vision
 
 from RLP_TMR2023.common_types.common_types import Detection, BoundingBox
-from RLP_TMR2023.image_processing.area_of_can import get_area_of_can
+from RLP_TMR2023.image_processing.area_of_can import get_area_of_can_in_box
+from RLP_TMR2023.image_processing.frame import Frame
+
+if TYPE_CHECKING:
+    from tflite_support.task import vision
 
 logger = logging.getLogger(__name__)
 
 
-def get_detections(rgb_image: npt.NDArray[np.uint8], detector: vision.ObjectDetector) -> \
-        Optional[list[Detection]]:
-    width, height, _ = rgb_image.shape
+def build_detector(model: str, enable_edgetpu: bool, number_threads: int, max_results: int,
+                   score_threshold: float) -> "vision.ObjectDetector":
+    """
+    Builds the TFLite object detector, tflite_support is imported here because importing it takes seconds
+    """
+    from tflite_support.task import core, processor, vision
+
+    base_options = core.BaseOptions(file_name=model, use_coral=enable_edgetpu, num_threads=number_threads)
+    detection_options = processor.DetectionOptions(max_results=max_results, score_threshold=score_threshold)
+    options = vision.ObjectDetectorOptions(base_options=base_options, detection_options=detection_options)
+    return vision.ObjectDetector.create_from_options(options)
+
+
+def warm_up_detector(detector: "vision.ObjectDetector", shape: tuple[int, int, int], inferences: int) -> None:
+    """
+    Runs the detector on a blank frame, the first inferences are much slower than the rest
+    """
+    from tflite_support.task import vision
+
+    input_tensor = vision.TensorImage.create_from_array(np.zeros(shape, dtype=np.uint8))
+    for _ in range(inferences):
+        detector.detect(input_tensor)
+
+
+def build_warmed_up_detector(model: str, enable_edgetpu: bool, number_threads: int, max_results: int,
+                             score_threshold: float, shape: tuple[int, int, int],
+                             inferences: int) -> "vision.ObjectDetector":
+    """
+    Builds the detector and warms it up, it can be pickled with functools.partial to build it in another process
+    """
+    detector = build_detector(model, enable_edgetpu, number_threads, max_results, score_threshold)
+    warm_up_detector(detector, shape, inferences)
+    return detector
+
+
+def get_detections(frame: Frame, detector: "vision.ObjectDetector", scale: float = 1.0) -> Optional[list[Detection]]:
+    """
+    Runs the detector on a frame, the bounding boxes are always in the coordinates of the frame
+    :param scale: fraction of the frame resolution the detector runs on
+    """
+    from tflite_support.task import vision
+
+    rgb_image = frame.rgb
+    if scale < 1.0:
+        rgb_image = cv2.resize(frame.rgb, (round(frame.width * scale), round(frame.height * scale)),  # type: ignore
+                               interpolation=cv2.INTER_AREA)
     # Create a TensorImage object from the RGB image.
     input_tensor = vision.TensorImage.create_from_array(rgb_image)
     # Run object detection estimation using the model.
     detection_result = detector.detect(input_tensor)
 
-    detections = [
-        Detection(
+    detections = []
+    for d in detection_result.detections:
+        bounding_box = BoundingBox(
+            x=max(int(d.bounding_box.origin_x / scale), 0),
+            y=max(int(d.bounding_box.origin_y / scale), 0),
+            width=int(d.bounding_box.width / scale),
+            height=int(d.bounding_box.height / scale),
+        )
+        detections.append(Detection(
             category=d.categories[0].category_name,
             score=d.categories[0].score,
-            bounding_box=BoundingBox(
-                x=int(d.bounding_box.origin_x) if int(d.bounding_box.origin_x) > 0 else 0,
-                y=int(d.bounding_box.origin_y) if int(d.bounding_box.origin_y) > 0 else 0,
-                width=int(d.bounding_box.width),
-                height=int(d.bounding_box.height),
-            ),
-            frame_width=width,
-            frame_height=height,
-            approx_size=get_area_of_can(cv2.cvtColor(rgb_image, cv2.COLOR_RGB2BGR))
-        )
-        for d in detection_result.detections
-    ]
+            bounding_box=bounding_box,
+            frame_width=frame.width,
+            frame_height=frame.height,
+            # the blurred plane is computed once and shared by every detection of the frame
+            approx_size=get_area_of_can_in_box(frame.blurred, bounding_box)
+        ))
 
     return detections
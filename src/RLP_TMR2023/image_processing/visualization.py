@@ -13,9 +13,13 @@
 # limitations under the License.
 """Utility functions to display the pose detection results."""
 
+from typing import TYPE_CHECKING
+
 import cv2
 import numpy as np
-from tflite_support.task import processor
+
+if TYPE_CHECKING:
+    from tflite_support.task import processor
 
 _MARGIN = 10  # pixels
 _ROW_SIZE = 10  # pixels
@@ -26,7 +30,7 @@ _TEXT_COLOR = (0, 0, 255)  # red
 
 def visualize_detections_bounding_rects(
         image: np.ndarray,  # type: ignore
-        detection_result: processor.DetectionResult,
+        detection_result: "processor.DetectionResult",
 ) -> np.ndarray:  # type: ignore
     """Draws bounding boxes on the input image and return it.
 
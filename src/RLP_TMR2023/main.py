@@ -3,12 +3,18 @@ import cProfile
 import logging
 import platform
 import pstats
+import subprocess
+import sys
 
 import py_trees.common
 import py_trees.console
 
 from RLP_TMR2023.behaviour_tree.root import create_root, get_data_recollection_subtree
-from RLP_TMR2023.hardware_controllers.camera_controller import camera_controller_factory
+from RLP_TMR2023.behaviour_tree.tasks.motion_executor import MotionExecutor
+from RLP_TMR2023.behaviour_tree.tick_scheduler import TickScheduler
+from RLP_TMR2023.behaviour_tree.timing_visitor import TimingVisitor
+from RLP_TMR2023.constants import bt_values
+from RLP_TMR2023.hardware_controllers.camera_controller import camera_controller_factory, select_replay_camera
 from RLP_TMR2023.hardware_controllers.distance_sensors_controller import distance_sensors_controller_factory
 from RLP_TMR2023.hardware_controllers.imu_controller import imu_controller_factory
 from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory
@@ -25,15 +31,29 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument("--render-tree", help="Render tree to svg and exit", action="store_true")
     parser.add_argument("--profile", help="Profile the data recollection subtree", action="store_true")
     parser.add_argument("--interactive", help="Interactive mode", action="store_true")
+    parser.add_argument("--headless", help="Never open the camera preview window", action="store_true")
+    parser.add_argument("--replay", help="Replay a video file or a directory of images instead of using the camera",
+                        metavar="PATH")
+    parser.add_argument("--replay-fast", help="Replay frames as fast as possible instead of in real time",
+                        action="store_true")
+    parser.add_argument("--replay-loop", help="Start the replay again after the last frame", action="store_true")
+    parser.add_argument("--tick-rate", help="Tick frequency in Hz (0 ticks as fast as possible)", type=float,
+                        default=bt_values.TICK_FREQUENCY_HZ)
+    parser.add_argument("--max-ticks", help="Stop after this number of ticks", type=int, default=None)
+    parser.add_argument("--time-behaviours", help="Time the update of every behaviour and save the timings to "
+                                                  "behaviour_timings.json at exit", action="store_true")
+    parser.add_argument("--import-time", help="Print the slowest imports of the program (python -X importtime) and "
+                                              "exit", action="store_true")
     args = parser.parse_args()
     return args
 
 
-def initialize_controllers() -> None:
+def initialize_controllers(args: argparse.Namespace) -> None:
     # Initialization of controllers
     motors = motors_controller_factory(platform.machine())
     motors.setup()
     camera = camera_controller_factory(platform.machine())
+    camera.set_headless(args.headless)
     camera.setup()
     distance_sensor = distance_sensors_controller_factory(platform.machine())
     distance_sensor.setup()
@@ -46,7 +66,8 @@ def initialize_controllers() -> None:
 
 
 def disable_controllers() -> None:
-    # Initialization of controllers
+    # The executor has to release the drivetrain before the motors are disabled
+    MotionExecutor().stop()
     motors = motors_controller_factory(platform.machine())
     motors.disable()
     camera = camera_controller_factory(platform.machine())
@@ -85,6 +106,7 @@ def run_behaviour_tree(args: argparse.Namespace):
                                          with_blackboard_variables=True)
         return
 
+    camera = camera_controller_factory(platform.machine())
     behaviour_tree = py_trees.trees.BehaviourTree(root)
     if args.debug:
         behaviour_tree.visitors.append(py_trees.visitors.DisplaySnapshotVisitor(
@@ -92,23 +114,68 @@ def run_behaviour_tree(args: argparse.Namespace):
             # display_activity_stream=True,
             display_only_visited_behaviours=True,
         ))
+    timing_visitor = None
+    if args.time_behaviours:
+        timing_visitor = TimingVisitor(root)
+        behaviour_tree.visitors.append(timing_visitor)
+
+    scheduler = TickScheduler(behaviour_tree, frequency=args.tick_rate)
+    camera.detection_policy.set_tick_budget(scheduler.period)
+
+    def post_tick() -> None:
+        # the detection resolution and rate adapt to keep the tick rate (and the collision checks) on time
+        camera.observe_tick(scheduler.last_latency)
+        if args.interactive:
+            py_trees.console.read_single_keypress()
+
+    try:
+        scheduler.run(max_ticks=args.max_ticks,
+                      should_stop=lambda: camera.is_exhausted,
+                      post_tick=post_tick)
+    except KeyboardInterrupt:
+        pass
+    print(scheduler.report())
+    print(camera.detection_policy.report())
+    if timing_visitor is not None:
+        print(timing_visitor.table())
+        timing_visitor.dump("behaviour_timings.json")
+
+
+def report_import_time(top: int = 25) -> None:
+    """
+    Imports this module in a new interpreter with -X importtime and prints the imports with the highest cumulative
+    time, the hardware libraries and the object detection model are loaded later so they are not included
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import RLP_TMR2023.main"],
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.strip()))
+    if not rows:
+        print(result.stderr)
+        return
 
-    while True:
-        try:
-            behaviour_tree.tick()
-            # print(py_trees.display.ascii_tree(root, show_status=True))
-            if args.interactive:
-                py_trees.console.read_single_keypress()
-        except KeyboardInterrupt:
-            break
+    rows.sort(reverse=True)
+    print(f"{'module':<50} {'self ms':>10} {'cumulative ms':>14}")
+    for cumulative_time, self_time, module in rows[:top]:
+        print(f"{module[:50]:<50} {self_time / 1000:>10.1f} {cumulative_time / 1000:>14.1f}")
 
 
 def main():
     args = parse_arguments()
+    if args.import_time:
+        report_import_time()
+        return
     if args.release:
         logging.disable(logging.CRITICAL)
+    if args.replay is not None:
+        select_replay_camera(args.replay, realtime=not args.replay_fast, loop=args.replay_loop)
 
-    initialize_controllers()
+    initialize_controllers(args)
     run_behaviour_tree(args)
     disable_controllers()
 
@@ -0,0 +1,16 @@
+import time
+import unittest
+from typing import Callable
+
+
+class PollingTestCase(unittest.TestCase):
+    """
+    Test case for code that runs on other threads, the tests poll for the state they expect instead of sleeping
+    """
+
+    def wait_until(self, condition: Callable[[], bool], timeout: float = 2.0) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Condition not met before the timeout")
+            time.sleep(0.001)
@@ -0,0 +1,269 @@
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import py_trees
+
+from RLP_TMR2023.behaviour_tree.tasks.motion_executor import MotionExecutor, MotionState, MotorInstruction, \
+    MotorMovement
+from RLP_TMR2023.behaviour_tree.tasks.move_wait_threads_subtree import ExecuteMotorInstructions
+from RLP_TMR2023.behaviour_tree.tasks.search_can_subtree import create_recollect_can_subtree, TFDetection
+from RLP_TMR2023.behaviour_tree.tasks.timed_action_sequence import TimedActionSequence, TimedAction
+from RLP_TMR2023.behaviour_tree.tick_scheduler import TickScheduler
+from RLP_TMR2023.behaviour_tree.timing_visitor import TimingVisitor, LatencyHistogram
+from RLP_TMR2023.common_types.common_types import BoundingBox, Centroid, Detection, DetectionResult
+from RLP_TMR2023.constants import bt_values, object_detection_values
+from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory, MotorSide, MotorState, \
+    MotorDirection
+from RLP_TMR2023.image_processing.frame import Frame
+from tests.helpers import PollingTestCase
+
+
+class SleepyBehaviour(py_trees.behaviour.Behaviour):
+    def __init__(self, tick_durations):
+        super().__init__(name="Sleepy")
+        self._tick_durations = list(tick_durations)
+        self.count = 0
+
+    def update(self):
+        time.sleep(self._tick_durations[self.count % len(self._tick_durations)])
+        self.count += 1
+        return py_trees.common.Status.SUCCESS
+
+
+def create_tree(tick_durations) -> py_trees.trees.BehaviourTree:
+    return py_trees.trees.BehaviourTree(SleepyBehaviour(tick_durations))
+
+
+class TestTickScheduler(unittest.TestCase):
+    def test_runs_at_the_target_frequency(self):
+        tree = create_tree([0.0])
+        scheduler = TickScheduler(tree, frequency=100)
+
+        start = time.monotonic()
+        scheduler.run(max_ticks=20)
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(tree.count, 20)
+        self.assertGreaterEqual(elapsed, 0.19)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(scheduler.overruns, 0)
+
+    def test_slow_ticks_are_counted_as_overruns(self):
+        tree = create_tree([0.0, 0.035])
+        scheduler = TickScheduler(tree, frequency=100)
+
+        scheduler.run(max_ticks=6)
+
+        self.assertEqual(scheduler.overruns, 3)
+        self.assertGreaterEqual(scheduler.skipped_periods, 6)
+
+    def test_statistics(self):
+        scheduler = TickScheduler(create_tree([0.0]), frequency=0, latency_samples=4)
+        self.assertEqual(scheduler.statistics().ticks, 0)
+
+        scheduler.run(max_ticks=10)
+        stats = scheduler.statistics()
+
+        self.assertEqual(stats.ticks, 10)
+        self.assertLessEqual(stats.p50, stats.p95)
+        self.assertLessEqual(stats.p99, stats.max)
+        self.assertIn("10 ticks", scheduler.report())
+
+    def test_should_stop(self):
+        tree = create_tree([0.0])
+        scheduler = TickScheduler(tree, frequency=0)
+
+        scheduler.run(should_stop=lambda: tree.count >= 3)
+
+        self.assertEqual(tree.count, 3)
+
+
+class TestTimingVisitor(unittest.TestCase):
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        for _ in range(99):
+            histogram.add(0.001)
+        histogram.add(0.5)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.mean, (99 * 0.001 + 0.5) / 100)
+        self.assertAlmostEqual(histogram.percentile(95), 0.001, delta=0.0004)
+        self.assertEqual(histogram.max, 0.5)
+
+    def test_times_every_behaviour(self):
+        root = py_trees.composites.Sequence(name="Root", memory=False)
+        root.add_children([SleepyBehaviour([0.002]), SleepyBehaviour([0.0])])
+        tree = py_trees.trees.BehaviourTree(root)
+        visitor = TimingVisitor(root)
+        tree.visitors.append(visitor)
+
+        for _ in range(5):
+            tree.tick()
+        summary = visitor.summary()
+
+        self.assertEqual(visitor.ticks, 5)
+        self.assertEqual(len(summary), 2)
+        self.assertTrue(all(row["count"] == 5 for row in summary))
+        self.assertEqual(summary[0]["name"], "Sleepy")
+        self.assertGreaterEqual(summary[0]["mean"], 0.002)
+        self.assertIn("Sleepy", visitor.table())
+
+
+class TestMotionExecutor(PollingTestCase):
+    def setUp(self):
+        self.executor = MotionExecutor()
+
+    def tearDown(self):
+        self.executor.stop()
+
+    def test_command_runs_until_its_deadline(self):
+        start = time.monotonic()
+        command = self.executor.submit([MotorInstruction(MotorMovement.FORWARD, 100, 0.05),
+                                        MotorInstruction(MotorMovement.LEFT, 100, 0.05)])
+        self.wait_until(lambda: command.is_finished)
+
+        self.assertEqual(command.state, MotionState.SUCCEEDED)
+        self.assertEqual(command.instruction_index, 1)
+        self.assertEqual(command.progress, 1.0)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_new_command_preempts_the_running_one(self):
+        first = self.executor.submit([MotorInstruction(MotorMovement.BACKWARD, 100, 5)])
+        second = self.executor.submit([MotorInstruction(MotorMovement.FORWARD, 100, 0.01)])
+        self.wait_until(lambda: second.is_finished)
+
+        self.assertEqual(first.state, MotionState.CANCELLED)
+        self.assertEqual(second.state, MotionState.SUCCEEDED)
+
+    def test_terminate_cancels_the_command(self):
+        behaviour = ExecuteMotorInstructions([MotorInstruction(MotorMovement.BACKWARD, 100, 5)], "Back off")
+        behaviour.tick_once()
+        self.assertEqual(behaviour.status, py_trees.common.Status.RUNNING)
+        self.wait_until(lambda: self.executor.current is not None)
+        command = self.executor.current
+        assert command is not None
+
+        start = time.monotonic()
+        behaviour.stop(py_trees.common.Status.INVALID)
+        self.wait_until(lambda: command.is_finished)
+
+        self.assertEqual(command.state, MotionState.CANCELLED)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+
+class TestTimedActionSequence(unittest.TestCase):
+    def create_sequence(self, calls, on_interrupt=None):
+        return TimedActionSequence("Sequence", [
+            TimedAction("first", lambda: calls.append("first"), 0.05),
+            TimedAction("second", lambda: calls.append("second"), 0),
+            TimedAction("third", lambda: calls.append("third"), 0.05),
+        ], on_interrupt=on_interrupt)
+
+    def test_stages_run_once_and_wait_for_their_deadline(self):
+        calls: list[str] = []
+        sequence = self.create_sequence(calls)
+
+        sequence.tick_once()
+        sequence.tick_once()
+        self.assertEqual(sequence.status, py_trees.common.Status.RUNNING)
+        self.assertEqual(calls, ["first"])
+
+        time.sleep(0.06)
+        sequence.tick_once()
+        self.assertEqual(sequence.status, py_trees.common.Status.RUNNING)
+        self.assertEqual(calls, ["first", "second", "third"])
+
+        time.sleep(0.06)
+        sequence.tick_once()
+        self.assertEqual(sequence.status, py_trees.common.Status.SUCCESS)
+        self.assertEqual(calls, ["first", "second", "third"])
+
+    def test_interrupt_calls_the_handler_and_restarts(self):
+        calls: list[str] = []
+        interrupts = []
+        sequence = self.create_sequence(calls, on_interrupt=lambda: interrupts.append(True))
+
+        sequence.tick_once()
+        sequence.stop(py_trees.common.Status.INVALID)
+        self.assertEqual(interrupts, [True])
+
+        sequence.tick_once()
+        self.assertEqual(calls, ["first", "first"])
+
+
+class TestRecollectCan(unittest.TestCase):
+    def setUp(self):
+        self.blackboard = py_trees.blackboard.Client(name="Test")
+        self.blackboard.register_key("centroid", access=py_trees.common.Access.WRITE)
+        self.blackboard.register_key("detection", access=py_trees.common.Access.WRITE)
+        # a can right in the middle of the frame, at the distance to pick it
+        self.blackboard.detection = Detection(category="can", score=0.9, bounding_box=BoundingBox(300, 260, 40, 60),
+                                              frame_width=640, frame_height=480, approx_size=1000)
+        self.blackboard.centroid = Centroid(320, 288)
+        self.motors = motors_controller_factory("x86_64")
+        self.motors.setup()
+
+    def test_pick_can_keeps_approaching_after_the_can_moves(self):
+        recollect_can = create_recollect_can_subtree()
+        recollect_can.tick_once()
+        self.assertEqual(recollect_can.status, py_trees.common.Status.RUNNING)
+
+        # centering and getting close would stop the motors or fail if they were ticked again
+        self.blackboard.centroid = Centroid(600, 100)
+        recollect_can.tick_once()
+
+        self.assertEqual(recollect_can.status, py_trees.common.Status.RUNNING)
+        self.assertEqual(self.motors.state(MotorSide.LEFT),
+                         MotorState(MotorDirection.FORWARD, bt_values.PICK_APPROACH_SPEED))
+        recollect_can.stop(py_trees.common.Status.INVALID)
+
+
+def _frame_with_can(x: int, y: int, sequence: int) -> Frame:
+    # a dark textured can on a white background
+    rgb_image = np.full((120, 160, 3), 230, dtype=np.uint8)
+    rgb_image[y:y + 24, x:x + 16] = np.random.default_rng(0).integers(0, 100, (24, 16, 3), dtype=np.uint8)
+    return Frame(rgb_image, timestamp=time.monotonic(), sequence=sequence)
+
+
+class TestTFDetection(unittest.TestCase):
+    def setUp(self):
+        self.blackboard = py_trees.blackboard.Client(name="Test")
+        self.blackboard.register_key("current_frame", access=py_trees.common.Access.WRITE)
+        self.blackboard.register_key("centroid", access=py_trees.common.Access.READ)
+        self.detection = TFDetection()
+        self.camera = mock.Mock()
+        self.detection.camera = self.camera
+
+    def test_tracks_the_frames_of_the_blackboard_until_the_can_is_lost(self):
+        frame = _frame_with_can(40, 30, sequence=0)
+        can = Detection(category="can", score=0.9, bounding_box=BoundingBox(38, 28, 20, 28), frame_width=160,
+                        frame_height=120, approx_size=560)
+        self.camera.get_latest_detections.return_value = DetectionResult([can], frame, inference_time=0.0)
+        self.blackboard.current_frame = frame
+
+        self.detection.tick_once()
+        self.assertEqual(self.detection.status, py_trees.common.Status.SUCCESS)
+        self.camera.set_detection_stride.assert_called_with(object_detection_values.TRACKER_DETECTION_INTERVAL)
+        detected_centroid = self.blackboard.centroid
+
+        # the can moved, the detector has not published anything newer
+        self.blackboard.current_frame = _frame_with_can(43, 32, sequence=1)
+        self.detection.tick_once()
+        self.assertEqual(self.detection.status, py_trees.common.Status.SUCCESS)
+        self.assertEqual(self.blackboard.centroid, Centroid(detected_centroid.x + 3, detected_centroid.y + 2))
+
+        # the can left the frame
+        self.blackboard.current_frame = Frame(np.full((120, 160, 3), 230, dtype=np.uint8), sequence=2)
+        self.detection.tick_once()
+        self.assertEqual(self.detection.status, py_trees.common.Status.FAILURE)
+        self.camera.request_detection.assert_called_once()
+        self.camera.set_detection_stride.assert_called_with(1)
+
+        # tracking never reads a frame of its own
+        self.camera.get_latest_frame.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,63 @@
+import os
 import platform
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from typing import Optional, Union
+from unittest import mock
 
-from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory
+import cv2
+import numpy as np
+
+from RLP_TMR2023.common_types.common_types import BoundingBox, Detection, DetectionResult, DistanceReading
+from RLP_TMR2023.constants import imu_values
+from RLP_TMR2023.hardware_controllers.buzzer_controller import buzzer_controller_factory, compile_melody, Melody, \
+    Note
+from RLP_TMR2023.hardware_controllers.camera_controller import CameraControllerReplay
+from RLP_TMR2023.hardware_controllers.detection_cache import DetectionCache
+from RLP_TMR2023.hardware_controllers.detection_policy import AdaptiveDetectionPolicy, DetectionSettings
+from RLP_TMR2023.hardware_controllers.detection_pool import DetectionPool
+from RLP_TMR2023.hardware_controllers.detection_worker import DetectionWorker
+from RLP_TMR2023.hardware_controllers.distance_sensors_controller import DistanceSensorsControllerRaspberry, \
+    any_sensor_strategy, parse_distances
+from RLP_TMR2023.hardware_controllers.frame_preview import FramePreview
+from RLP_TMR2023.hardware_controllers.frame_ring_buffer import FrameRingBuffer
+from RLP_TMR2023.hardware_controllers.imu_controller import accelerometer_all_iqr_strategy, DataRecollectedType, \
+    evaluate_stuck_strategies, IMUControllerMockRaspberry, STUCK_STRATEGIES, VotingPolicy, WindowStatistics
+from RLP_TMR2023.hardware_controllers.motors_controller import motors_controller_factory, MotorDirection, MotorSide, \
+    STOPPED, MotorsControllerMock, MotorState
+from RLP_TMR2023.hardware_controllers.oled_display_controller import BitmapFontRenderer, get_default_font, \
+    oled_display_controller_factory
+from RLP_TMR2023.hardware_controllers.rolling_statistics import RollingStatistics
+from RLP_TMR2023.hardware_controllers.servos_controller import ServosControllerRaspberry, ServoPair, ServoStatus
+from RLP_TMR2023.image_processing.frame import Frame
+from tests.helpers import PollingTestCase
+
+
+class RecordingMotorsController(MotorsControllerMock):
+    """
+    Keeps the state written to the fake hardware, a write can be held in the middle to race another command with it
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.hardware: dict[MotorSide, MotorState] = {side: STOPPED for side in MotorSide}
+        self.hold_writes = False
+        self.write_started = threading.Event()
+        self.release_write = threading.Event()
+
+    def _write_stop(self) -> None:
+        self.hardware = {side: STOPPED for side in MotorSide}
+
+    def _write(self, motor_side: MotorSide, new_state: MotorState, old_state: MotorState) -> None:
+        if self.hold_writes:
+            self.write_started.set()
+            self.release_write.wait(timeout=2)
+        self.hardware[motor_side] = new_state
 
 
 class TestHardwareController(unittest.TestCase):
@@ -30,8 +86,910 @@ class TestHardwareController(unittest.TestCase):
         m = motors_controller_factory("aarch64")
         self.assertEqual(m.__class__.__name__, 'MotorsControllerRaspberry')
 
+    def test_motors_redundant_writes_are_suppressed(self):
+        m = motors_controller_factory("x86_64")
+        m.setup()
+        issued, suppressed = m.writes_issued, m.writes_suppressed
+
+        m.move_both(30, MotorDirection.FORWARD, 30, MotorDirection.BACKWARD)
+        m.move_both(30, MotorDirection.FORWARD, 30, MotorDirection.BACKWARD)
+        m.move(MotorSide.LEFT, 50, MotorDirection.FORWARD)
+        m.stop()
+        m.stop()
+
+        self.assertEqual(m.writes_issued - issued, 5)
+        self.assertEqual(m.writes_suppressed - suppressed, 4)
+        self.assertEqual(m.state(MotorSide.LEFT), STOPPED)
+
+    def test_stop_during_a_move_is_not_suppressed(self):
+        m = RecordingMotorsController()
+        m.setup()
+        m.hold_writes = True
+
+        mover = threading.Thread(target=m.move, args=(MotorSide.LEFT, 50, MotorDirection.FORWARD))
+        mover.start()
+        self.assertTrue(m.write_started.wait(timeout=2))
+        # the stop arrives while the move is being written to the motor
+        stopper = threading.Thread(target=m.stop)
+        stopper.start()
+        time.sleep(0.05)
+        m.release_write.set()
+        mover.join()
+        stopper.join()
+
+        self.assertEqual(m.hardware, {side: STOPPED for side in MotorSide})
+        self.assertEqual({side: m.state(side) for side in MotorSide}, m.hardware)
+
     # TODO: add test for other controllers
 
 
+class FakeSMBus:
+    """
+    Stands for smbus.SMBus, every block read returns the next block of the list or raises it if it is an exception
+    """
+
+    def __init__(self, blocks: list[Union[list[int], Exception]]) -> None:
+        self._blocks = list(blocks)
+
+    def read_i2c_block_data(self, address: int, register: int, length: int) -> list[int]:
+        block = self._blocks.pop(0)
+        if isinstance(block, Exception):
+            raise block
+        return block[:length]
+
+
+class FakeServo:
+    """
+    Stands for adafruit_motor.servo.Servo, the angles written are recorded and a write can be made slow or fail once
+    """
+
+    def __init__(self, writes: list[tuple[str, int]], name: str) -> None:
+        self._writes = writes
+        self._name = name
+        self._angle = 0
+        self.delay = 0.0
+        self.fail_next_write = False
+
+    @property
+    def angle(self) -> int:
+        return self._angle
+
+    @angle.setter
+    def angle(self, value: int) -> None:
+        if self.fail_next_write:
+            self.fail_next_write = False
+            raise OSError("Remote I/O error")
+        time.sleep(self.delay)
+        self._angle = value
+        self._writes.append((self._name, value))
+
+
+class FakeServosController(ServosControllerRaspberry):
+    def setup(self) -> None:
+        self.writes: list[tuple[str, int]] = []
+        self._servos = {pair: (FakeServo(self.writes, f"{pair.name}1"), FakeServo(self.writes, f"{pair.name}2"))
+                        for pair in ServoPair}  # type: ignore
+        self._start_worker()
+        self.writes.clear()
+
+
+def _build_fake_detector() -> str:
+    return "fake detector"
+
+
+def _detect_pixel_value(frame: Frame, detector: str, scale: float = 1.0) -> list[Detection]:
+    # the score carries the value of the pixels the process read from the shared memory
+    return [Detection(category=detector, score=float(frame.rgb.mean()), bounding_box=BoundingBox(0, 0, 1, 1),
+                      frame_width=frame.width, frame_height=frame.height, approx_size=0)]
+
+
+class TestServosController(unittest.TestCase):
+    def setUp(self):
+        self.servos = FakeServosController()
+        self.servos.setup()
+
+    def tearDown(self):
+        self.servos.disable()
+
+    def test_queued_moves_return_right_away_and_disable_drains_them(self):
+        for pair in ServoPair:
+            for fake_servo in self.servos._servos[pair]:
+                fake_servo.delay = 0.02  # type: ignore
+
+        start = time.monotonic()
+        self.servos.queue_move(ServoPair.ARM, ServoStatus.EXPANDED)
+        self.servos.queue_move(ServoPair.CLAW, ServoStatus.EXPANDED)
+        self.assertLess(time.monotonic() - start, 0.02)
+        self.servos.disable()
+
+        self.assertEqual(self.servos.writes, [("ARM1", 150), ("ARM2", 30), ("CLAW1", 0), ("CLAW2", 180)])
+
+    def test_repeated_moves_are_coalesced(self):
+        for _ in range(3):
+            self.servos.queue_move(ServoPair.TRAY, ServoStatus.EXPANDED)
+        self.servos.move(ServoPair.TRAY, ServoStatus.EXPANDED)
+        self.servos.move(ServoPair.TRAY, ServoStatus.RETRACTED)
+
+        self.assertEqual(self.servos.writes, [("TRAY1", 45), ("TRAY2", 135), ("TRAY1", 3), ("TRAY2", 177)])
+
+    def test_failed_write_does_not_block_and_is_retried(self):
+        self.servos._servos[ServoPair.ARM][0].fail_next_write = True  # type: ignore
+        failed_moves = self.servos.failed_moves
+
+        start = time.monotonic()
+        self.servos.move(ServoPair.ARM, ServoStatus.EXPANDED)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.servos.failed_moves - failed_moves, 1)
+        self.assertEqual(self.servos.writes, [])
+
+        # the position is unknown, so the same move is written again instead of being skipped
+        self.servos.move(ServoPair.ARM, ServoStatus.EXPANDED)
+        self.assertEqual(self.servos.writes, [("ARM1", 150), ("ARM2", 30)])
+
+
+class TestDistanceSensorsController(unittest.TestCase):
+    def setUp(self):
+        self.sensors = DistanceSensorsControllerRaspberry()
+        self.sensors._addr = 8
+
+    def test_distances_are_aligned_on_the_separator(self):
+        self.assertEqual(parse_distances([255, 10, 20, 30, 255, 11, 21]), (10, 20, 30))
+        self.assertEqual(parse_distances([20, 30, 255, 10, 20, 30, 255]), (10, 20, 30))
+        self.assertEqual(parse_distances([30, 255, 10, 20, 30, 255, 10]), (10, 20, 30))
+        self.assertIsNone(parse_distances([10, 20, 30, 255]))
+
+    def test_read_retries_after_errors_and_partial_frames(self):
+        self.sensors._i2c_bus = FakeSMBus([OSError("Remote I/O error"), [10, 20, 30, 255, 10, 255, 255],
+                                           [20, 30, 255, 10, 20, 30, 255]])
+
+        self.assertEqual(self.sensors._read_distances(), (10, 20, 30))
+
+    def test_stale_reading_is_treated_as_an_obstacle(self):
+        self.sensors._i2c_bus = FakeSMBus([])
+        far_away = (200, 200, 200)
+
+        self.sensors._latest_reading = DistanceReading(distances=far_away, timestamp=time.monotonic())
+        self.assertFalse(self.sensors.is_about_to_collide(any_sensor_strategy))
+
+        self.sensors._latest_reading = DistanceReading(distances=far_away, timestamp=time.monotonic() - 1)
+        self.assertTrue(self.sensors.is_about_to_collide(any_sensor_strategy))
+
+        self.sensors._latest_reading = None
+        self.sensors._started_at = time.monotonic() - 1
+        self.assertTrue(self.sensors.is_about_to_collide(any_sensor_strategy))
+
+
+class TestFrameRingBuffer(unittest.TestCase):
+    def test_latest_is_none_before_first_frame(self):
+        buffer = FrameRingBuffer(3)
+        self.assertIsNone(buffer.latest())
+        self.assertEqual(buffer.latest_sequence, -1)
+
+    def test_latest_returns_newest_frame(self):
+        buffer = FrameRingBuffer(3)
+        for i in range(5):
+            buffer.push(np.full((4, 6, 3), i, dtype=np.uint8), timestamp=float(i))
+
+        frame = buffer.latest()
+        assert frame is not None
+        self.assertEqual(frame.sequence, 4)
+        self.assertEqual(frame.timestamp, 4.0)
+        self.assertTrue(np.all(frame.rgb == 4))
+
+    def test_frames_are_shared_and_never_overwritten(self):
+        buffer = FrameRingBuffer(2)
+        image = np.zeros((4, 6, 3), dtype=np.uint8)
+        buffer.push(image, timestamp=0.0)
+        frame = buffer.latest()
+        assert frame is not None
+        self.assertIs(frame, buffer.latest())
+        self.assertIs(frame.rgb, image)
+        for i in range(1, 4):
+            buffer.push(np.full((4, 6, 3), i, dtype=np.uint8), timestamp=float(i))
+
+        self.assertTrue(np.all(frame.rgb == 0))
+
+    def test_frames_can_change_shape(self):
+        buffer = FrameRingBuffer(2)
+        buffer.push(np.zeros((4, 6, 3), dtype=np.uint8), timestamp=0.0)
+        buffer.push(np.ones((8, 2, 3), dtype=np.uint8), timestamp=1.0)
+
+        frame = buffer.latest()
+        assert frame is not None
+        self.assertEqual(frame.rgb.shape, (8, 2, 3))
+        self.assertEqual(frame.sequence, 1)
+
+
+class TestRollingStatistics(unittest.TestCase):
+    def test_matches_numpy_while_sliding(self):
+        rng = np.random.default_rng(0)
+        samples = rng.normal(size=(200, 3)) * [1, 10, 0.01] + [0, 5, 1]
+        statistics = RollingStatistics(window_size=25, columns=3)
+
+        for i, sample in enumerate(samples):
+            statistics.push(sample)
+            window = samples[max(0, i - 24):i + 1]
+            np.testing.assert_allclose(statistics.window(), window)
+            np.testing.assert_allclose(statistics.mean(), window.mean(axis=0), atol=1e-9)
+            np.testing.assert_allclose(statistics.std(), window.std(axis=0), atol=1e-9)
+            np.testing.assert_allclose(statistics.percentile(25), np.percentile(window, 25, axis=0))
+            np.testing.assert_allclose(statistics.percentile(75), np.percentile(window, 75, axis=0))
+
+    def test_is_full(self):
+        statistics = RollingStatistics(window_size=3, columns=1)
+        for value in range(3):
+            self.assertFalse(statistics.is_full)
+            statistics.push([value])
+
+        self.assertTrue(statistics.is_full)
+        self.assertEqual(statistics.count, 3)
+
+
+def window_statistics(iqr: float, std: float) -> WindowStatistics:
+    return WindowStatistics(std=np.full(3, std), q1=np.zeros(3), q3=np.full(3, iqr))
+
+
+class TestIMUStuckStrategies(unittest.TestCase):
+    def setUp(self):
+        # the gyroscope is still and the accelerometer keeps shaking
+        self.statistics = {
+            DataRecollectedType.GYROSCOPE: window_statistics(iqr=0, std=0),
+            DataRecollectedType.ACCELEROMETER: window_statistics(iqr=1, std=1)
+        }
+
+    def test_every_strategy_is_evaluated(self):
+        verdict = evaluate_stuck_strategies(self.statistics, VotingPolicy.ANY, voters=())
+
+        self.assertEqual(set(verdict.verdicts), set(STUCK_STRATEGIES))
+        self.assertTrue(verdict.verdicts["gyroscope_any_iqr"])
+        self.assertTrue(verdict.verdicts["gyroscope_all_iqr"])
+        self.assertTrue(verdict.verdicts["gyroscope_all_std"])
+        self.assertFalse(verdict.verdicts["accelerometer_all_std"])
+        self.assertFalse(verdict.verdicts["accelerometer_all_iqr"])
+
+    def test_voting_policies(self):
+        two_of_three = ("gyroscope_all_iqr", "gyroscope_all_std", "accelerometer_all_iqr")
+        one_of_three = ("gyroscope_all_iqr", "accelerometer_all_std", "accelerometer_all_iqr")
+        cases = [
+            (VotingPolicy.ANY, two_of_three, True),
+            (VotingPolicy.ANY, ("accelerometer_all_std", "accelerometer_all_iqr"), False),
+            (VotingPolicy.ALL, ("gyroscope_all_iqr", "gyroscope_all_std"), True),
+            (VotingPolicy.ALL, two_of_three, False),
+            (VotingPolicy.MAJORITY, two_of_three, True),
+            (VotingPolicy.MAJORITY, one_of_three, False),
+            # a tie is not a majority
+            (VotingPolicy.MAJORITY, ("gyroscope_all_iqr", "accelerometer_all_iqr"), False),
+        ]
+        for policy, voters, expected in cases:
+            with self.subTest(policy=policy.name, voters=voters):
+                verdict = evaluate_stuck_strategies(self.statistics, policy, voters)
+                self.assertEqual(verdict.is_stuck, expected)
+                self.assertEqual(verdict.policy, policy)
+
+    def test_no_voters_is_never_stuck(self):
+        for policy in VotingPolicy:
+            with self.subTest(policy=policy.name):
+                self.assertFalse(evaluate_stuck_strategies(self.statistics, policy, voters=()).is_stuck)
+
+    def test_default_voters(self):
+        still = {data_type: window_statistics(iqr=0, std=0) for data_type in DataRecollectedType}
+
+        self.assertTrue(evaluate_stuck_strategies(still).is_stuck)
+        self.assertFalse(evaluate_stuck_strategies(self.statistics).is_stuck)
+
+
+class FakeMPU:
+    """
+    Stands in for MPU9250, every read waits for a permit so the tests decide how many samples are taken
+    """
+
+    def __init__(self) -> None:
+        self.permits = threading.Semaphore(0)
+        self.gated = True
+        self.moving = False
+        self.fail_next_read = False
+        self.read_times: list[float] = []
+
+    def readGyroscopeMaster(self) -> list[float]:
+        if self.gated:
+            self.permits.acquire()
+        self.read_times.append(time.monotonic())
+        if self.fail_next_read:
+            self.fail_next_read = False
+            raise OSError("I2C read failed")
+        return self._sample()
+
+    def readAccelerometerMaster(self) -> list[float]:
+        return self._sample()
+
+    def _sample(self) -> list[float]:
+        if self.moving:
+            return [float(v) for v in np.random.default_rng(len(self.read_times)).normal(size=3) * 10]
+        return [0.0, 0.0, 1.0]
+
+
+class FakeIMUController(IMUControllerMockRaspberry):
+    def setup(self) -> None:
+        self.mpu = FakeMPU()
+        self._start_sampler()
+
+
+class TestIMUSampler(PollingTestCase):
+    def setUp(self):
+        self.imu = FakeIMUController()
+        self.imu.setup()
+        self.mpu: FakeMPU = self.imu.mpu  # type: ignore
+
+    def tearDown(self):
+        self.mpu.gated = False
+        self.mpu.permits.release(1000)
+        self.imu.disable()
+
+    def take_samples(self, count: int) -> None:
+        reads = len(self.mpu.read_times) + count
+        self.mpu.permits.release(count)
+        self.wait_until(lambda: len(self.mpu.read_times) == reads)
+
+    def test_not_stuck_until_the_window_is_full(self):
+        self.take_samples(imu_values.NUM_SAMPLES - 1)
+
+        self.assertFalse(self.imu.is_robot_stuck(accelerometer_all_iqr_strategy))
+        self.assertFalse(self.imu.evaluate_stuck(VotingPolicy.ALL).is_stuck)
+
+        self.take_samples(1)
+        self.wait_until(lambda: self.imu.evaluate_stuck(VotingPolicy.ALL).is_stuck)
+        self.assertTrue(self.imu.is_robot_stuck(accelerometer_all_iqr_strategy))
+
+    def test_snapshot_follows_the_samples(self):
+        self.take_samples(imu_values.NUM_SAMPLES)
+        self.wait_until(lambda: self.imu.is_robot_stuck(accelerometer_all_iqr_strategy))
+
+        self.mpu.moving = True
+        self.take_samples(imu_values.NUM_SAMPLES)
+
+        self.wait_until(lambda: not self.imu.is_robot_stuck(accelerometer_all_iqr_strategy))
+
+    def test_failed_read_skips_the_sample(self):
+        self.mpu.fail_next_read = True
+        self.take_samples(imu_values.NUM_SAMPLES)
+
+        # the window still misses the sample that failed
+        self.assertFalse(self.imu.is_robot_stuck(accelerometer_all_iqr_strategy))
+        self.take_samples(1)
+        self.wait_until(lambda: self.imu.is_robot_stuck(accelerometer_all_iqr_strategy))
+
+    def test_samples_at_the_configured_rate(self):
+        self.mpu.gated = False
+        self.mpu.permits.release(1)
+        start = time.monotonic()
+        time.sleep(0.3)
+        elapsed = time.monotonic() - start
+        samples = len(self.mpu.read_times)
+
+        self.assertLessEqual(samples, elapsed * imu_values.SAMPLE_RATE_HZ + 2)
+        self.assertGreaterEqual(samples, elapsed * imu_values.SAMPLE_RATE_HZ / 2)
+
+    def test_disable_stops_the_sampler(self):
+        self.mpu.gated = False
+        self.mpu.permits.release(1)
+        self.imu.disable()
+        samples = len(self.mpu.read_times)
+        time.sleep(0.05)
+
+        self.assertEqual(len(self.mpu.read_times), samples)
+
+
+class TestBuzzerController(PollingTestCase):
+    def test_compile_melody(self):
+        compiled = compile_melody([Note(20, 0.1, 700), Note(0, 0.2), Note(40, 0.3)], initial_frequency=2000)
+
+        self.assertEqual([(duty, frequency) for duty, frequency, _ in compiled], [(20, 700), (0, 2000), (40, 2000)])
+        np.testing.assert_allclose([end for _, _, end in compiled], [0.1, 0.3, 0.6])
+
+    def test_duplicates_are_dropped_and_higher_priority_preempts(self):
+        buzzer = buzzer_controller_factory("x86_64")
+        buzzer.setup()
+        dropped = buzzer.dropped_requests
+
+        buzzer.play(Melody.HIGHAF)
+        self.wait_until(lambda: buzzer.playing == Melody.HIGHAF)
+        buzzer.play(Melody.HIGHAF)
+        self.assertEqual(buzzer.dropped_requests - dropped, 1)
+
+        start = time.monotonic()
+        buzzer.play(Melody.ABOUT_TO_COLLIDE)
+        self.wait_until(lambda: buzzer.playing == Melody.ABOUT_TO_COLLIDE)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+        buzzer.disable()
+        self.assertIsNone(buzzer.playing)
+
+
+class TestOLEDDisplayController(unittest.TestCase):
+    def test_render_line_uses_the_font_columns(self):
+        renderer = BitmapFontRenderer(get_default_font(), width=128)
+        with open(get_default_font(), "rb") as file:
+            font = file.read()
+
+        line = renderer.render_line("AB")
+
+        self.assertEqual(len(line), 128)
+        self.assertEqual(line[0:5], font[2 + ord("A") * 5:2 + ord("A") * 5 + 5])
+        self.assertEqual(line[6:11], font[2 + ord("B") * 5:2 + ord("B") * 5 + 5])
+        self.assertEqual(line[5], 0)
+        self.assertEqual(line[12:], bytes(116))
+        self.assertEqual(len(renderer.render_line("x" * 40)), 128)
+
+    def test_updates_are_coalesced(self):
+        display = oled_display_controller_factory("x86_64")
+        display.setup()
+        renders = display.renders
+
+        start = time.monotonic()
+        for i in range(100):
+            display.update_message(debug=str(i))
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        display.disable()
+        self.assertLess(display.renders - renders, 10)
+
+
+class TestCameraControllerReplay(unittest.TestCase):
+    def read_until_exhausted(self, camera: CameraControllerReplay, timeout: float = 2.0) -> list[Frame]:
+        frames: list[Frame] = []
+        deadline = time.monotonic() + timeout
+        while not camera.is_exhausted:
+            if time.monotonic() > deadline:
+                self.fail("The replay never ran out of frames")
+            frame = camera.get_latest_frame()
+            if frame is not None and not camera.is_exhausted and (not frames or frame is not frames[-1]):
+                frames.append(frame)
+        return frames
+
+    @staticmethod
+    def write_images(directory: str, count: int) -> None:
+        for i in range(count):
+            cv2.imwrite(os.path.join(directory, f"{i}.png"), np.full((24, 32, 3), i * 10, dtype=np.uint8))
+
+    @staticmethod
+    def write_video(path: str, count: int, fps: float) -> None:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter.fourcc(*"MJPG"), fps, (32, 24))
+        for i in range(count):
+            writer.write(np.full((24, 32, 3), i * 60, dtype=np.uint8))
+        writer.release()
+
+    def test_replays_a_directory_of_images_in_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_images(directory, 3)
+            camera = CameraControllerReplay()
+            camera.configure(directory, realtime=False)
+            camera.setup()
+
+            frames = self.read_until_exhausted(camera)
+            camera.disable()
+
+        self.assertEqual([frame.sequence - frames[0].sequence for frame in frames], [0, 1, 2])
+        self.assertEqual([int(frame.rgb[0, 0, 0]) for frame in frames], [0, 10, 20])
+
+    def test_replays_a_video_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "footage.avi")
+            self.write_video(path, 3, fps=20)
+            camera = CameraControllerReplay()
+            camera.configure(path, realtime=False)
+            camera.setup()
+
+            frames = self.read_until_exhausted(camera)
+            camera.disable()
+
+        # MJPG is lossy, the grey levels only come back approximately
+        self.assertEqual(len(frames), 3)
+        for frame, expected in zip(frames, (0, 60, 120)):
+            self.assertAlmostEqual(int(frame.rgb[0, 0, 1]), expected, delta=5)
+
+    def test_loop_starts_the_footage_again(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.write_images(directory, 2)
+            camera = CameraControllerReplay()
+            camera.configure(directory, realtime=False, loop=True)
+            camera.setup()
+
+            values = []
+            for _ in range(5):
+                frame = camera.get_latest_frame()
+                assert frame is not None
+                values.append(int(frame.rgb[0, 0, 0]))
+            exhausted = camera.is_exhausted
+            camera.disable()
+
+        self.assertEqual(values, [0, 10, 0, 10, 0])
+        self.assertFalse(exhausted)
+
+    def test_realtime_replay_follows_the_footage_frame_rate(self):
+        fps = 20
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "footage.avi")
+            self.write_video(path, 3, fps=fps)
+            camera = CameraControllerReplay()
+            camera.configure(path, realtime=True)
+            camera.setup()
+
+            start = time.monotonic()
+            self.read_until_exhausted(camera)
+            elapsed = time.monotonic() - start
+            camera.disable()
+
+        # the first frame is delivered right away and every other read waits one frame period
+        self.assertGreaterEqual(elapsed, 2 / fps)
+
+    def test_capture_is_released_after_the_threads_stop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "footage.avi")
+            self.write_video(path, 3, fps=20)
+            camera = CameraControllerReplay()
+            camera.configure(path, realtime=True, loop=True)
+            camera.setup()
+            threads_running_at_release = []
+            capture = mock.Mock(wraps=camera._cap)
+            capture.release.side_effect = lambda: threads_running_at_release.append(
+                camera._capture_thread is not None or camera._detection_worker.is_running)
+            camera._cap = capture
+            camera.disable()
+
+        self.assertEqual(threads_running_at_release, [False])
+
+    def test_every_frame_is_detected_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(2):
+                cv2.imwrite(os.path.join(directory, f"{i}.png"), np.full((24, 32, 3), i * 10, dtype=np.uint8))
+            camera = CameraControllerReplay()
+            camera.configure(directory, realtime=False)
+            camera.setup()
+            hits, misses = camera.detection_cache.hits, camera.detection_cache.misses
+
+            with mock.patch.object(camera, "_detect", side_effect=lambda frame: _detect_pixel_value(frame, "fake")) \
+                    as detect:
+                frame = camera.get_latest_frame()
+                assert frame is not None
+                first = camera.get_latest_detections()
+                second = camera.get_detections_for(frame)
+                camera.get_latest_frame()
+                third = camera.get_latest_detections()
+            camera.disable()
+
+        self.assertEqual(detect.call_count, 2)
+        self.assertIs(first, second)
+        assert third is not None
+        self.assertEqual(third.sequence, frame.sequence + 1)
+        self.assertEqual(camera.detection_cache.hits - hits, 1)
+        self.assertEqual(camera.detection_cache.misses - misses, 2)
+
+
+class TestFramePreview(PollingTestCase):
+    def setUp(self):
+        patches = [mock.patch.object(cv2, name) for name in ("imshow", "waitKey", "destroyAllWindows")]
+        self.imshow, self.wait_key, self.destroy_all_windows = [patch.start() for patch in patches]
+        self.wait_key.return_value = -1
+        for patch in patches:
+            self.addCleanup(patch.stop)
+
+    def test_each_frame_is_drawn_once(self):
+        frame = Frame(np.zeros((4, 6, 3), dtype=np.uint8), sequence=0)
+        preview = FramePreview(lambda: frame, max_fps=100)
+        preview.start()
+        self.wait_until(lambda: self.imshow.call_count > 0)
+        time.sleep(0.05)
+        preview.stop()
+
+        self.assertEqual(self.imshow.call_count, 1)
+        self.destroy_all_windows.assert_called_once()
+
+    def test_drawing_is_rate_limited(self):
+        sequences = iter(range(1000))
+        preview = FramePreview(lambda: Frame(np.zeros((4, 6, 3), dtype=np.uint8), sequence=next(sequences)),
+                               max_fps=20)
+        start = time.monotonic()
+        preview.start()
+        time.sleep(0.2)
+        preview.stop()
+        elapsed = time.monotonic() - start
+
+        self.assertGreaterEqual(self.imshow.call_count, 1)
+        self.assertLessEqual(self.imshow.call_count, elapsed * 20 + 1)
+
+    def test_preview_failure_does_not_reach_the_caller(self):
+        self.imshow.side_effect = cv2.error("no display")
+        preview = FramePreview(lambda: Frame(np.zeros((4, 6, 3), dtype=np.uint8), sequence=0), max_fps=100)
+        preview.start()
+        self.wait_until(lambda: self.destroy_all_windows.call_count > 0)
+        preview.stop()
+
+        self.imshow.assert_called_once()
+
+    def test_headless_camera_never_starts_the_preview(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cv2.imwrite(os.path.join(directory, "0.png"), np.zeros((24, 32, 3), dtype=np.uint8))
+            camera = CameraControllerReplay()
+            camera.configure(directory, realtime=False)
+            try:
+                for headless in (True, False):
+                    with self.subTest(headless=headless), \
+                            mock.patch.object(camera._preview, "start") as start_preview:
+                        camera.set_headless(headless)
+                        camera.setup()
+                        camera.disable()
+                        self.assertEqual(start_preview.called, not headless)
+            finally:
+                camera.set_headless(True)
+
+
+class WorkerDetectionCamera(CameraControllerReplay):
+    """
+    Replay camera with a fake detector, it records the thread every detection runs on
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.detections: list[tuple[int, str]] = []
+
+    def _load_detector(self) -> None:
+        pass
+
+    def _detect(self, frame: Frame) -> Optional[list[Detection]]:
+        self.detections.append((frame.sequence, threading.current_thread().name))
+        return _detect_pixel_value(frame, "fake")
+
+
+class TestDetectionsWithWorker(PollingTestCase):
+    def test_consumers_share_the_detection_of_the_worker(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for i in range(3):
+                cv2.imwrite(os.path.join(directory, f"{i}.png"), np.full((24, 32, 3), i * 10, dtype=np.uint8))
+            camera = WorkerDetectionCamera()
+            camera.configure(directory, realtime=True, loop=True)
+            camera.setup()
+            try:
+                self.wait_until(lambda: camera.get_latest_frame() is not None)
+                frame = camera.get_latest_frame()
+                assert frame is not None
+                hits = camera.detection_cache.hits
+
+                first = camera.get_detections_for(frame)
+                second = camera.get_detections_for(frame)
+            finally:
+                camera.disable()
+
+        assert first is not None
+        self.assertEqual(first.sequence, frame.sequence)
+        self.assertIs(first, second)
+        self.assertGreaterEqual(camera.detection_cache.hits - hits, 1)
+        # the detector only ever ran on the worker and never twice on the same frame
+        self.assertEqual({name for _, name in camera.detections}, {"detection-worker"})
+        sequences = [sequence for sequence, _ in camera.detections]
+        self.assertEqual(len(sequences), len(set(sequences)))
+
+
+class FailingDetectorCamera(CameraControllerReplay):
+    pass
+
+
+class TestDetectorLoadFailure(PollingTestCase):
+    def test_failure_is_reported_once_and_stops_the_worker(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cv2.imwrite(os.path.join(directory, "0.png"), np.zeros((24, 32, 3), dtype=np.uint8))
+            camera = FailingDetectorCamera()
+            camera.configure(directory, realtime=True, loop=True)
+            with mock.patch("RLP_TMR2023.hardware_controllers.camera_controller.build_warmed_up_detector",
+                            side_effect=ImportError("no tflite_support")), \
+                    self.assertLogs("RLP_TMR2023.hardware_controllers", level="ERROR") as logs:
+                camera.setup()
+                try:
+                    self.wait_until(lambda: not camera.is_detection_available)
+                    # frames keep coming while the camera runs without a detector
+                    time.sleep(0.1)
+                    running = camera._detection_worker.is_running
+                    detections = camera.get_latest_detections()
+                finally:
+                    camera.disable()
+
+        self.assertFalse(camera.is_detection_available)
+        self.assertFalse(running)
+        self.assertIsNone(detections)
+        self.assertEqual(len(logs.records), 1, [record.getMessage() for record in logs.records])
+        self.assertIn("Could not build the object detector", logs.records[0].getMessage())
+
+
+class TestDetectionCache(unittest.TestCase):
+    @staticmethod
+    def _result(sequence: int) -> DetectionResult:
+        return DetectionResult(detections=[], frame=Frame(np.zeros((2, 2, 3), dtype=np.uint8), sequence=sequence),
+                               inference_time=0.0)
+
+    def test_least_recently_used_result_is_evicted(self):
+        cache = DetectionCache(2)
+        for sequence in range(2):
+            cache.put(self._result(sequence))
+        self.assertIsNotNone(cache.get(0))
+        cache.put(self._result(2))
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(0).sequence, 0)  # type: ignore
+        self.assertEqual(cache.get(2).sequence, 2)  # type: ignore
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+        self.assertEqual(cache.hit_rate, 0.75)
+
+
+class TestAdaptiveDetectionPolicy(unittest.TestCase):
+    @staticmethod
+    def _policy(tick_budget: float = 0.02) -> AdaptiveDetectionPolicy:
+        return AdaptiveDetectionPolicy(scales=(1.0, 0.5), max_stride=3, tick_budget=tick_budget, budget_ticks=3,
+                                       tick_window=4, inference_window=2, relax_fraction=0.5)
+
+    @staticmethod
+    def _run(policy: AdaptiveDetectionPolicy, tick_latency: float, inference_latency: float) -> None:
+        for _ in range(4):
+            policy.observe_inference(inference_latency)
+            policy.observe_tick(tick_latency)
+
+    def test_tick_overruns_lower_the_detection_rate(self):
+        policy = self._policy()
+        settings = []
+        for _ in range(3):
+            self._run(policy, tick_latency=0.03, inference_latency=0.01)
+            settings.append(policy.settings)
+
+        self.assertEqual(settings, [DetectionSettings(1.0, 2), DetectionSettings(1.0, 3), DetectionSettings(1.0, 3)])
+        self.assertEqual([(decision.setting, decision.reason) for decision in policy.decisions],
+                         [("stride", "congested")] * 2)
+
+    def test_slow_inference_only_lowers_the_resolution(self):
+        policy = self._policy()
+        # the ticks are on time, only the model is slow
+        for _ in range(4):
+            self._run(policy, tick_latency=0.015, inference_latency=0.1)
+
+        self.assertEqual(policy.settings, DetectionSettings(0.5, 1))
+        self.assertEqual([decision.setting for decision in policy.decisions], ["scale"])
+
+        self._run(policy, tick_latency=0.015, inference_latency=0.01)
+        self.assertEqual(policy.settings, DetectionSettings(1.0, 1))
+        self.assertEqual(policy.decisions[-1].reason, "relaxed")
+
+    def test_settings_are_raised_when_relaxed(self):
+        policy = self._policy()
+        self._run(policy, tick_latency=0.03, inference_latency=0.01)
+        self._run(policy, tick_latency=0.015, inference_latency=0.01)
+        self.assertEqual(policy.settings, DetectionSettings(1.0, 2))
+        self._run(policy, tick_latency=0.001, inference_latency=0.01)
+
+        self.assertEqual(policy.settings, DetectionSettings(1.0, 1))
+        self.assertEqual((policy.decisions[-1].setting, policy.decisions[-1].reason), ("stride", "relaxed"))
+
+    def test_unbounded_tick_rate_never_adapts(self):
+        policy = self._policy(tick_budget=0.0)
+        self._run(policy, tick_latency=1.0, inference_latency=1.0)
+
+        self.assertEqual(policy.settings, DetectionSettings(1.0, 1))
+        self.assertEqual(policy.decisions, [])
+
+
+class TestDetectionWorker(PollingTestCase):
+    def setUp(self):
+        self.buffer = FrameRingBuffer(3)
+        self.detected: list[int] = []
+        self.published: list[DetectionResult] = []
+        self.worker = DetectionWorker(self.buffer, self.detect, self.published.append)
+        self.worker.start()
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def detect(self, frame: Frame) -> Optional[list[Detection]]:
+        self.detected.append(frame.sequence)
+        if frame.rgb[0, 0, 0] == 255:
+            raise RuntimeError("The model failed")
+        return _detect_pixel_value(frame, "fake")
+
+    def push_and_wait(self, value: int) -> int:
+        """
+        Pushes a frame and waits until the worker has taken it, detected or not
+        """
+        sequence = self.buffer.push(np.full((24, 32, 3), value, dtype=np.uint8), timestamp=0.0)
+        self.wait_until(lambda: self.worker._last_sequence == sequence)
+        return sequence
+
+    def test_publishes_the_result_with_its_frame(self):
+        for i in range(3):
+            self.push_and_wait(i * 10)
+
+        result = self.worker.latest_result()
+        assert result is not None
+        self.assertEqual(result.sequence, 2)
+        self.assertIs(result.frame, self.buffer.latest())
+        self.assertEqual(result.detections[0].score, 20.0)
+        self.assertEqual(self.detected, [0, 1, 2])
+        self.assertEqual([published.sequence for published in self.published], [0, 1, 2])
+        self.assertIs(self.published[-1], result)
+
+    def test_stride_skips_frames_unless_requested(self):
+        self.worker.set_stride(3)
+        for i in range(7):
+            self.push_and_wait(i)
+        # one frame every 3, counting from the start of the worker
+        self.assertEqual(self.detected, [2, 5])
+
+        self.worker.request_detection()
+        requested = self.push_and_wait(7)
+
+        self.assertEqual(self.detected, [2, 5, requested])
+
+    def test_failed_detection_does_not_stop_the_worker(self):
+        self.push_and_wait(255)
+
+        self.assertTrue(self.worker.is_running)
+        self.assertIsNone(self.worker.latest_result())
+
+        sequence = self.push_and_wait(10)
+        result = self.worker.latest_result()
+        assert result is not None
+        self.assertEqual(result.sequence, sequence)
+        self.assertEqual(self.detected, [0, 1])
+
+
+class TestDetectionPool(unittest.TestCase):
+    def test_frames_are_detected_in_other_processes(self):
+        buffer = FrameRingBuffer(3)
+        # the slots start smaller than the frames, as when the camera aligns the configured resolution
+        pool = DetectionPool(buffer, 2, _build_fake_detector, _detect_pixel_value, max_frame_shape=(8, 8, 3))
+        pool.start()
+        try:
+            deadline = time.monotonic() + 30
+            while pool.ready_processes < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            for i in range(5):
+                buffer.push(np.full((24, 32, 3), i * 10, dtype=np.uint8), timestamp=float(i))
+                time.sleep(0.05)
+            result = pool.latest_result()
+            while (result is None or result.sequence < 4) and time.monotonic() < deadline:
+                time.sleep(0.01)
+                result = pool.latest_result()
+        finally:
+            pool.stop()
+
+        assert result is not None
+        self.assertEqual(result.sequence, 4)
+        self.assertIs(result.frame, buffer.latest())
+        self.assertEqual(result.detections[0].category, "fake detector")
+        self.assertEqual(result.detections[0].score, 40.0)
+        self.assertEqual((result.detections[0].frame_width, result.detections[0].frame_height), (32, 24))
+        self.assertGreaterEqual(pool.slot_reallocations, 1)
+
+    def test_results_of_unknown_frames_are_skipped(self):
+        pool = DetectionPool(FrameRingBuffer(3), 1, _build_fake_detector, _detect_pixel_value,
+                             max_frame_shape=(8, 8, 3))
+        results: queue.Queue[tuple[int, int, list[Detection], float]] = queue.Queue()
+        results.put((0, 99, [], 0.0))
+        pool._results = results  # type: ignore
+        pool._stop.set()
+
+        pool._collect()
+
+        self.assertEqual(pool.stale_results, 1)
+        self.assertIsNone(pool.latest_result())
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_hardware_libraries_are_not_imported_at_startup(self):
+        heavy_modules = ("tflite_support", "mpu9250_jmdev", "smbus", "adafruit_motor", "adafruit_ssd1306", "picamera2")
+        code = f"import sys, RLP_TMR2023.main; print([m for m in {heavy_modules!r} if m in sys.modules])"
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=environment)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+
+import numpy as np
+
+from RLP_TMR2023.common_types.common_types import BoundingBox
+from RLP_TMR2023.constants.color_filters import COLOR_RANGES, FILTER_KERNEL_SIZE
+from RLP_TMR2023.image_processing.area_of_can import get_area_of_can_in_box
+from RLP_TMR2023.image_processing.blue_filter import blue_filter
+from RLP_TMR2023.image_processing.can_tracker import TemplateTracker
+from RLP_TMR2023.image_processing.color_segmentation import ColorSegmenter
+from RLP_TMR2023.image_processing.frame import Frame
+from RLP_TMR2023.image_processing.image_cropped import check_water_percentage, trimmer_image, water_coverage, \
+    _water_segmenter
+from RLP_TMR2023.image_processing.image_filtering import hsv_filter
+from RLP_TMR2023.image_processing.red_filter import red_filter
+
+
+def _frame_with_dark_square() -> np.ndarray:
+    # white background with a dark 20x10 "can" starting at x=30, y=10
+    rgb_image = np.full((60, 80, 3), 230, dtype=np.uint8)
+    rgb_image[10:20, 30:50] = 20
+    return rgb_image
+
+
+class TestAreaOfCan(unittest.TestCase):
+    def test_area_only_counts_pixels_inside_the_box(self):
+        frame = Frame(_frame_with_dark_square())
+        area = get_area_of_can_in_box(frame.blurred, BoundingBox(x=25, y=5, width=30, height=20))
+
+        self.assertGreater(area, 100)
+        self.assertLess(area, 30 * 20)
+
+    def test_box_outside_the_frame_has_no_area(self):
+        frame = Frame(_frame_with_dark_square())
+        area = get_area_of_can_in_box(frame.blurred, BoundingBox(x=100, y=100, width=10, height=10))
+
+        self.assertEqual(area, 0)
+
+    def test_frame_planes_are_computed_once(self):
+        frame = Frame(_frame_with_dark_square())
+
+        self.assertIs(frame.blurred, frame.blurred)
+        self.assertIs(frame.grey, frame.grey)
+        self.assertIs(frame.hsv, frame.hsv)
+        self.assertIs(frame.bgr, frame.bgr)
+        self.assertEqual(frame.grey.shape, (60, 80))
+        self.assertEqual((frame.width, frame.height), (80, 60))
+
+    def test_crop_is_a_clipped_view(self):
+        frame = Frame(_frame_with_dark_square())
+        crop = frame.crop(BoundingBox(x=30, y=10, width=20, height=10))
+
+        self.assertEqual(crop.shape, (10, 20, 3))
+        self.assertTrue(np.shares_memory(crop, frame.rgb))
+        self.assertTrue(np.all(crop == 20))
+        self.assertEqual(frame.crop(BoundingBox(x=70, y=50, width=30, height=30), frame.grey).shape, (10, 10))
+
+
+class TestColorSegmentation(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.bgr_image = rng.integers(0, 256, size=(48, 64, 3), dtype=np.uint8)
+        self.bgr_image[10:30, 10:40] = (200, 40, 10)  # blue block
+
+    def test_masks_match_hsv_filter(self):
+        masks = ColorSegmenter().segment(self.bgr_image)
+
+        for name, (lower, upper) in COLOR_RANGES.items():
+            expected = hsv_filter(self.bgr_image, np.array(lower), np.array(upper), FILTER_KERNEL_SIZE)
+            np.testing.assert_array_equal(masks[name], expected)
+
+    def test_single_colour_filters_reuse_their_buffers(self):
+        blue = blue_filter(self.bgr_image)
+        np.testing.assert_array_equal(blue, ColorSegmenter().segment(self.bgr_image)["blue"])
+        self.assertGreater(np.count_nonzero(blue), 0)
+
+        self.assertIs(blue_filter(np.zeros_like(self.bgr_image)), blue)
+        self.assertEqual(np.count_nonzero(blue), 0)
+        self.assertIsNot(red_filter(self.bgr_image), blue)
+
+    def test_trimmed_image_is_kept_after_the_next_filter(self):
+        trimmed = trimmer_image(self.bgr_image, 50)
+        expected = trimmed.copy()
+        blue_filter(np.zeros_like(self.bgr_image))
+
+        np.testing.assert_array_equal(trimmed, expected)
+        self.assertEqual(trimmed.shape, (24, 64))
+
+
+class TestWaterCoverage(unittest.TestCase):
+    def setUp(self):
+        # sand on the top half and water on the bottom half
+        self.bgr_image = np.full((120, 160, 3), (90, 160, 200), dtype=np.uint8)
+        self.bgr_image[60:] = (200, 40, 10)
+
+    def test_bands_are_measured_in_one_pass(self):
+        coverages = water_coverage(self.bgr_image, horizon_bands=(0.25, 0.5, 0.8), decimation=2)
+
+        self.assertAlmostEqual(coverages[0], 2 / 3, delta=0.05)
+        self.assertAlmostEqual(coverages[1], 1.0, delta=0.05)
+        self.assertAlmostEqual(coverages[2], 1.0, delta=0.05)
+
+    def test_decimation_does_not_change_the_estimate(self):
+        full = water_coverage(self.bgr_image, horizon_bands=(0.25,), decimation=1)[0]
+        decimated = water_coverage(self.bgr_image, horizon_bands=(0.25,), decimation=4)[0]
+
+        self.assertAlmostEqual(full, decimated, delta=0.05)
+
+    def test_full_resolution_matches_blue_filter(self):
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, size=(120, 160, 3), dtype=np.uint8)
+        image[70:] = (200, 40, 10)
+
+        coverage = water_coverage(image, horizon_bands=(0.5,), decimation=1)[0]
+
+        self.assertAlmostEqual(coverage, np.count_nonzero(blue_filter(image)[60:]) / (60 * 160))
+
+    def test_segmenter_is_reused(self):
+        water_coverage(self.bgr_image, horizon_bands=(0.25,), decimation=2)
+        misses = _water_segmenter.cache_info().misses
+        water_coverage(self.bgr_image, horizon_bands=(0.5,), decimation=2)
+
+        self.assertEqual(_water_segmenter.cache_info().misses, misses)
+
+    def test_check_water_percentage_uses_the_image_size(self):
+        small_image = self.bgr_image[::2, ::2]
+
+        self.assertAlmostEqual(check_water_percentage(small_image), check_water_percentage(self.bgr_image), delta=1)
+
+
+def _frame_with_textured_can(x: int, y: int) -> np.ndarray:
+    rgb_image = np.full((120, 160, 3), 200, dtype=np.uint8)
+    can = np.random.default_rng(0).integers(0, 120, (20, 12, 3), dtype=np.uint8)
+    rgb_image[y:y + 20, x:x + 12] = can
+    return rgb_image
+
+
+class TestTemplateTracker(unittest.TestCase):
+    def test_follows_the_can_between_frames(self):
+        tracker = TemplateTracker(search_margin=0.5, min_score=0.6)
+        self.assertTrue(tracker.start(_frame_with_textured_can(50, 40), BoundingBox(x=50, y=40, width=12, height=20)))
+
+        bounding_box = tracker.update(_frame_with_textured_can(54, 37))
+
+        self.assertEqual(bounding_box, BoundingBox(x=54, y=37, width=12, height=20))
+        self.assertGreater(tracker.score, 0.9)
+
+    def test_stops_tracking_when_the_can_is_gone(self):
+        tracker = TemplateTracker(search_margin=0.5, min_score=0.6)
+        tracker.start(_frame_with_textured_can(50, 40), BoundingBox(x=50, y=40, width=12, height=20))
+
+        self.assertIsNone(tracker.update(np.full((120, 160, 3), 200, dtype=np.uint8)))
+        self.assertFalse(tracker.is_tracking)
+
+
+if __name__ == '__main__':
+    unittest.main()